@@ -0,0 +1,239 @@
+"""Candle read path over the Parquet lake via DuckDB.
+
+Candles are stored hive-partitioned as
+``<root>/dt=YYYY-MM-DD/asset_id=<id>/*.parquet`` with the :class:`Candle`
+columns. A query:
+
+* globs only the ``asset_id`` partition of the requested asset;
+* filters on ``dt``, which DuckDB uses to skip whole partition files;
+* filters on ``t`` and ``resolution``, which DuckDB pushes down to Parquet
+  row-group statistics;
+* returns an Arrow table converted to :class:`CandleColumns` column by
+  column, with no Python loop over rows, or streams it batch by batch
+  (:meth:`CandleStore.stream`).
+
+One DuckDB connection is kept open for the store's lifetime so file metadata
+and the Parquet footer cache survive between requests; each query runs on its
+own cursor in a worker thread. The partition listing of each asset and its
+:meth:`~CandleStore.version` stamp are cached too: :meth:`~CandleStore.write`
+refreshes them at once, and writes by other processes show up within
+``listing_ttl`` seconds.
+
+``duckdb`` and ``pyarrow`` are optional: install the ``analytics`` extra.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict
+
+import numpy as np
+
+from app.candles import CandleColumns
+
+INTERVAL_SECONDS: Dict[str, int] = {"5m": 300, "1h": 3600, "1d": 86400}
+# Window served when a request gives no ``start``.
+DEFAULT_LOOKBACK: Dict[str, int] = {"5m": 86400, "1h": 30 * 86400, "1d": 365 * 86400}
+# Security: asset ids become part of a glob pattern; keep them literal.
+ASSET_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+QUERY = """
+SELECT t, o, h, l, c, v, resolution, "asof", source
+FROM read_parquet(?, hive_partitioning = true)
+WHERE dt BETWEEN ? AND ?
+  AND t >= ? AND t < ?
+  AND resolution = ?
+ORDER BY t
+"""
+STREAM_BATCH_SIZE = 8192
+DEFAULT_LISTING_TTL = 1.0
+
+
+def _sql(limit: int | None) -> str:
+    return QUERY if limit is None else f"{QUERY}LIMIT {int(limit)}\n"
+
+
+def _day(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _next_batch(reader: Any) -> Any:
+    # StopIteration cannot cross the thread/future boundary; map it to None.
+    try:
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
+
+
+@dataclass(frozen=True)
+class _Listing:
+    """Partition directories of one asset as of ``checked_at``."""
+
+    checked_at: float
+    count: int
+    version: str
+
+
+class CandleStore:
+    """Query candles from a partitioned Parquet directory.
+
+    Parameters
+    ----------
+    root:
+        Directory holding the ``dt=``/``asset_id=`` partitions.
+    threads:
+        DuckDB worker threads per query.
+    listing_ttl:
+        Seconds a cached partition listing is trusted before the directory
+        is globbed again.
+    time_func:
+        Monotonic clock for the listing cache; defaults to
+        :func:`time.monotonic`.
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        *,
+        threads: int = 2,
+        listing_ttl: float = DEFAULT_LISTING_TTL,
+        time_func: Callable[[], float] | None = None,
+    ) -> None:
+        import duckdb
+
+        self.root = Path(root)
+        self.listing_ttl = listing_ttl
+        self.time = time_func or time.monotonic
+        self._listings: Dict[str, _Listing] = {}
+        self._conn = duckdb.connect(config={"threads": threads})
+        self._conn.execute("SET enable_object_cache = true")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _params(self, asset_id: str, interval: str, start: int, end: int) -> list | None:
+        """Bind parameters for :data:`QUERY`, or ``None`` if the asset has no data."""
+
+        if not ASSET_ID_RE.match(asset_id):
+            raise ValueError(f"invalid asset id {asset_id!r}")
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"invalid interval {interval!r}")
+        if not self._listing(asset_id).count:
+            return None
+        pattern = str(self.root / "dt=*" / f"asset_id={asset_id}" / "*.parquet")
+        # The last candle of ``end``'s day may open before ``end``.
+        return [pattern, _day(start), _day(max(start, end - 1)), start, end, interval]
+
+    def query(
+        self, asset_id: str, interval: str, start: int, end: int, limit: int | None = None
+    ) -> CandleColumns:
+        """Return ``interval`` candles of ``asset_id`` with ``start <= t < end``.
+
+        At most ``limit`` candles are returned when given.
+
+        Raises
+        ------
+        ValueError
+            If ``asset_id`` or ``interval`` is invalid.
+        """
+
+        params = self._params(asset_id, interval, start, end)
+        if params is None:
+            return CandleColumns.empty()
+        cursor = self._conn.cursor()
+        try:
+            table = cursor.execute(_sql(limit), params).to_arrow_table()
+        finally:
+            cursor.close()
+        return CandleColumns.from_arrow(table)
+
+    async def query_async(
+        self, asset_id: str, interval: str, start: int, end: int, limit: int | None = None
+    ) -> CandleColumns:
+        """Run :meth:`query` in a worker thread."""
+
+        return await asyncio.to_thread(self.query, asset_id, interval, start, end, limit)
+
+    async def stream(
+        self,
+        asset_id: str,
+        interval: str,
+        start: int,
+        end: int,
+        limit: int | None = None,
+        *,
+        batch_size: int = STREAM_BATCH_SIZE,
+    ) -> AsyncIterator[CandleColumns]:
+        """Yield the rows of :meth:`query` in batches of up to ``batch_size``.
+
+        Batches are pulled from the DuckDB result one at a time in a worker
+        thread, so memory stays bounded by ``batch_size`` whatever the range.
+        """
+
+        params = self._params(asset_id, interval, start, end)
+        if params is None:
+            return
+        cursor = self._conn.cursor()
+        try:
+            result = await asyncio.to_thread(cursor.execute, _sql(limit), params)
+            reader = result.to_arrow_reader(batch_size)
+            while (batch := await asyncio.to_thread(_next_batch, reader)) is not None:
+                yield CandleColumns.from_arrow(batch)
+        finally:
+            cursor.close()
+
+    def version(self, asset_id: str) -> str:
+        """Cheap stamp of ``asset_id``'s partitions, changing whenever one is written.
+
+        Built from the partition directories' count and latest mtime, so no
+        Parquet file is opened, and cached for ``listing_ttl`` seconds.
+        """
+
+        if not ASSET_ID_RE.match(asset_id):
+            raise ValueError(f"invalid asset id {asset_id!r}")
+        return self._listing(asset_id).version
+
+    def _listing(self, asset_id: str) -> _Listing:
+        """Return the cached partition listing of ``asset_id``, re-globbing when old."""
+
+        now = self.time()
+        listing = self._listings.get(asset_id)
+        if listing is None or now - listing.checked_at >= self.listing_ttl:
+            stamps = [
+                path.stat().st_mtime_ns for path in self.root.glob(f"dt=*/asset_id={asset_id}")
+            ]
+            listing = _Listing(now, len(stamps), f"{len(stamps)}.{max(stamps, default=0)}")
+            self._listings[asset_id] = listing
+        return listing
+
+    def write(self, columns: CandleColumns, asset_id: str) -> None:
+        """Append ``columns`` to the partitions of ``asset_id`` (worker/tests)."""
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not ASSET_ID_RE.match(asset_id):
+            raise ValueError(f"invalid asset id {asset_id!r}")
+        days = columns.t.astype("datetime64[s]").astype("datetime64[D]").astype(str)
+        table = columns.to_arrow().append_column("dt", pa.array(days))
+        table = table.append_column("asset_id", pa.array(np.full(len(columns), asset_id)))
+        pq.write_to_dataset(
+            table,
+            root_path=self.root,
+            partition_cols=["dt", "asset_id"],
+            # A fresh basename per call: "overwrite_or_ignore" would otherwise
+            # replace the file an earlier write left in the same partition.
+            basename_template=f"{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_partitions=max(len(columns), 1),
+        )
+        self._listings.pop(asset_id, None)  # relisted on the next read
+
+
+__all__ = ["CandleStore", "DEFAULT_LOOKBACK", "INTERVAL_SECONDS"]
@@ -0,0 +1,240 @@
+"""Candle model and columnar candle decoding.
+
+Provider payloads are decoded straight into one array per field
+(``t``/``o``/``h``/``l``/``c``/``v``) and validated once per column instead
+of once per row. :class:`Candle` models are only built when the API needs
+them; the worker and Parquet writer can use :meth:`CandleColumns.to_arrow`
+or the arrays directly.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from pydantic import BaseModel
+
+PRICE_FIELDS = ("o", "h", "l", "c", "v")
+
+
+class Candle(BaseModel):
+    t: int
+    o: float
+    h: float
+    l: float  # noqa: E741
+    c: float
+    v: float
+    resolution: str
+    asof: float
+    source: str
+
+
+@dataclass(frozen=True)
+class CandleColumns:
+    """Columnar OHLCV candles.
+
+    Parameters
+    ----------
+    t:
+        ``int64`` open times.
+    o, h, l, c, v:
+        ``float64`` open/high/low/close/volume.
+    asof:
+        ``float64`` retrieval timestamps.
+    resolution, source:
+        Per-row labels.
+    arrow:
+        Arrow table the columns were read from, if any; returned as-is by
+        :meth:`to_arrow` so query results pass through without a copy.
+    """
+
+    t: np.ndarray
+    o: np.ndarray
+    h: np.ndarray
+    l: np.ndarray  # noqa: E741
+    c: np.ndarray
+    v: np.ndarray
+    asof: np.ndarray
+    resolution: List[str]
+    source: List[str]
+    arrow: Any = field(default=None, compare=False, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    @classmethod
+    def empty(cls) -> "CandleColumns":
+        prices = {name: np.empty(0, dtype=np.float64) for name in PRICE_FIELDS}
+        return cls(
+            t=np.empty(0, dtype=np.int64),
+            asof=np.empty(0, dtype=np.float64),
+            resolution=[],
+            source=[],
+            **prices,
+        )
+
+    @classmethod
+    def from_arrow(cls, table: Any) -> "CandleColumns":
+        """Build from a :class:`pyarrow.Table` with the :class:`Candle` columns."""
+
+        def numbers(name: str, dtype: type) -> np.ndarray:
+            return table.column(name).to_numpy().astype(dtype, copy=False)
+
+        return cls(
+            t=numbers("t", np.int64),
+            asof=numbers("asof", np.float64),
+            resolution=table.column("resolution").to_pylist(),
+            source=table.column("source").to_pylist(),
+            arrow=table,
+            **{name: numbers(name, np.float64) for name in PRICE_FIELDS},
+        )
+
+    def head(self, count: int) -> "CandleColumns":
+        """Return the first ``count`` candles without copying the arrays."""
+
+        return CandleColumns(
+            t=self.t[:count],
+            asof=self.asof[:count],
+            resolution=self.resolution[:count],
+            source=self.source[:count],
+            arrow=None if self.arrow is None else self.arrow.slice(0, count),
+            **{name: getattr(self, name)[:count] for name in PRICE_FIELDS},
+        )
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Return row-oriented dicts, the inverse of :func:`decode_candles`."""
+
+        rows = zip(
+            self.t.tolist(),
+            self.o.tolist(),
+            self.h.tolist(),
+            self.l.tolist(),
+            self.c.tolist(),
+            self.v.tolist(),
+            self.resolution,
+            self.asof.tolist(),
+            self.source,
+        )
+        return [
+            {
+                "t": t,
+                "o": o,
+                "h": h,
+                "l": low,
+                "c": c,
+                "v": v,
+                "resolution": res,
+                "asof": asof,
+                "source": src,
+            }
+            for t, o, h, low, c, v, res, asof, src in rows
+        ]
+
+    def to_models(self) -> List[Candle]:
+        """Build :class:`Candle` models without validating each row again."""
+
+        return [Candle.model_construct(**row) for row in self.to_rows()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the columns keyed by field name."""
+
+        return {
+            "t": self.t,
+            "o": self.o,
+            "h": self.h,
+            "l": self.l,
+            "c": self.c,
+            "v": self.v,
+            "resolution": self.resolution,
+            "asof": self.asof,
+            "source": self.source,
+        }
+
+    def to_arrow(self):
+        """Return a :class:`pyarrow.Table` (requires the optional ``pyarrow``)."""
+
+        if self.arrow is not None:
+            return self.arrow
+        import pyarrow as pa
+
+        return pa.table(self.to_dict())
+
+    def to_arrow_ipc(self) -> bytes:
+        """Serialize :meth:`to_arrow` in the Arrow IPC streaming format."""
+
+        import pyarrow as pa
+
+        table = self.to_arrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def to_columns(self) -> Dict[str, Any]:
+        """Return a compact JSON-ready document with one array per field.
+
+        ``resolution``, ``source`` and ``asof`` are hoisted to a single value
+        when every row shares it and sent as arrays otherwise.
+        """
+
+        shared: Dict[str, Any] = {}
+        columns: Dict[str, Any] = {"t": self.t.tolist()}
+        columns.update((name, getattr(self, name).tolist()) for name in PRICE_FIELDS)
+        labels = {
+            "resolution": self.resolution,
+            "source": self.source,
+            "asof": self.asof.tolist(),
+        }
+        for name, values in labels.items():
+            if len(set(values)) == 1:
+                shared[name] = values[0]
+            else:
+                columns[name] = values
+        return {**shared, "count": len(self), "columns": columns}
+
+
+def _column(rows: Sequence[dict], name: str) -> np.ndarray:
+    """Collect ``name`` from every row as ``float64``, checking the dtype once."""
+
+    values = np.asarray([row[name] for row in rows])
+    if values.dtype.kind not in "iuf":
+        raise ValueError(f"candle field {name!r} must be numeric")
+    return values.astype(np.float64, copy=False)
+
+
+def decode_candles(rows: Sequence[dict], *, source: str) -> CandleColumns:
+    """Decode row-oriented candle JSON into :class:`CandleColumns`.
+
+    Rows without a ``source`` get ``source``. Each column is validated once
+    on its array dtype: numeric fields must be numbers and ``t`` must be
+    integral.
+
+    Raises
+    ------
+    ValueError
+        If a field is missing or has the wrong type.
+    """
+
+    try:
+        times = _column(rows, "t")
+        columns = {name: _column(rows, name) for name in PRICE_FIELDS}
+        asof = _column(rows, "asof")
+        resolution = [row["resolution"] for row in rows]
+        labels = [row.get("source", source) for row in rows]
+    except (KeyError, TypeError, AttributeError) as exc:
+        raise ValueError(f"invalid candle payload: {exc!r}") from exc
+    if not np.array_equal(times, np.floor(times)):
+        raise ValueError("candle field 't' must be an integer")
+    if not all(isinstance(value, str) for value in (*resolution, *labels)):
+        raise ValueError("candle fields 'resolution' and 'source' must be strings")
+    return CandleColumns(
+        t=times.astype(np.int64),
+        asof=asof,
+        resolution=resolution,
+        source=labels,
+        **columns,
+    )
+
+
+__all__ = ["Candle", "CandleColumns", "decode_candles"]
@@ -0,0 +1,224 @@
+"""Negotiated response compression (zstd, brotli, gzip).
+
+:class:`CompressionMiddleware` picks the best ``Accept-Encoding`` the client
+offers, preferring zstd, then brotli, then gzip on ties. Bodies below
+``minimum_size`` are sent as-is. Streamed responses (NDJSON) are compressed
+chunk by chunk with a flush after each chunk, so clients still render them
+progressively. Server-sent events and responses that already carry a
+``Content-Encoding`` are never touched.
+
+A compressed response gets its ``ETag`` suffixed with the encoding
+(``"abc"`` becomes ``"abc-gzip"``) because a strong validator must identify
+exact bytes; :func:`app.conditional.etag_matches` strips the suffix again.
+A ``304`` carries the suffixed tag whenever the client revalidated the
+encoded representation, so caches keep the validator they stored. Every
+response that could be compressed carries ``Vary: Accept-Encoding``, whether
+or not this one was, so shared caches never hand one encoding to a client
+asking for another.
+
+brotli and zstd need the optional ``compression`` extra; gzip is always
+available.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import Callable, Dict, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # optional: pip install .[compression]
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+MINIMUM_SIZE = 1024
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+class _Gzip:
+    def __init__(self) -> None:
+        self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        self._obj = brotli.Compressor(quality=5)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        out = self._obj.process(data)
+        return out + (self._obj.finish() if final else self._obj.flush())
+
+
+class _Zstd:
+    def __init__(self) -> None:
+        self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._obj.compress(data) + self._obj.flush(mode)
+
+
+# Server preference order, best first.
+CODECS: Dict[str, Callable[[], object]] = {
+    name: codec
+    for name, codec, module in (
+        ("zstd", _Zstd, zstandard),
+        ("br", _Brotli, brotli),
+        ("gzip", _Gzip, zlib),
+    )
+    if module is not None
+}
+ENCODINGS = tuple(CODECS)
+
+
+def choose_encoding(accept_encoding: str, encodings: Sequence[str] = ENCODINGS) -> Optional[str]:
+    """Return the best of ``encodings`` allowed by ``accept_encoding``, if any."""
+
+    weights: Dict[str, float] = {}
+    for entry in accept_encoding.split(","):
+        name, _, params = entry.strip().partition(";")
+        q = 1.0
+        key, _, value = params.strip().partition("=")
+        if key.strip() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Suffix a strong ``etag`` with ``encoding``; weak tags stay as they are."""
+
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses per ``Accept-Encoding``.
+
+    Parameters
+    ----------
+    app:
+        Wrapped application.
+    minimum_size:
+        Complete bodies smaller than this many bytes are not compressed.
+    encodings:
+        Allowed encodings in preference order; defaults to every available one.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = MINIMUM_SIZE,
+        encodings: Sequence[str] = ENCODINGS,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = tuple(name for name in encodings if name in CODECS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), self.encodings)
+        responder = _Responder(
+            self.app, encoding, self.minimum_size, request_headers.get("if-none-match", "")
+        )
+        await responder(scope, receive, send)
+
+
+def _validates(if_none_match: str, etag: str) -> bool:
+    """Return ``True`` if ``etag`` is one of the tags in ``if_none_match``."""
+
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(",")
+    )
+
+
+class _Responder:
+    def __init__(
+        self, app: ASGIApp, encoding: Optional[str], minimum_size: int, if_none_match: str
+    ) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.if_none_match = if_none_match
+        self.send: Send
+        self.start: Optional[Message] = None
+        self.codec = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            compressible = "content-encoding" not in headers and not headers.get(
+                "content-type", ""
+            ).startswith(UNCOMPRESSED_TYPES)
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if message["status"] == 304 and self.encoding is not None and "etag" in headers:
+                encoded = encoded_etag(headers["etag"], self.encoding)
+                if _validates(self.if_none_match, encoded):
+                    headers["ETag"] = encoded
+            self.passthrough = (
+                not compressible or self.encoding is None or message["status"] in (204, 304)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start = message  # held until the first body chunk
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.codec = CODECS[self.encoding]()
+            headers["Content-Encoding"] = self.encoding
+            if "etag" in headers:
+                headers["ETag"] = encoded_etag(headers["etag"], self.encoding)
+            body = self.codec.encode(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self.send(start)
+        else:
+            body = self.codec.encode(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+__all__ = ["CompressionMiddleware", "ENCODINGS", "choose_encoding", "encoded_etag"]
@@ -0,0 +1,63 @@
+"""Strong ETags and ``If-None-Match`` handling for read endpoints.
+
+Endpoints derive an ETag from a cheap data version (a Parquet partition
+stamp, an ``asof`` watermark, ...) plus everything that shapes the
+response, and call :func:`check_not_modified` from a dependency declared
+before the expensive ones. A matching ``If-None-Match`` then ends the
+request with ``304 Not Modified`` before any query or provider call runs.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Any
+
+from fastapi import HTTPException
+
+_ENCODING_SUFFIX = re.compile(r'-(?:zstd|br|gzip)"$')
+
+
+def make_etag(*parts: Any) -> str:
+    """Return a strong ETag hashing ``parts``."""
+
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Apply the weak comparison RFC 9110 prescribes for ``If-None-Match``.
+
+    Tags carrying the encoding suffix added by
+    :class:`app.compression.CompressionMiddleware` match their plain tag.
+    """
+
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if _ENCODING_SUFFIX.sub('"', candidate) == etag:
+            return True
+    return False
+
+
+def check_not_modified(if_none_match: str | None, etag: str) -> str:
+    """Return ``etag``, raising ``304 Not Modified`` if the client has it.
+
+    The 304 carries the plain tag; :class:`app.compression.CompressionMiddleware`
+    swaps in the encoded tag when that is the one the client revalidated.
+
+    Raises
+    ------
+    HTTPException
+        With status 304 when ``if_none_match`` matches ``etag``.
+    """
+
+    if etag_matches(if_none_match, etag):
+        raise HTTPException(status_code=304, headers={"ETag": etag})
+    return etag
+
+
+__all__ = ["check_not_modified", "etag_matches", "make_etag"]
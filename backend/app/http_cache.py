@@ -0,0 +1,292 @@
+"""Conditional-request cache for provider HTTP calls.
+
+:class:`ConditionalCacheTransport` wraps the transport of a pooled provider
+client. ``GET`` responses carrying an ``ETag`` or ``Last-Modified`` validator
+are stored with their body in Redis or on disk; the next request for the same
+URL sends ``If-None-Match``/``If-Modified-Since`` and a ``304 Not Modified``
+is answered from the stored body. Whether a 304 still counts against the
+provider token bucket is configurable: by default it does, since most
+providers count every request; with ``count_not_modified=False`` the token is
+refunded. Only requests whose caller debited a token for them (marked with the
+:data:`TOKEN_EXTENSION` request extension) are refunded, so a 304 never
+creates budget that was not spent.
+
+Code that acquires a token and then calls a provider records it with
+:func:`mark_token_spent`; :func:`attach_spent_token`, installed as a request
+hook on every provider client, copies it onto the outgoing requests. Tasks
+started afterwards inherit the mark with the rest of their context. One token
+is refunded at most once, however many requests it paid for.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Protocol, Tuple
+
+import httpx
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError
+
+from app.rate_limiting import refund_async
+
+DEFAULT_TTL = 7 * 24 * 3600
+# Request extension marking a request paid for by a provider token: a
+# :class:`SpentToken`, or ``True`` for a caller managing the token itself.
+TOKEN_EXTENSION = "rate_limit_token"
+
+
+@dataclass
+class SpentToken:
+    """One token debited from ``provider``'s bucket, refundable at most once."""
+
+    provider: str
+    refunded: bool = field(default=False, compare=False)
+
+    def claim(self, provider: str) -> bool:
+        """Return ``True`` the first time a 304 from ``provider`` may refund it."""
+
+        if self.refunded or self.provider != provider:
+            return False
+        self.refunded = True
+        return True
+
+
+_spent_token: ContextVar[Optional[SpentToken]] = ContextVar("spent_token", default=None)
+
+
+def mark_token_spent(provider: str) -> SpentToken:
+    """Attribute upstream requests made from the current context to one token.
+
+    Call right after a successful acquire for ``provider``; the mark holds
+    until the context ends or the next call replaces it.
+    """
+
+    token = SpentToken(provider)
+    _spent_token.set(token)
+    return token
+
+
+async def attach_spent_token(request: httpx.Request) -> None:
+    """httpx request hook tagging ``request`` with the current context's token."""
+
+    token = _spent_token.get()
+    if token is not None:
+        request.extensions.setdefault(TOKEN_EXTENSION, token)
+
+
+def _claim(token: object, provider: str) -> bool:
+    if isinstance(token, SpentToken):
+        return token.claim(provider)
+    return bool(token)
+
+
+# Headers replayed from the cache; encodings and lengths describe the original
+# wire format, not the decoded body that is stored.
+STORED_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """Stored body and validators of one ``GET`` response."""
+
+    status_code: int
+    headers: List[Tuple[str, str]]
+    content: bytes
+
+    def header(self, name: str) -> Optional[str]:
+        for key, value in self.headers:
+            if key == name:
+                return value
+        return None
+
+    def to_bytes(self) -> bytes:
+        meta = json.dumps({"status": self.status_code, "headers": self.headers})
+        return meta.encode() + b"\n" + self.content
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "CachedResponse":
+        meta, _, content = raw.partition(b"\n")
+        data = json.loads(meta)
+        headers = [(key, value) for key, value in data["headers"]]
+        return cls(data["status"], headers, content)
+
+
+class ResponseStore(Protocol):
+    """Storage backend for :class:`CachedResponse` entries."""
+
+    async def get(self, key: str) -> Optional[CachedResponse]: ...
+
+    async def set(self, key: str, entry: CachedResponse) -> None: ...
+
+
+class RedisResponseStore:
+    """Keep cached responses in Redis with a TTL.
+
+    Parameters
+    ----------
+    client:
+        Asyncio Redis connection.
+    prefix:
+        Key prefix for entries.
+    ttl:
+        Seconds an entry is kept without being refreshed.
+    """
+
+    def __init__(self, client: AsyncRedis, *, prefix: str = "httpcache:", ttl: int = DEFAULT_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        raw = await self.client.get(self.prefix + key)
+        return CachedResponse.from_bytes(raw) if raw else None
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        await self.client.set(self.prefix + key, entry.to_bytes(), ex=self.ttl)
+
+
+class DiskResponseStore:
+    """Keep cached responses as files in ``directory``."""
+
+    def __init__(self, directory: str | os.PathLike) -> None:
+        self.directory = Path(directory)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return await asyncio.to_thread(self._read, self.directory / key)
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        await asyncio.to_thread(self._write, self.directory / key, entry.to_bytes())
+
+    @staticmethod
+    def _read(path: Path) -> Optional[CachedResponse]:
+        try:
+            return CachedResponse.from_bytes(path.read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: Path, raw: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(raw)
+        os.replace(tmp, path)  # readers never see a partial entry
+
+
+def cache_key(url: httpx.URL) -> str:
+    """Return the store key for ``url``."""
+
+    # Security: URLs may carry API keys; only their digest is stored.
+    return hashlib.sha256(str(url).encode()).hexdigest()
+
+
+class ConditionalCacheTransport(httpx.AsyncBaseTransport):
+    """Transport revalidating cached ``GET`` responses with their validators.
+
+    Parameters
+    ----------
+    transport:
+        Transport performing the actual requests.
+    store:
+        Where bodies and validators are kept.
+    provider:
+        Provider whose token bucket is refunded for a 304.
+    count_not_modified:
+        If ``False``, a 304 served from cache gives back the token its
+        request was marked with (:data:`TOKEN_EXTENSION`).
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        store: ResponseStore,
+        *,
+        provider: str,
+        count_not_modified: bool = True,
+    ) -> None:
+        self.transport = transport
+        self.store = store
+        self.provider = provider
+        self.count_not_modified = count_not_modified
+        self.revalidated = 0
+        self.stored = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET":
+            return await self.transport.handle_async_request(request)
+
+        key = cache_key(request.url)
+        cached = await self._get(key)
+        if cached is not None:
+            etag = cached.header("etag")
+            modified = cached.header("last-modified")
+            if etag and "If-None-Match" not in request.headers:
+                request.headers["If-None-Match"] = etag
+            if modified and "If-Modified-Since" not in request.headers:
+                request.headers["If-Modified-Since"] = modified
+
+        response = await self.transport.handle_async_request(request)
+        if response.status_code == 304 and cached is not None:
+            await response.aclose()
+            self.revalidated += 1
+            token = request.extensions.get(TOKEN_EXTENSION)
+            if not self.count_not_modified and _claim(token, self.provider):
+                await refund_async(self.provider)
+            return httpx.Response(
+                cached.status_code,
+                headers=cached.headers,
+                content=cached.content,
+                extensions=response.extensions,
+            )
+        if self._cacheable(response):
+            await response.aread()
+            headers = [
+                (name, value)
+                for name, value in response.headers.items()
+                if name in STORED_HEADERS
+            ]
+            await self._set(key, CachedResponse(response.status_code, headers, response.content))
+        return response
+
+    @staticmethod
+    def _cacheable(response: httpx.Response) -> bool:
+        headers = response.headers
+        return (
+            response.status_code == 200
+            and ("etag" in headers or "last-modified" in headers)
+            and "no-store" not in headers.get("cache-control", "")
+        )
+
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            return await self.store.get(key)
+        except (RedisError, OSError, ValueError):
+            return None  # a broken cache entry only costs a full request
+
+    async def _set(self, key: str, entry: CachedResponse) -> None:
+        try:
+            await self.store.set(key, entry)
+        except (RedisError, OSError):
+            return
+        self.stored += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+__all__ = [
+    "CachedResponse",
+    "ConditionalCacheTransport",
+    "DiskResponseStore",
+    "RedisResponseStore",
+    "ResponseStore",
+    "SpentToken",
+    "TOKEN_EXTENSION",
+    "attach_spent_token",
+    "cache_key",
+    "mark_token_spent",
+]
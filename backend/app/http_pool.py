@@ -0,0 +1,182 @@
+"""Long-lived, pooled HTTP clients shared by the provider clients.
+
+One :class:`httpx.AsyncClient` per provider keeps connections alive between
+calls, so requests skip the TCP and TLS handshakes, and each provider gets
+its own connection limits. HTTP/2 is used when requested and the optional
+``h2`` package is installed. Every pooled response is fed to
+:func:`app.rate_limiting.observe_response_async`, so upstream ``Retry-After``
+headers and 403 bans freeze the provider. With a ``cache_store``, ``GET``
+responses are revalidated with ``ETag``/``Last-Modified`` (see
+:mod:`app.http_cache`), and requests are tagged with the token their caller
+spent so a 304 can give it back.
+
+The pool is opened and closed by :func:`running`, used by the FastAPI
+lifespan and available to the worker. Provider clients given an explicit
+``transport`` (tests, replay) get a short-lived client around it instead.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Mapping, Optional
+
+import httpx
+
+from app.http_cache import ConditionalCacheTransport, ResponseStore, attach_spent_token
+from app.rate_limiting import observe_response_async
+
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=10, max_keepalive_connections=5, keepalive_expiry=30.0
+)
+PROVIDER_LIMITS: Dict[str, httpx.Limits] = {
+    "coingecko": httpx.Limits(max_connections=10, max_keepalive_connections=5),
+    "etherscan": httpx.Limits(max_connections=10, max_keepalive_connections=5),
+    "mempool_space": httpx.Limits(max_connections=4, max_keepalive_connections=2),
+    "fx": httpx.Limits(max_connections=4, max_keepalive_connections=2),
+}
+DEFAULT_TIMEOUT = httpx.Timeout(5.0)
+
+
+def http2_available() -> bool:
+    """Return ``True`` if the optional ``h2`` package is installed."""
+
+    return importlib.util.find_spec("h2") is not None
+
+
+class HTTPClientPool:
+    """Per-provider pooled :class:`httpx.AsyncClient` instances.
+
+    Parameters
+    ----------
+    http2:
+        Negotiate HTTP/2 when ``h2`` is installed; HTTP/1.1 otherwise.
+    limits:
+        Connection limits per provider; unknown providers use
+        :data:`DEFAULT_LIMITS`.
+    timeout:
+        Default timeout for pooled clients.
+    transport:
+        Optional transport shared by every pooled client (e.g. record/replay);
+        connection limits then belong to that transport.
+    cache_store:
+        Optional store enabling conditional requests for every provider.
+    count_not_modified:
+        Whether a 304 served from ``cache_store`` keeps its token spent.
+    """
+
+    def __init__(
+        self,
+        *,
+        http2: bool = False,
+        limits: Optional[Mapping[str, httpx.Limits]] = None,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache_store: Optional[ResponseStore] = None,
+        count_not_modified: bool = True,
+    ) -> None:
+        self.http2 = http2 and http2_available()
+        self.limits = dict(PROVIDER_LIMITS if limits is None else limits)
+        self.timeout = timeout
+        self.transport = transport
+        self.cache_store = cache_store
+        self.count_not_modified = count_not_modified
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        """Return the shared client for ``provider``, creating it on first use."""
+
+        client = self._clients.get(provider)
+        if client is None:
+            transport = self.transport or httpx.AsyncHTTPTransport(
+                http2=self.http2, limits=self.limits.get(provider, DEFAULT_LIMITS)
+            )
+            if self.cache_store is not None:
+                transport = ConditionalCacheTransport(
+                    transport,
+                    self.cache_store,
+                    provider=provider,
+                    count_not_modified=self.count_not_modified,
+                )
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=transport,
+                event_hooks=_hooks(provider),
+            )
+            self._clients[provider] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close every pooled client."""
+
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+def _observer(provider: str):
+    async def observe(response: httpx.Response) -> None:
+        await observe_response_async(provider, response.status_code, response.headers)
+
+    return observe
+
+
+def _hooks(provider: str) -> Dict[str, list]:
+    # Requests carry the caller's spent token so a 304 can refund it.
+    return {"request": [attach_spent_token], "response": [_observer(provider)]}
+
+
+_pool: Optional[HTTPClientPool] = None
+
+
+def get_pool() -> HTTPClientPool:
+    """Return the process-wide pool, creating one if none is running."""
+
+    global _pool
+    if _pool is None:
+        _pool = HTTPClientPool()
+    return _pool
+
+
+@asynccontextmanager
+async def running(**kwargs) -> AsyncIterator[HTTPClientPool]:
+    """Install a fresh process-wide pool for the duration of the block."""
+
+    global _pool
+    previous, _pool = _pool, HTTPClientPool(**kwargs)
+    try:
+        yield _pool
+    finally:
+        pool, _pool = _pool, previous
+        await pool.aclose()
+
+
+@asynccontextmanager
+async def provider_client(
+    provider: str, transport: Optional[httpx.BaseTransport] = None
+) -> AsyncIterator[httpx.AsyncClient]:
+    """Yield the client a provider call should use.
+
+    With ``transport`` a short-lived client is built around it, keeping the
+    injection hook used by tests; otherwise the pooled client is yielded and
+    left open.
+    """
+
+    if transport is not None:
+        async with httpx.AsyncClient(
+            transport=transport, event_hooks=_hooks(provider)
+        ) as client:
+            yield client
+    else:
+        yield get_pool().client(provider)
+
+
+__all__ = [
+    "DEFAULT_LIMITS",
+    "HTTPClientPool",
+    "PROVIDER_LIMITS",
+    "get_pool",
+    "http2_available",
+    "provider_client",
+    "running",
+]
@@ -0,0 +1,212 @@
+"""Vectorized technical indicators over columnar candle arrays.
+
+Every function takes a ``float64`` array (typically
+:attr:`app.candles.CandleColumns.c`) and returns arrays of the same length,
+with ``NaN`` where an indicator is not defined yet. No function loops over
+bars in Python:
+
+* moving averages and rolling maxima use cumulative sums and block-wise
+  ``maximum.accumulate`` (van Herk/Gil-Werman);
+* exponential smoothing, a recursive filter, is evaluated in blocks: each
+  block is solved in closed form with a cumulative sum, and the carry
+  between blocks decays so fast that a handful of shifted adds propagates
+  it exactly to double precision.
+
+``EMA`` is seeded with the first value (``pandas`` ``ewm(adjust=False)``);
+RSI uses Wilder's smoothing seeded with the simple mean of the first
+``period`` changes.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+# Largest growth allowed for the in-block scaling factor ``decay ** -j``; it
+# bounds the rounding error of the closed form to about 1e6 * eps.
+_MAX_SCALE = 1e6
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """Simple moving average over ``window`` bars."""
+
+    _check_window(window)
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+
+def _smooth(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """Solve ``y[i] = (1 - alpha) * y[i - 1] + alpha * x[i]`` with ``y[-1] = initial``."""
+
+    n = len(values)
+    decay = 1.0 - alpha
+    if n == 0:
+        return np.empty(0)
+    if decay == 0.0:
+        return values.astype(np.float64, copy=True)
+    block = int(max(1, min(n, np.log(_MAX_SCALE) / -np.log(decay))))
+    count = -(-n // block)
+    padded = np.zeros(count * block)
+    padded[:n] = values
+    grid = padded.reshape(count, block)
+    steps = np.arange(block)
+    # Block-local solution starting from a zero state.
+    local = alpha * decay**steps * np.cumsum(grid * decay**-steps, axis=1)
+    # State at the end of block k: E[k] = local[k, -1] + decay**block * E[k - 1].
+    carry = decay**block
+    ends = local[:, -1].copy()
+    shifted = local[:, -1]
+    weight = 1.0
+    for lag in range(1, count):  # stops once carry**lag no longer registers
+        weight *= carry
+        if weight < np.finfo(np.float64).eps * 1e-3:
+            break
+        ends[lag:] += weight * shifted[:-lag]
+    with np.errstate(under="ignore"):
+        ends += initial * carry ** np.arange(1, count + 1)
+    previous = np.concatenate(([initial], ends[:-1]))
+    out = local + decay ** (steps + 1) * previous[:, None]
+    return out.reshape(-1)[:n]
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """Exponential moving average with ``alpha = 2 / (span + 1)``."""
+
+    _check_window(span)
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.empty(0)
+    return _smooth(values, 2.0 / (span + 1), values[0])
+
+
+def rsi(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """Relative strength index with Wilder's smoothing (``alpha = 1 / period``)."""
+
+    _check_window(period)
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) <= period:
+        return out
+    change = np.diff(values)
+    gains = np.clip(change, 0.0, None)
+    losses = np.clip(-change, 0.0, None)
+    alpha = 1.0 / period
+    avg_gain = np.concatenate(
+        ([gains[:period].mean()], _smooth(gains[period:], alpha, gains[:period].mean()))
+    )
+    avg_loss = np.concatenate(
+        ([losses[:period].mean()], _smooth(losses[period:], alpha, losses[:period].mean()))
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        strength = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # No losses: 100, or 50 for a flat series.
+    strength = np.where(avg_loss == 0.0, np.where(avg_gain == 0.0, 50.0, 100.0), strength)
+    out[period:] = strength
+    return out
+
+
+@dataclass(frozen=True)
+class MACD:
+    """MACD line, its signal line and their difference."""
+
+    macd: np.ndarray
+    signal: np.ndarray
+    histogram: np.ndarray
+
+
+def macd(values: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> MACD:
+    """Moving average convergence/divergence."""
+
+    if fast >= slow:
+        raise ValueError("fast span must be shorter than slow span")
+    line = ema(values, fast) - ema(values, slow)
+    signal_line = ema(line, signal)
+    return MACD(line, signal_line, line - signal_line)
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """Maximum over the trailing ``window`` bars (fewer at the start)."""
+
+    _check_window(window)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return np.empty(0)
+    count = -(-n // window)
+    padded = np.full(count * window, -np.inf)
+    padded[:n] = values
+    blocks = padded.reshape(count, window)
+    prefix = np.maximum.accumulate(blocks, axis=1).reshape(-1)
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1)
+    out = prefix[:n].copy()
+    # A full window [i - window + 1, i] spans the tail of one block and the head of the next.
+    ends = np.arange(window - 1, n)
+    out[window - 1:] = np.maximum(suffix[ends - window + 1], prefix[ends])
+    out[: window - 1] = np.maximum.accumulate(values[: window - 1])
+    return out
+
+
+def drawdown(values: np.ndarray, window: Optional[int] = None) -> np.ndarray:
+    """Fractional drop from the running peak (``<= 0``).
+
+    With ``window`` the peak is taken over the trailing ``window`` bars only.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    if window is None:
+        peak = np.maximum.accumulate(values) if len(values) else values
+    else:
+        peak = rolling_max(values, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return values / peak - 1.0
+
+
+def _check_window(window: int) -> None:
+    if window < 1:
+        raise ValueError(f"window must be positive, got {window}")
+
+
+def compute(
+    close: np.ndarray,
+    *,
+    sma_windows: Iterable[int] = (),
+    ema_spans: Iterable[int] = (),
+    rsi_period: Optional[int] = None,
+    macd_spans: Optional[tuple[int, int, int]] = None,
+    drawdown_window: Optional[int] = None,
+    skip: int = 0,
+) -> Dict[str, object]:
+    """Compute the requested indicators over ``close``.
+
+    Returns a mapping with ``sma``/``ema`` keyed by window, ``rsi``, a
+    :class:`MACD` under ``macd`` and ``drawdown``; ``rsi`` and ``macd`` are
+    omitted unless requested. The first ``skip`` bars are warm-up history:
+    they feed the indicators but are dropped from every result, and the
+    running drawdown (no ``drawdown_window``) starts after them.
+    """
+
+    close = np.asarray(close, dtype=np.float64)
+    if drawdown_window is None:
+        falls = drawdown(close[skip:])
+    else:
+        falls = drawdown(close, drawdown_window)[skip:]
+    result: Dict[str, object] = {
+        "sma": {window: sma(close, window)[skip:] for window in sma_windows},
+        "ema": {span: ema(close, span)[skip:] for span in ema_spans},
+        "drawdown": falls,
+    }
+    if rsi_period is not None:
+        result["rsi"] = rsi(close, rsi_period)[skip:]
+    if macd_spans is not None:
+        lines = macd(close, *macd_spans)
+        result["macd"] = MACD(lines.macd[skip:], lines.signal[skip:], lines.histogram[skip:])
+    return result
+
+
+__all__ = ["MACD", "compute", "drawdown", "ema", "macd", "rolling_max", "rsi", "sma"]
@@ -1,19 +1,205 @@
+import asyncio
+import json
 import os
 import math
 import time
-from typing import Annotated, Awaitable, Callable, List
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import (
+    Annotated,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Sequence,
+)
 
-from app import config_env
+from app import config_env, http_pool, indicators
+from app.candle_store import ASSET_ID_RE, DEFAULT_LOOKBACK, INTERVAL_SECONDS, CandleStore
+from app.candles import Candle, CandleColumns, decode_candles
+from app.compression import CompressionMiddleware
+from app.conditional import check_not_modified, make_etag
+from app.http_cache import (
+    DiskResponseStore,
+    RedisResponseStore,
+    ResponseStore,
+    mark_token_spent,
+)
 from app.fx_stub import deterministic_rate
-from app.rate_limiting import acquire
-from fastapi import Depends, FastAPI, Header, HTTPException, Path, Request, UploadFile
+from app.provider_cache import DEFAULT_POLICIES, CachedUpstreamError, provider_cache
+from app.rate_limiting import (
+    AdmissionQueue,
+    CircuitBreaker,
+    Priority,
+    RedisBreakerStore,
+    acquire_async,
+    fallback_bucket_count,
+    init,
+    refund_async,
+    release_leases_async,
+    set_async_client,
+    start_freeze_listener,
+    stop_freeze_listener,
+)
+from app.rate_limiting.provider_budgets import DEFAULT_BUDGETS
+from app.registry import AssetRegistry, get_registry
+from app.refreshers import DiskGuard, SnapshotRefresher, budget_interval
+from app.single_flight import single_flight
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    UploadFile,
+)
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, PlainTextResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import httpx
+import numpy as np
+from pydantic import BaseModel, Field
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+REDIS_MAX_CONNECTIONS = 64
+# Seconds between SSE comments keeping idle live streams (and proxies) open.
+SSE_HEARTBEAT = 15.0
+# High-volume providers spend tokens from process-local leases (TTL seconds).
+PROVIDER_LEASES = {"etherscan": 1.0}
+
+
+def _admission_queue_from_env() -> AdmissionQueue | None:
+    """Build the opt-in admission queue from ``RATE_LIMIT_QUEUE_*`` settings."""
+
+    depth = int(os.getenv("RATE_LIMIT_QUEUE_DEPTH", "0"))
+    if depth <= 0:
+        return None
+    deadline = float(os.getenv("RATE_LIMIT_QUEUE_DEADLINE", "5"))
+    return AdmissionQueue(
+        acquire_async, refund=refund_async, max_depth=depth, default_deadline=deadline
+    )
+
 
-app = FastAPI(title="Crypto Analytics BFF", version="0.1.0")
+def _http_cache_store(async_redis: AsyncRedis | None) -> ResponseStore | None:
+    """Pick the provider conditional-request cache from ``PROVIDER_HTTP_CACHE``."""
+
+    kind = os.getenv("PROVIDER_HTTP_CACHE", "")
+    if kind == "redis" and async_redis is not None:
+        return RedisResponseStore(async_redis)
+    if kind == "disk":
+        return DiskResponseStore(os.getenv("PROVIDER_HTTP_CACHE_DIR", "data/http-cache"))
+    return None
+
+
+def _onchain_refreshers(
+    breaker_store: RedisBreakerStore,
+) -> Dict[str, SnapshotRefresher]:
+    """Build gas/mempool refreshers for the providers with API keys set.
+
+    Each polls at the slower of its budget cadence and half its cache TTL,
+    behind a breaker shared across processes, and writes every result into
+    the provider cache so request handlers never find the entry stale.
+    """
+
+    # Imported here: the provider modules import their models from this one.
+    from app.providers import EtherscanClient, MempoolSpaceClient
+
+    guard = DiskGuard.from_env()
+    sources = (
+        ("gas", "ETHERSCAN_API_KEY", "etherscan", EtherscanClient().refresh_gas_prices),
+        ("mempool", "MEMPOOL_SPACE_API_KEY", "mempool_space", MempoolSpaceClient().refresh_mempool),
+    )
+    refreshers: Dict[str, SnapshotRefresher] = {}
+    for route, env, provider, fetch in sources:
+        if not os.getenv(env):
+            continue
+        interval = max(
+            budget_interval(DEFAULT_BUDGETS[provider]), provider_cache.policies[route].ttl / 2
+        )
+        refreshers[route] = SnapshotRefresher(
+            provider,
+            route,
+            fetch,
+            interval=interval,
+            breaker=CircuitBreaker(3, 30.0, name=provider, store=breaker_store),
+            disk_guard=guard,
+        )
+    return refreshers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Wire the rate limiter to Redis for the lifetime of the app.
+
+    A single asyncio client (and connection pool) is shared by every request.
+    Circuit breakers registered on ``app.state.breaker_store`` flip together
+    across processes, and provider freezes drain every process's token
+    leases. Without ``REDIS_URL`` the limiter is left untouched so tests can
+    call :func:`app.rate_limiting.init` themselves. Setting
+    ``RATE_LIMIT_QUEUE_DEPTH`` enables queued admission in :func:`rate_limiter`.
+    Provider clients share pooled keep-alive connections (HTTP/2 with
+    ``PROVIDER_HTTP2=1``) that are closed on shutdown. ``PROVIDER_HTTP_CACHE``
+    (``redis`` or ``disk``) enables conditional requests; with
+    ``PROVIDER_304_COUNTS=0`` a 304 does not spend a provider token. With
+    Redis, provider results are cached read-through in ``provider_cache``
+    and gas/mempool snapshots for configured providers are kept fresh by
+    background refreshers in ``app.state.refreshers``. Candles are served from
+    the Parquet partitions under ``CANDLE_DATA_DIR`` when that directory exists.
+    """
+
+    async with AsyncExitStack() as stack:
+        async_redis = None
+        breaker_store = None
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            async_redis = AsyncRedis.from_url(
+                redis_url, max_connections=REDIS_MAX_CONNECTIONS
+            )
+            stack.push_async_callback(async_redis.aclose)
+            redis_client = Redis.from_url(redis_url)
+            init(redis_client, async_client=async_redis, leases=PROVIDER_LEASES)
+            stack.callback(set_async_client, None)
+            start_freeze_listener()
+            stack.callback(stop_freeze_listener)
+            stack.push_async_callback(release_leases_async)
+            breaker_store = RedisBreakerStore(redis_client)
+            breaker_store.start()
+            stack.callback(breaker_store.stop)
+            app.state.breaker_store = breaker_store
+            provider_cache.attach(async_redis)
+            stack.push_async_callback(provider_cache.aclose)
+
+        await stack.enter_async_context(
+            http_pool.running(
+                http2=os.getenv("PROVIDER_HTTP2", "0") == "1",
+                cache_store=_http_cache_store(async_redis),
+                count_not_modified=os.getenv("PROVIDER_304_COUNTS", "1") == "1",
+            )
+        )
+        refreshers = _onchain_refreshers(breaker_store) if breaker_store else {}
+        app.state.refreshers = refreshers
+        for refresher in refreshers.values():
+            refresher.start()
+            stack.push_async_callback(refresher.stop)
+        stack.callback(setattr, app.state, "refreshers", {})
+        candle_store = _candle_store_from_env()
+        app.state.candle_store = candle_store
+        if candle_store is not None:
+            stack.callback(setattr, app.state, "candle_store", None)
+            stack.callback(candle_store.close)
+        queue = _admission_queue_from_env()
+        app.state.admission_queue = queue
+        if queue is not None:
+            stack.callback(setattr, app.state, "admission_queue", None)
+            stack.push_async_callback(queue.close)
+        yield
+
+
+app = FastAPI(title="Crypto Analytics BFF", version="0.1.0", lifespan=lifespan)
 
 ALLOWED_ORIGINS = ["http://127.0.0.1:3000", "http://localhost:3000"]
 app.add_middleware(
@@ -23,6 +209,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024")),
+)
 
 START = time.time()
 
@@ -44,18 +234,6 @@ class Health(BaseModel):
     uptime: float
 
 
-class Candle(BaseModel):
-    t: int
-    o: float
-    h: float
-    l: float
-    c: float
-    v: float
-    resolution: str
-    asof: float
-    source: str
-
-
 class ImportResult(BaseModel):
     imported: int
 
@@ -83,12 +261,34 @@ class FXRate(BaseModel):
     source: str
 
 
+class Quote(BaseModel):
+    price: float
+    change_24h: float | None = None
+    volume_24h: float | None = None
+    asof: float
+
+
+class WatchlistQuotes(BaseModel):
+    """Latest quotes keyed by requested asset id; shared fields are sent once.
+
+    ``unknown`` lists ids the registry cannot map to the provider and
+    ``unavailable`` ids the provider returned no quote for.
+    """
+
+    vs_currency: str
+    source: str
+    quotes: Dict[str, Quote]
+    unknown: List[str] = []
+    unavailable: List[str] = []
+
+
 ERROR_RESPONSES = {
     400: {"model": ErrorResponse, "description": "Bad Request"},
     413: {"model": ErrorResponse, "description": "Payload Too Large"},
     415: {"model": ErrorResponse, "description": "Unsupported Media Type"},
     429: {"model": ErrorResponse, "description": "Too Many Requests"},
     500: {"model": ErrorResponse, "description": "Internal Server Error"},
+    503: {"model": ErrorResponse, "description": "Service Unavailable"},
 }
 
 
@@ -102,15 +302,52 @@ async def validation_exception_handler(
     return JSONResponse(status_code=400, content=error.model_dump())
 
 
-def rate_limiter(request: Request) -> None:
+# Routes whose provider calls are bulk work; they queue behind interactive views.
+BACKFILL_ROUTES = frozenset({"/portfolio/holdings/import"})
+
+
+def admission_priority(request: Request) -> Priority:
+    """Admission priority of ``request``, decided from the matched route.
+
+    Bulk routes and NDJSON candle exports are backfill; everything else is
+    interactive. Client headers can never move a request ahead.
+    """
+
+    route = getattr(request.scope.get("route"), "path", None)
+    if route in BACKFILL_ROUTES:
+        return Priority.BACKFILL
+    if route == "/assets/{asset_id}/candles" and candle_media_type(
+        request.headers.get("accept")
+    ) == NDJSON:
+        return Priority.BACKFILL
+    return Priority.INTERACTIVE
+
+
+async def rate_limiter(request: Request) -> None:
     """Enforce provider budgets with token buckets.
 
     Provider name is taken from ``X-Provider`` header, defaulting to
-    ``coingecko``. On depletion a 429 with ``Retry-After`` is raised.
+    ``coingecko``. On depletion a 429 with ``Retry-After`` is raised. Runs on
+    the event loop, so it never occupies a threadpool worker.
+
+    With queued admission enabled the request first waits for a token for up
+    to ``X-Queue-Deadline`` seconds; backfill routes (see
+    :func:`admission_priority`) are served after interactive ones.
     """
 
     provider = request.headers.get("X-Provider", "coingecko")
-    allowed, retry_after = acquire(provider, request.url.path)
+    queue = getattr(request.app.state, "admission_queue", None)
+    if queue is None:
+        allowed, retry_after = await acquire_async(provider, request.url.path)
+    else:
+        priority = admission_priority(request)
+        try:
+            deadline = float(request.headers["X-Queue-Deadline"])
+        except (KeyError, ValueError):
+            deadline = None
+        allowed, retry_after = await queue.acquire(
+            provider, request.url.path, priority=priority, deadline=deadline
+        )
     if not allowed:
         error = ErrorResponse(code="provider_throttled", message="rate limit exceeded")
         raise HTTPException(
@@ -118,6 +355,8 @@ def rate_limiter(request: Request) -> None:
             detail=error.model_dump(),
             headers={"Retry-After": str(math.ceil(retry_after))},
         )
+    # Provider calls made while serving the request are paid for by this token.
+    mark_token_spent(provider)
 
 
 def get_redis_client() -> Redis:
@@ -153,20 +392,139 @@ async def get_capabilities_data() -> dict:  # pragma: no cover
     }
 
 
-async def fetch_candles(asset_id: str) -> List[Candle]:  # pragma: no cover
-    return [
-        Candle(
-            t=0,
-            o=0,
-            h=0,
-            l=0,
-            c=0,
-            v=0,
-            resolution="1d",
-            asof=time.time(),
-            source="mock",
+IfNoneMatch = Annotated[str | None, Header(alias="If-None-Match")]
+
+
+async def capabilities_etag(
+    response: Response,
+    data: dict = Depends(get_capabilities_data),
+    if_none_match: IfNoneMatch = None,
+) -> str:
+    etag = check_not_modified(if_none_match, make_etag(json.dumps(data, sort_keys=True)))
+    response.headers["ETag"] = etag
+    return etag
+
+
+AssetId = Annotated[str, Path(pattern=r"^[A-Za-z0-9_-]{1,64}$")]
+CandleInterval = Literal["5m", "1h", "1d"]
+
+
+def _candle_store_from_env() -> CandleStore | None:
+    """Open the Parquet candle store under ``CANDLE_DATA_DIR`` if it exists."""
+
+    root = os.getenv("CANDLE_DATA_DIR", os.path.join(os.getenv("DATA_DIR", "data"), "candles"))
+    if not os.path.isdir(root):
+        return None
+    return CandleStore(root)
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+CANDLE_COLUMNS_JSON = "application/vnd.crypto-analytics.columns+json"
+NDJSON = "application/x-ndjson"
+CANDLE_MEDIA_TYPES = ("application/json", CANDLE_COLUMNS_JSON, ARROW_STREAM, NDJSON)
+MAX_CANDLE_PAGE = 100_000
+PageLimit = Annotated[int | None, Query(ge=1, le=MAX_CANDLE_PAGE)]
+
+
+def negotiate(accept: str | None, offers: Sequence[str]) -> str:
+    """Pick the offer the ``Accept`` header prefers; ``offers[0]`` is the default.
+
+    Exact media types are matched by quality, ties going to the earlier
+    header entry. Wildcards and unknown types fall back to the default.
+    """
+
+    best, best_q = offers[0], 0.0
+    for entry in (accept or "").split(","):
+        media_type, _, params = entry.strip().partition(";")
+        media_type = media_type.strip().lower()
+        if media_type not in offers:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def candle_media_type(accept: Annotated[str | None, Header()] = None) -> str:
+    return negotiate(accept, CANDLE_MEDIA_TYPES)
+
+
+async def candles_etag(
+    request: Request,
+    asset_id: AssetId,
+    interval: CandleInterval = "1d",
+    end: int | None = None,
+    media_type: str = Depends(candle_media_type),
+    if_none_match: IfNoneMatch = None,
+) -> str | None:
+    """ETag of a candles response from the asset's partition stamp.
+
+    Raises 304 before the query runs when ``If-None-Match`` matches. Without
+    a candle store (mock data) no ETag is produced.
+    """
+
+    store = getattr(request.app.state, "candle_store", None)
+    if store is None:
+        return None
+    version = await asyncio.to_thread(store.version, asset_id)
+    # Without ``end`` the window slides forward once per interval.
+    window = int(time.time()) // INTERVAL_SECONDS[interval] if end is None else None
+    query = sorted(request.query_params.multi_items())
+    etag = make_etag(request.url.path, query, media_type, version, window)
+    return check_not_modified(if_none_match, etag)
+
+
+def candle_range(interval: str, start: int | None, end: int | None) -> tuple[int, int]:
+    """Fill in the default ``[start, end)`` range, rejecting empty ones with 400.
+
+    ``end`` defaults to now and ``start`` to a per-interval lookback.
+    """
+
+    end = int(time.time()) if end is None else end
+    start = end - DEFAULT_LOOKBACK[interval] if start is None else start
+    if start >= end:
+        error = ErrorResponse(code="client_invalid_contract", message="start must precede end")
+        raise HTTPException(status_code=400, detail=error.model_dump())
+    return start, end
+
+
+async def fetch_candles(
+    request: Request,
+    asset_id: AssetId,
+    interval: CandleInterval = "1d",
+    start: int | None = None,
+    end: int | None = None,
+    cursor: int | None = None,
+    limit: PageLimit = None,
+    media_type: str = Depends(candle_media_type),
+) -> CandleColumns | AsyncIterator[CandleColumns]:
+    """Read ``interval`` candles with ``start <= t < end`` (epoch seconds).
+
+    ``end`` defaults to now and ``start`` to a per-interval lookback; a
+    ``cursor`` from a previous page replaces ``start``. One candle beyond
+    ``limit`` is read so the caller can tell whether another page follows.
+    NDJSON requests get lazily streamed batches instead of one result.
+    Without a candle store a single mock candle is returned.
+    """
+
+    store = getattr(request.app.state, "candle_store", None)
+    if store is None:  # pragma: no cover
+        mock = {"t": 0, "o": 0, "h": 0, "l": 0, "c": 0, "v": 0}
+        return decode_candles(
+            [{**mock, "resolution": interval, "asof": time.time()}], source="mock"
         )
-    ]
+    start, end = candle_range(interval, start if cursor is None else cursor, end)
+    fetch = None if limit is None else limit + 1
+    if media_type == NDJSON:
+        return store.stream(asset_id, interval, start, end, fetch)
+    return await store.query_async(asset_id, interval, start, end, fetch)
 
 
 async def process_import(file: UploadFile) -> ImportResult:  # pragma: no cover
@@ -220,8 +578,85 @@ async def idempotent_process_import(
         await file.close()
 
 
-async def get_eth_gas_data() -> GasPrices:  # pragma: no cover
-    return GasPrices(
+def _snapshot(request: Request, route: str):
+    """Return the in-memory snapshot of ``route``, or ``None`` without a refresher.
+
+    Raises a 503 while the refresher has not completed its first poll.
+    """
+
+    refresher = getattr(request.app.state, "refreshers", {}).get(route)
+    if refresher is None:
+        return None
+    if refresher.value is None:
+        error = ErrorResponse(code="provider_outage", message="snapshot not ready")
+        raise HTTPException(status_code=503, detail=error.model_dump())
+    return refresher.value
+
+
+async def sse_frames(
+    refresher: SnapshotRefresher, event: str, last_event_id: str | None
+) -> AsyncIterator[str]:
+    """Format refresher changes as ``text/event-stream`` frames."""
+
+    async for item in refresher.events(last_event_id, heartbeat=SSE_HEARTBEAT):
+        if item is None:
+            yield ": heartbeat\n\n"
+            continue
+        event_id, snapshot = item
+        yield f"id: {event_id}\nevent: {event}\ndata: {snapshot.model_dump_json()}\n\n"
+
+
+def _stream(request: Request, route: str, last_event_id: str | None) -> StreamingResponse:
+    """Subscribe to the ``route`` refresher; 503 when live updates are disabled."""
+
+    refresher = getattr(request.app.state, "refreshers", {}).get(route)
+    if refresher is None:
+        error = ErrorResponse(code="provider_outage", message="live updates disabled")
+        raise HTTPException(status_code=503, detail=error.model_dump())
+    return StreamingResponse(
+        sse_frames(refresher, route, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def ndjson_frames(
+    pages: AsyncIterator[List[dict]], limit: int | None, cursor_field: str = "t"
+) -> AsyncIterator[str]:
+    """Format pages of rows as NDJSON, ending with ``next_cursor`` past ``limit``.
+
+    Only one page is held at a time, so memory does not grow with the range.
+    """
+
+    sent = 0
+    async for rows in pages:
+        if limit is not None and sent + len(rows) > limit:
+            rows, extra = rows[: limit - sent], rows[limit - sent]
+            if rows:
+                yield "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+            yield json.dumps({"next_cursor": extra[cursor_field]}) + "\n"
+            return
+        sent += len(rows)
+        yield "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+
+
+async def _candle_pages(
+    candles: CandleColumns | AsyncIterator[CandleColumns],
+) -> AsyncIterator[List[dict]]:
+    if isinstance(candles, CandleColumns):
+        yield candles.to_rows()
+        return
+    async for batch in candles:
+        yield batch.to_rows()
+
+
+async def get_eth_gas_data(request: Request) -> GasPrices:
+    """Serve the latest gas snapshot without I/O (mock data when disabled)."""
+
+    snapshot = _snapshot(request, "gas")
+    if snapshot is not None:
+        return snapshot
+    return GasPrices(  # pragma: no cover
         safe=1.0,
         propose=2.0,
         fast=3.0,
@@ -230,26 +665,60 @@ async def get_eth_gas_data() -> GasPrices:  # pragma: no cover
     )
 
 
-async def get_btc_mempool_data() -> MempoolData:  # pragma: no cover
-    return MempoolData(txs=0, size=0, asof=time.time(), source="mock")
+async def get_btc_mempool_data(request: Request) -> MempoolData:
+    """Serve the latest mempool snapshot without I/O (mock data when disabled)."""
 
+    snapshot = _snapshot(request, "mempool")
+    if snapshot is not None:
+        return snapshot
+    return MempoolData(  # pragma: no cover
+        txs=0, size=0, asof=time.time(), source="mock"
+    )
 
-async def get_fx_rate_data(
-    base: Annotated[str, Path(pattern=r"^[A-Z]{3}$")],
-    quote: Annotated[str, Path(pattern=r"^[A-Z]{3}$")],
-) -> FXRate:
+
+Currency = Annotated[str, Path(pattern=r"^[A-Z]{3}$")]
+
+
+def fx_watermark(now: float | None = None) -> float:
+    """Start of the current FX cache window; rates are refreshed once per window."""
+
+    ttl = DEFAULT_POLICIES["fx"].ttl
+    now = time.time() if now is None else now
+    return now // ttl * ttl
+
+
+async def fx_etag(
+    response: Response, base: Currency, quote: Currency, if_none_match: IfNoneMatch = None
+) -> str:
+    etag = check_not_modified(if_none_match, make_etag("fx", base, quote, fx_watermark()))
+    response.headers["ETag"] = etag
+    return etag
+
+
+async def get_fx_rate_data(base: Currency, quote: Currency) -> FXRate:
     """Return deterministic FX rate data for the given currency pair."""
 
     rate = deterministic_rate(base, quote)
-    return FXRate(base=base, quote=quote, rate=rate, asof=time.time(), source="stub")
+    return FXRate(base=base, quote=quote, rate=rate, asof=fx_watermark(), source="stub")
 
 
-async def get_metrics_data() -> str:  # pragma: no cover
+async def get_metrics_data(request: Request) -> str:  # pragma: no cover
+    queue = getattr(request.app.state, "admission_queue", None)
     return (
-        "content-type=text/plain; version=0.0.4\n"
-        "app_uptime_seconds %f\n"
-        "rate_limit_clamp 1.0\n"
-        "breaker_open_total 0\n" % (time.time() - START)
+        (
+            "content-type=text/plain; version=0.0.4\n"
+            "app_uptime_seconds %f\n"
+            "rate_limit_clamp 1.0\n"
+            "rate_limit_fallback_buckets %d\n"
+            "breaker_open_total 0\n" % (time.time() - START, fallback_bucket_count())
+        )
+        + single_flight.render_metrics()
+        + provider_cache.render_metrics()
+        + "".join(
+            refresher.render_metrics()
+            for refresher in getattr(request.app.state, "refreshers", {}).values()
+        )
+        + (queue.render_metrics() if queue is not None else "")
     )
 
 
@@ -263,6 +732,7 @@ async def health(
 
 @app.get("/capabilities", responses=ERROR_RESPONSES)
 async def capabilities(
+    _etag: str = Depends(capabilities_etag),
     data: dict = Depends(get_capabilities_data),
     _: None = Depends(rate_limiter),
 ):  # pragma: no cover
@@ -272,14 +742,177 @@ async def capabilities(
 @app.get(
     "/assets/{asset_id}/candles",
     response_model=List[Candle],
-    responses=ERROR_RESPONSES,
+    responses={
+        **ERROR_RESPONSES,
+        200: {
+            "description": "Candles as JSON rows (default), compact columns or Arrow",
+            "content": {CANDLE_COLUMNS_JSON: {}, ARROW_STREAM: {}},
+        },
+    },
 )
 async def asset_candles(
-    asset_id: Annotated[str, Path(pattern=r"^[A-Za-z0-9_-]{1,64}$")],
-    candles: List[Candle] = Depends(fetch_candles),
+    asset_id: AssetId,
+    response: Response,
+    limit: PageLimit = None,
+    media_type: str = Depends(candle_media_type),
+    etag: str | None = Depends(candles_etag),
+    candles: CandleColumns | AsyncIterator[CandleColumns] = Depends(fetch_candles),
     _: None = Depends(rate_limiter),
 ):
-    return candles
+    """Return candles in the representation negotiated from ``Accept``.
+
+    ``application/json`` (default) keeps the row-per-candle shape.
+    ``application/vnd.crypto-analytics.columns+json`` sends one array per
+    field with shared ``resolution``/``source``/``asof`` hoisted out, and
+    ``application/vnd.apache.arrow.stream`` passes the query's Arrow table
+    through as an IPC stream. ``application/x-ndjson`` streams one candle
+    per line straight from the query cursor.
+
+    With ``limit``, the ``t`` of the first candle of the next page is sent
+    as ``next_cursor``: the ``X-Next-Cursor`` header, a ``next_cursor`` key
+    of the columns document, or the final NDJSON line.
+
+    An ``If-None-Match`` matching the current ETag is answered with 304
+    before the query runs.
+    """
+
+    headers = {"Vary": "Accept"}
+    if etag is not None:
+        headers["ETag"] = etag
+    if media_type == NDJSON:
+        return StreamingResponse(
+            ndjson_frames(_candle_pages(candles), limit), media_type=NDJSON, headers=headers
+        )
+    next_cursor = None
+    if limit is not None and len(candles) > limit:
+        next_cursor = int(candles.t[limit])
+        candles = candles.head(limit)
+        headers["X-Next-Cursor"] = str(next_cursor)
+    if media_type == ARROW_STREAM:
+        return Response(candles.to_arrow_ipc(), media_type=ARROW_STREAM, headers=headers)
+    if media_type == CANDLE_COLUMNS_JSON:
+        document = {**candles.to_columns(), "next_cursor": next_cursor}
+        return JSONResponse(document, media_type=CANDLE_COLUMNS_JSON, headers=headers)
+    response.headers.update(headers)
+    return candles.to_models()
+
+
+MAX_INDICATOR_WINDOW = 1000
+# Extra history read per bar of the longest window so that exponential
+# indicators have forgotten their seed (weight below e**-5) by ``start``.
+INDICATOR_WARMUP = 5
+IndicatorWindow = Annotated[int, Field(ge=1, le=MAX_INDICATOR_WINDOW)]
+IndicatorWindows = Annotated[List[IndicatorWindow], Query(max_length=8)]
+
+
+class MACDLines(BaseModel):
+    macd: List[float | None]
+    signal: List[float | None]
+    histogram: List[float | None]
+
+
+class AssetMetrics(BaseModel):
+    """Indicator columns aligned with ``t``; ``null`` marks bars still warming up."""
+
+    asset_id: str
+    interval: str
+    t: List[int]
+    c: List[float]
+    sma: Dict[str, List[float | None]]
+    ema: Dict[str, List[float | None]]
+    rsi: List[float | None]
+    macd: MACDLines
+    drawdown: List[float | None]
+    max_drawdown: float | None
+
+
+def _nullable(values: np.ndarray) -> list:
+    """Return ``values`` as a JSON-ready list with ``NaN``/``inf`` as ``None``."""
+
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+async def fetch_metrics(
+    request: Request,
+    asset_id: AssetId,
+    interval: CandleInterval = "1d",
+    start: int | None = None,
+    end: int | None = None,
+    sma: IndicatorWindows = [20, 50],
+    ema: IndicatorWindows = [12, 26],
+    rsi: IndicatorWindow = 14,
+    macd_fast: IndicatorWindow = 12,
+    macd_slow: IndicatorWindow = 26,
+    macd_signal: IndicatorWindow = 9,
+    drawdown_window: IndicatorWindow | None = None,
+) -> AssetMetrics:
+    """Compute indicators over the closes of ``interval`` candles in ``[start, end)``.
+
+    Candles before ``start`` are read as warm-up history so every indicator
+    is already settled at the first returned bar; that history is not
+    returned. ``drawdown`` is measured from the running peak since
+    ``start``, or over the trailing ``drawdown_window`` bars.
+    """
+
+    if macd_fast >= macd_slow:
+        error = ErrorResponse(
+            code="client_invalid_contract", message="macd_fast must be below macd_slow"
+        )
+        raise HTTPException(status_code=400, detail=error.model_dump())
+    start, end = candle_range(interval, start, end)
+    store = getattr(request.app.state, "candle_store", None)
+    longest = max([*sma, *ema, rsi, macd_slow + macd_signal, drawdown_window or 1])
+    warmup = INDICATOR_WARMUP * longest * INTERVAL_SECONDS[interval]
+    if store is None:  # pragma: no cover
+        candles = CandleColumns.empty()
+    else:
+        candles = await store.query_async(asset_id, interval, start - warmup, end)
+    skip = int(np.searchsorted(candles.t, start))
+    values = indicators.compute(
+        candles.c,
+        sma_windows=sma,
+        ema_spans=ema,
+        rsi_period=rsi,
+        macd_spans=(macd_fast, macd_slow, macd_signal),
+        drawdown_window=drawdown_window,
+        skip=skip,
+    )
+    lines = values["macd"]
+    drawdown = values["drawdown"]
+    return AssetMetrics(
+        asset_id=asset_id,
+        interval=interval,
+        t=candles.t[skip:].tolist(),
+        c=candles.c[skip:].tolist(),
+        sma={str(window): _nullable(line) for window, line in values["sma"].items()},
+        ema={str(span): _nullable(line) for span, line in values["ema"].items()},
+        rsi=_nullable(values["rsi"]),
+        macd=MACDLines(
+            macd=_nullable(lines.macd),
+            signal=_nullable(lines.signal),
+            histogram=_nullable(lines.histogram),
+        ),
+        drawdown=_nullable(drawdown),
+        max_drawdown=float(np.nanmin(drawdown)) if np.isfinite(drawdown).any() else None,
+    )
+
+
+@app.get("/assets/{asset_id}/metrics", response_model=AssetMetrics, responses=ERROR_RESPONSES)
+async def asset_metrics(
+    response: Response,
+    etag: str | None = Depends(candles_etag),
+    data: AssetMetrics = Depends(fetch_metrics),
+    _: None = Depends(rate_limiter),
+) -> AssetMetrics:
+    """Return SMA/EMA, RSI, MACD and drawdown columns for the asset detail view.
+
+    Indicators are computed from the same Parquet partitions as the candles
+    endpoint and share its ETag scheme, so an unchanged range answers 304.
+    """
+
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return data
 
 
 @app.post(
@@ -294,12 +927,75 @@ async def portfolio_import(
     return result
 
 
+MAX_WATCHLIST = 100
+
+
+def get_quote_client():
+    """Provider client for watchlist quotes (overridable in tests)."""
+
+    from app.providers import CoinGeckoClient  # app.providers imports app.main
+
+    return CoinGeckoClient()
+
+
+async def fetch_watchlist_quotes(
+    ids: Annotated[str, Query(min_length=1, max_length=MAX_WATCHLIST * 65)],
+    vs: Annotated[str, Query(pattern=r"^[a-z]{3,5}$")] = "usd",
+    registry: AssetRegistry = Depends(get_registry),
+    client=Depends(get_quote_client),
+) -> WatchlistQuotes:
+    """Resolve comma-separated ``ids`` through the registry and quote them.
+
+    Duplicate ids are collapsed and assets sharing a CoinGecko id are fetched
+    once; the client serves cached quotes and fetches the rest in one batch.
+    """
+
+    names = list(dict.fromkeys(name.strip() for name in ids.split(",") if name.strip()))
+    if not names or len(names) > MAX_WATCHLIST or not all(map(ASSET_ID_RE.match, names)):
+        error = ErrorResponse(code="client_invalid_contract", message="invalid asset ids")
+        raise HTTPException(status_code=400, detail=error.model_dump())
+    provider_ids: Dict[str, str] = {}
+    unknown: List[str] = []
+    for name in names:
+        provider_id = registry.provider_id(name, "coingecko")
+        if provider_id is None:
+            unknown.append(name)
+        else:
+            provider_ids[name] = provider_id
+    quotes: Dict[str, Quote] = {}
+    if provider_ids:
+        try:
+            quotes = await client.get_quotes(sorted(set(provider_ids.values())), vs)
+        except (httpx.HTTPError, CachedUpstreamError):
+            error = ErrorResponse(code="provider_outage", message="quotes unavailable")
+            raise HTTPException(status_code=503, detail=error.model_dump())
+    found = {name: quotes[pid] for name, pid in provider_ids.items() if pid in quotes}
+    return WatchlistQuotes(
+        vs_currency=vs,
+        source="coingecko",
+        quotes=found,
+        unknown=unknown,
+        unavailable=[name for name in provider_ids if name not in found],
+    )
+
+
+@app.get("/assets/quotes", response_model=WatchlistQuotes, responses=ERROR_RESPONSES)
+async def watchlist_quotes(
+    data: WatchlistQuotes = Depends(fetch_watchlist_quotes),
+    _: None = Depends(rate_limiter),
+) -> WatchlistQuotes:
+    """Latest quotes for many assets in one request and one rate-limit check."""
+
+    return data
+
+
 @app.get(
     "/fx/{base}/{quote}",
     response_model=FXRate,
     responses=ERROR_RESPONSES,
 )
 async def fx_rate(
+    _etag: str = Depends(fx_etag),
     data: FXRate = Depends(get_fx_rate_data),
     _: None = Depends(rate_limiter),
 ) -> FXRate:
@@ -326,6 +1022,43 @@ async def onchain_btc_mempool(
     return data
 
 
+LastEventId = Annotated[str | None, Header(alias="Last-Event-ID")]
+
+
+@app.get(
+    "/onchain/eth/gas/stream",
+    response_class=StreamingResponse,
+    responses=ERROR_RESPONSES,
+)
+async def onchain_eth_gas_stream(
+    request: Request,
+    last_event_id: LastEventId = None,
+    _: None = Depends(rate_limiter),
+):
+    """Push a ``gas`` event whenever the gas snapshot changes.
+
+    Every client shares the background refresh; reconnecting with
+    ``Last-Event-ID`` skips a snapshot the client already has.
+    """
+
+    return _stream(request, "gas", last_event_id)
+
+
+@app.get(
+    "/onchain/btc/mempool/stream",
+    response_class=StreamingResponse,
+    responses=ERROR_RESPONSES,
+)
+async def onchain_btc_mempool_stream(
+    request: Request,
+    last_event_id: LastEventId = None,
+    _: None = Depends(rate_limiter),
+):
+    """Push a ``mempool`` event whenever the mempool snapshot changes."""
+
+    return _stream(request, "mempool", last_event_id)
+
+
 @app.get("/metrics", response_class=PlainTextResponse, responses=ERROR_RESPONSES)
 async def metrics(
     data: str = Depends(get_metrics_data),
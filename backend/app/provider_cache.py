@@ -0,0 +1,481 @@
+"""Read-through Redis cache for provider results.
+
+:class:`ProviderCache` sits in front of the provider clients. Entries are
+keyed by provider, route and request parameters and live for the route's
+:class:`CachePolicy`:
+
+* younger than ``ttl`` -- served from Redis (``hit``);
+* younger than ``ttl + stale_ttl`` -- served as is while one background
+  refresh per key runs, if the provider's token bucket allows it (``stale``);
+* otherwise the provider is called and the result stored (``miss``).
+
+Upstream HTTP errors are cached for ``negative_ttl`` seconds so a failing
+provider is not hammered; callers then get :class:`CachedUpstreamError`.
+:meth:`ProviderCache.get_many` applies the same rules per item for batch
+provider APIs, reading every entry in one round trip and fetching all
+missing items with a single call.
+
+Without a Redis client (or when Redis fails) the cache is bypassed and every
+call goes to the provider.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+import httpx
+from pydantic import BaseModel
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError
+
+from app.http_cache import mark_token_spent
+from app.rate_limiting import acquire_async
+from app.single_flight import SingleFlight
+
+T = TypeVar("T")
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Freshness rules for one route, in seconds."""
+
+    ttl: float
+    stale_ttl: float = 0.0
+    negative_ttl: float = 0.0
+
+
+DEFAULT_POLICY = CachePolicy(ttl=60, stale_ttl=300, negative_ttl=10)
+DEFAULT_POLICIES: Dict[str, CachePolicy] = {
+    "gas": CachePolicy(ttl=15, stale_ttl=60, negative_ttl=5),
+    "mempool": CachePolicy(ttl=30, stale_ttl=120, negative_ttl=5),
+    "candles": CachePolicy(ttl=300, stale_ttl=3600, negative_ttl=30),
+    "fx": CachePolicy(ttl=60, stale_ttl=1800, negative_ttl=10),
+    "quotes": CachePolicy(ttl=30, stale_ttl=300),
+}
+
+
+class Codec(NamedTuple, Generic[T]):
+    """Serialize cached values to and from bytes."""
+
+    dumps: Callable[[T], bytes]
+    loads: Callable[[bytes], T]
+
+
+def model_codec(model: Type[M]) -> Codec[M]:
+    """Return a JSON :class:`Codec` for a pydantic ``model``."""
+
+    return Codec(lambda value: value.model_dump_json().encode(), model.model_validate_json)
+
+
+class CachedUpstreamError(Exception):
+    """A recent upstream failure served from the negative cache."""
+
+    def __init__(self, provider: str, message: str) -> None:
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+
+@dataclass(frozen=True)
+class _Entry:
+    stored_at: float
+    error: Optional[str]
+    payload: bytes
+
+    def to_bytes(self) -> bytes:
+        meta = json.dumps({"at": self.stored_at, "error": self.error})
+        return meta.encode() + b"\n" + self.payload
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "_Entry":
+        meta, _, payload = raw.partition(b"\n")
+        data = json.loads(meta)
+        return cls(data["at"], data["error"], payload)
+
+
+class ProviderCache:
+    """Read-through cache with stale-while-revalidate and negative caching.
+
+    Parameters
+    ----------
+    client:
+        Asyncio Redis connection; ``None`` bypasses the cache.
+    policies:
+        :class:`CachePolicy` per route, defaulting to :data:`DEFAULT_POLICIES`.
+    prefix:
+        Key prefix for entries.
+    time_func:
+        Wall clock shared by every process; defaults to :func:`time.time`.
+    acquire:
+        Token bucket check gating background refreshes.
+    negative_errors:
+        Exceptions whose occurrence is cached for ``negative_ttl``.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncRedis] = None,
+        *,
+        policies: Optional[Mapping[str, CachePolicy]] = None,
+        prefix: str = "cache:",
+        time_func: Callable[[], float] | None = None,
+        acquire: Callable[[str, str], Awaitable[Tuple[bool, float]]] = acquire_async,
+        negative_errors: Tuple[Type[BaseException], ...] = (httpx.HTTPError,),
+    ) -> None:
+        self.client = client
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.prefix = prefix
+        self.time = time_func or time.time
+        self.acquire = acquire
+        self.negative_errors = negative_errors
+        self.results: Counter[Tuple[str, str]] = Counter()
+        self.refreshes: Counter[Tuple[str, str]] = Counter()
+        self._flight = SingleFlight()
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def attach(self, client: Optional[AsyncRedis]) -> None:
+        """Attach (or detach, with ``None``) the Redis connection."""
+
+        self.client = client
+
+    async def aclose(self) -> None:
+        """Cancel background refreshes and detach from Redis."""
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.client = None
+
+    def key(self, provider: str, route: str, params: Mapping[str, object]) -> str:
+        digest = hashlib.sha256(
+            json.dumps(params, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f"{self.prefix}{provider}:{route}:{digest}"
+
+    async def get(
+        self,
+        provider: str,
+        route: str,
+        params: Mapping[str, object],
+        fetch: Callable[[], Awaitable[T]],
+        codec: Codec[T],
+    ) -> T:
+        """Return the cached result of ``fetch()`` for this request.
+
+        Raises
+        ------
+        CachedUpstreamError
+            If the last upstream call failed less than ``negative_ttl`` ago.
+        Exception
+            Whatever ``fetch`` raises on a miss.
+        """
+
+        if self.client is None:
+            return await fetch()
+        policy = self.policies.get(route, DEFAULT_POLICY)
+        key = self.key(provider, route, params)
+        entry = await self._read(key)
+        if entry is not None:
+            age = self.time() - entry.stored_at
+            if entry.error is not None:
+                if age < policy.negative_ttl:
+                    self.results[provider, "negative"] += 1
+                    raise CachedUpstreamError(provider, entry.error)
+            elif age < policy.ttl:
+                self.results[provider, "hit"] += 1
+                return codec.loads(entry.payload)
+            elif age < policy.ttl + policy.stale_ttl:
+                self.results[provider, "stale"] += 1
+                self._revalidate(
+                    provider,
+                    route,
+                    (key,),
+                    # A failed refresh leaves the stale entry in place.
+                    lambda: self._load(key, fetch, codec, policy, negative=False),
+                )
+                return codec.loads(entry.payload)
+        self.results[provider, "miss"] += 1
+        return await self._flight.do(
+            (provider, key), lambda: self._load(key, fetch, codec, policy)
+        )
+
+    async def put(
+        self,
+        provider: str,
+        route: str,
+        params: Mapping[str, object],
+        value: T,
+        codec: Codec[T],
+    ) -> None:
+        """Store ``value`` as a fresh result for this request.
+
+        Used by pollers that call the provider themselves, so readers see
+        the polled value instead of an entry one interval old.
+        """
+
+        if self.client is None:
+            return
+        policy = self.policies.get(route, DEFAULT_POLICY)
+        entry = _Entry(self.time(), None, codec.dumps(value))
+        await self._write(self.key(provider, route, params), entry, policy.ttl + policy.stale_ttl)
+
+    async def _load(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[T]],
+        codec: Codec[T],
+        policy: CachePolicy,
+        *,
+        negative: bool = True,
+    ) -> T:
+        """Call the provider and store its result (or error) under ``key``."""
+
+        try:
+            value = await fetch()
+        except self.negative_errors as exc:
+            if negative and policy.negative_ttl > 0:
+                error = f"{type(exc).__name__}: {exc}"
+                await self._write(key, _Entry(self.time(), error, b""), policy.negative_ttl)
+            raise
+        entry = _Entry(self.time(), None, codec.dumps(value))
+        await self._write(key, entry, policy.ttl + policy.stale_ttl)
+        return value
+
+    async def get_many(
+        self,
+        provider: str,
+        route: str,
+        params: Mapping[str, Mapping[str, object]],
+        fetch: Callable[[List[str]], Awaitable[Dict[str, T]]],
+        codec: Codec[T],
+    ) -> Dict[str, T]:
+        """Return cached results for many items of a batch provider call.
+
+        ``params`` maps each item name to its cache parameters. Fresh and
+        stale entries are read with one ``MGET``; stale items are refreshed
+        together in the background and all other items are passed to a
+        single ``fetch(names)`` call. Items ``fetch`` does not return are
+        left out of the result. With a ``negative_ttl`` policy, a failed
+        ``fetch`` is cached for each of its items.
+
+        Raises
+        ------
+        CachedUpstreamError
+            If a requested item failed upstream less than ``negative_ttl`` ago.
+        Exception
+            Whatever ``fetch`` raises.
+        """
+
+        if self.client is None:
+            return await fetch(list(params))
+        policy = self.policies.get(route, DEFAULT_POLICY)
+        keys = {name: self.key(provider, route, item) for name, item in params.items()}
+        entries = await self._read_many(list(keys.values()))
+        found: Dict[str, T] = {}
+        stale: Dict[str, str] = {}
+        missing: Dict[str, str] = {}
+        now = self.time()
+        for name, key in keys.items():
+            entry = entries.get(key)
+            age = now - entry.stored_at if entry is not None else None
+            if entry is not None and entry.error is not None and age < policy.negative_ttl:
+                self.results[provider, "negative"] += 1
+                raise CachedUpstreamError(provider, entry.error)
+            if entry is None or entry.error is not None or age >= policy.ttl + policy.stale_ttl:
+                self.results[provider, "miss"] += 1
+                missing[name] = key
+                continue
+            found[name] = codec.loads(entry.payload)
+            if age < policy.ttl:
+                self.results[provider, "hit"] += 1
+            else:
+                self.results[provider, "stale"] += 1
+                if key not in self._refreshing:
+                    stale[name] = key
+        if stale:
+            self._revalidate(
+                provider,
+                route,
+                tuple(stale.values()),
+                # A failed refresh leaves the stale entries in place.
+                lambda: self._load_many(stale, fetch, codec, policy, negative=False),
+            )
+        if missing:
+            found.update(await self._load_missing(provider, missing, fetch, codec, policy))
+        return found
+
+    async def _load_missing(
+        self,
+        provider: str,
+        keys: Mapping[str, str],
+        fetch: Callable[[List[str]], Awaitable[Dict[str, T]]],
+        codec: Codec[T],
+        policy: CachePolicy,
+    ) -> Dict[str, T]:
+        """Load ``keys`` like :meth:`_load_many`, joining items already being loaded.
+
+        Concurrent ``get_many`` calls missing overlapping items share one
+        upstream call per item; only items nobody is loading yet are fetched.
+        """
+
+        # "many" keeps these flights apart from the single-item ones of ``get``.
+        flights = {name: (provider, "many", key) for name, key in keys.items()}
+        names = {flight: name for name, flight in flights.items()}
+
+        async def load(fresh: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], T]:
+            values = await self._load_many(
+                {names[flight]: flight[2] for flight in fresh}, fetch, codec, policy
+            )
+            return {flights[name]: value for name, value in values.items() if name in flights}
+
+        loaded = await self._flight.do_many(flights.values(), load)
+        return {name: loaded[flight] for name, flight in flights.items() if flight in loaded}
+
+    async def _load_many(
+        self,
+        keys: Mapping[str, str],
+        fetch: Callable[[List[str]], Awaitable[Dict[str, T]]],
+        codec: Codec[T],
+        policy: CachePolicy,
+        *,
+        negative: bool = True,
+    ) -> Dict[str, T]:
+        """Fetch every item of ``keys`` in one call and store the results (or error)."""
+
+        try:
+            values = await fetch(list(keys))
+        except self.negative_errors as exc:
+            if negative and policy.negative_ttl > 0:
+                error = _Entry(self.time(), f"{type(exc).__name__}: {exc}", b"")
+                await self._write_many(
+                    {key: error for key in keys.values()}, policy.negative_ttl
+                )
+            raise
+        stored_at = self.time()
+        await self._write_many(
+            {
+                keys[name]: _Entry(stored_at, None, codec.dumps(value))
+                for name, value in values.items()
+            },
+            policy.ttl + policy.stale_ttl,
+        )
+        return values
+
+    async def _write_many(self, entries: Mapping[str, _Entry], ttl: float) -> None:
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, entry in entries.items():
+                    pipe.set(key, entry.to_bytes(), px=max(1, int(ttl * 1000)))
+                await pipe.execute()
+        except RedisError:
+            pass  # the values are still returned; the next read is a miss
+
+    def _revalidate(
+        self,
+        provider: str,
+        route: str,
+        keys: Tuple[str, ...],
+        load: Callable[[], Awaitable[object]],
+    ) -> None:
+        """Start one background ``load()`` refreshing ``keys`` unless one is running."""
+
+        if self._refreshing.intersection(keys):
+            return
+        self._refreshing.update(keys)
+        task = asyncio.create_task(self._refresh(provider, route, keys, load))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(
+        self,
+        provider: str,
+        route: str,
+        keys: Tuple[str, ...],
+        load: Callable[[], Awaitable[object]],
+    ) -> None:
+        try:
+            allowed, _ = await self.acquire(provider, route)
+            if not allowed:
+                # Keep serving the stale entry; a later read retries.
+                self.refreshes[provider, "throttled"] += 1
+                return
+            mark_token_spent(provider)
+            try:
+                await load()
+            except Exception:
+                self.refreshes[provider, "failed"] += 1
+            else:
+                self.refreshes[provider, "ok"] += 1
+        finally:
+            self._refreshing.difference_update(keys)
+
+    async def _read(self, key: str) -> Optional[_Entry]:
+        try:
+            raw = await self.client.get(key)
+        except RedisError:
+            return None
+        return _Entry.from_bytes(raw) if raw is not None else None
+
+    async def _read_many(self, keys: List[str]) -> Dict[str, _Entry]:
+        try:
+            raws = await self.client.mget(keys)
+        except RedisError:
+            return {}
+        return {key: _Entry.from_bytes(raw) for key, raw in zip(keys, raws) if raw is not None}
+
+    async def _write(self, key: str, entry: _Entry, ttl: float) -> None:
+        try:
+            await self.client.set(key, entry.to_bytes(), px=max(1, int(ttl * 1000)))
+        except RedisError:
+            pass  # the value is still returned; the next read is a miss
+
+    def render_metrics(self) -> str:
+        """Render cache counters and TTLs in Prometheus text format."""
+
+        lines = [
+            f'provider_cache_requests_total{{provider="{provider}",result="{result}"}} {count}'
+            for (provider, result), count in sorted(self.results.items())
+        ]
+        lines += [
+            f'provider_cache_refresh_total{{provider="{provider}",outcome="{outcome}"}} {count}'
+            for (provider, outcome), count in sorted(self.refreshes.items())
+        ]
+        lines += [
+            f'provider_cache_ttl_seconds{{route="{route}"}} {policy.ttl:g}'
+            for route, policy in sorted(self.policies.items())
+        ]
+        return "".join(line + "\n" for line in lines)
+
+
+provider_cache = ProviderCache()
+
+__all__ = [
+    "CachePolicy",
+    "CachedUpstreamError",
+    "Codec",
+    "DEFAULT_POLICIES",
+    "ProviderCache",
+    "model_codec",
+    "provider_cache",
+]
@@ -0,0 +1,324 @@
+"""Record/replay and chaos transport standing in for the real providers.
+
+:class:`RecordingTransport` wraps a live transport and appends every
+exchange to a :class:`Cassette`; saved cassettes are plain JSON lines, with
+API keys in query strings redacted.
+:class:`ReplayTransport` answers from a cassette and behaves like the
+upstream under load:
+
+* the provider's :data:`~app.rate_limiting.provider_budgets.DEFAULT_BUDGETS`
+  ceilings are enforced with sliding windows, answering ``429`` with
+  ``Retry-After`` once a window is spent;
+* a seeded :class:`ChaosProfile` adds latency, injected ``429`` responses,
+  bursts of ``5xx`` and timeouts.
+
+Any provider client accepts the transport through its ``transport`` field,
+so soak and chaos runs need no network and are reproducible from the seed.
+Pass a virtual ``time_func``/``sleep`` pair to run hours of traffic in
+seconds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import unquote_plus
+
+import httpx
+
+from app.rate_limiting.provider_budgets import DEFAULT_BUDGETS, ProviderBudget
+
+Latency = Callable[[random.Random], float]
+
+# Headers kept in recordings; the rest describe the original connection.
+RECORDED_HEADERS = ("content-type", "etag", "last-modified", "cache-control", "retry-after")
+
+# Query parameters carrying credentials; their values never reach a cassette.
+SECRET_PARAMS = frozenset(
+    {"apikey", "api_key", "access_key", "x_cg_pro_api_key", "x_cg_demo_api_key"}
+)
+REDACTED = "REDACTED"
+
+
+def fixed(seconds: float) -> Latency:
+    """Latency distribution always returning ``seconds``."""
+
+    return lambda rng: seconds
+
+
+def lognormal(median: float, p95: float) -> Latency:
+    """Right-skewed latency distribution with the given median and p95."""
+
+    mu = math.log(median)
+    sigma = (math.log(p95) - mu) / 1.645
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def _redact(route: str) -> str:
+    """Replace the values of :data:`SECRET_PARAMS` in the query of ``route``.
+
+    Other parameters keep their original encoding and order, and a redacted
+    route matches recordings made with any key.
+    """
+
+    path, sep, query = route.partition("?")
+    if not sep:
+        return route
+    pairs = []
+    for pair in query.split("&"):
+        name, eq, _ = pair.partition("=")
+        if eq and unquote_plus(name).lower() in SECRET_PARAMS:
+            pair = f"{name}={REDACTED}"
+        pairs.append(pair)
+    return f"{path}?{'&'.join(pairs)}"
+
+
+def _route(request: httpx.Request) -> str:
+    """Host-independent lookup key, so recordings replay under any base URL.
+
+    Credentials in the query string are redacted, see :func:`_redact`.
+    """
+
+    return _redact(f"{request.method} {request.url.raw_path.decode()}")
+
+
+@dataclass(frozen=True)
+class Exchange:
+    """One recorded provider response."""
+
+    route: str
+    status_code: int
+    headers: Tuple[Tuple[str, str], ...]
+    body: str
+
+    def to_response(self) -> httpx.Response:
+        return httpx.Response(
+            self.status_code, headers=list(self.headers), content=self.body.encode()
+        )
+
+
+@dataclass
+class Cassette:
+    """Recorded exchanges, replayed in order per route and then cycled."""
+
+    exchanges: List[Exchange] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Cassette":
+        exchanges = []
+        for line in Path(path).read_text().splitlines():
+            if line.strip():
+                data = json.loads(line)
+                headers = tuple((key, value) for key, value in data["headers"])
+                exchanges.append(
+                    Exchange(_redact(data["route"]), data["status"], headers, data["body"])
+                )
+        return cls(exchanges)
+
+    def save(self, path: str | Path) -> None:
+        lines = [
+            json.dumps(
+                {
+                    "route": exchange.route,
+                    "status": exchange.status_code,
+                    "headers": exchange.headers,
+                    "body": exchange.body,
+                }
+            )
+            for exchange in self.exchanges
+        ]
+        Path(path).write_text("".join(line + "\n" for line in lines))
+
+    def add(self, route: str, response: httpx.Response) -> None:
+        headers = tuple(
+            (name, response.headers[name])
+            for name in RECORDED_HEADERS
+            if name in response.headers
+        )
+        self.exchanges.append(
+            Exchange(_redact(route), response.status_code, headers, response.text)
+        )
+
+    def by_route(self) -> Dict[str, List[Exchange]]:
+        routes: Dict[str, List[Exchange]] = {}
+        for exchange in self.exchanges:
+            routes.setdefault(exchange.route, []).append(exchange)
+        return routes
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Forward requests to ``transport`` and record every response."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cassette: Cassette) -> None:
+        self.transport = transport
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        self.cassette.add(_route(request), response)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+@dataclass
+class ChaosProfile:
+    """Failure injection rates for :class:`ReplayTransport`.
+
+    Parameters
+    ----------
+    latency:
+        Distribution of the delay added to every answered request.
+    throttle_rate:
+        Probability of an injected ``429``.
+    retry_after:
+        ``Retry-After`` seconds sent with injected ``429`` responses.
+    burst_rate:
+        Probability that a request starts a ``5xx`` burst.
+    burst_length:
+        Consecutive requests failed by one burst.
+    burst_status:
+        Status code returned during a burst.
+    timeout_rate:
+        Probability that a request times out.
+    timeout:
+        Seconds slept before raising :class:`httpx.ReadTimeout`.
+    """
+
+    latency: Latency = fixed(0.0)
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0
+    burst_rate: float = 0.0
+    burst_length: int = 5
+    burst_status: int = 503
+    timeout_rate: float = 0.0
+    timeout: float = 5.0
+
+
+class _Window:
+    """Sliding request log enforcing ``limit`` requests per ``seconds``."""
+
+    def __init__(self, limit: float, seconds: float) -> None:
+        self.limit = limit
+        self.seconds = seconds
+        self.log: Deque[float] = deque()
+
+    def retry_after(self, now: float) -> float:
+        while self.log and self.log[0] <= now - self.seconds:
+            self.log.popleft()
+        if len(self.log) < self.limit:
+            return 0.0
+        return self.log[0] + self.seconds - now
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serve a :class:`Cassette` like a rate-limited, flaky provider.
+
+    Parameters
+    ----------
+    cassette:
+        Recorded responses; unknown routes get ``404``.
+    provider:
+        Provider whose budget is enforced.
+    budget:
+        Ceilings to enforce instead of the provider's default budget.
+    chaos:
+        Failure injection settings.
+    seed:
+        Seed making latency and failure injection reproducible.
+    time_func, sleep:
+        Clock and sleep used for budgets and latency; swap both for a
+        virtual clock to compress long soak runs.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        *,
+        provider: str,
+        budget: Optional[ProviderBudget] = None,
+        chaos: Optional[ChaosProfile] = None,
+        seed: int = 0,
+        time_func: Callable[[], float] | None = None,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.routes = cassette.by_route()
+        self.provider = provider
+        budget = budget or DEFAULT_BUDGETS.get(provider, ProviderBudget())
+        periods = (
+            (budget.per_sec, 1.0),
+            (budget.per_min, 60.0),
+            (budget.per_day, 86400.0),
+        )
+        self.windows = [_Window(limit, seconds) for limit, seconds in periods if limit]
+        self.chaos = chaos or ChaosProfile()
+        self.rng = random.Random(seed)
+        self.time = time_func or time.monotonic
+        self.sleep = sleep
+        self.outcomes: Counter[str] = Counter()
+        self._cursor: Counter[str] = Counter()
+        self._burst_left = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        now = self.time()
+        wait = max((window.retry_after(now) for window in self.windows), default=0.0)
+        if wait > 0:
+            # Like the real providers, rejected calls do not consume budget.
+            return self._throttled("over_budget", wait, request)
+        for window in self.windows:
+            window.log.append(now)
+
+        chaos = self.chaos
+        if self._burst_left == 0 and self.rng.random() < chaos.burst_rate:
+            self._burst_left = chaos.burst_length
+        if self._burst_left > 0:
+            self._burst_left -= 1
+            self.outcomes["burst"] += 1
+            return httpx.Response(chaos.burst_status, request=request)
+        if self.rng.random() < chaos.throttle_rate:
+            return self._throttled("throttled", chaos.retry_after, request)
+        if self.rng.random() < chaos.timeout_rate:
+            self.outcomes["timeout"] += 1
+            await self.sleep(chaos.timeout)
+            raise httpx.ReadTimeout("replayed timeout", request=request)
+
+        await self.sleep(chaos.latency(self.rng))
+        route = _route(request)
+        exchanges = self.routes.get(route)
+        if not exchanges:
+            self.outcomes["not_found"] += 1
+            return httpx.Response(404, request=request)
+        exchange = exchanges[self._cursor[route] % len(exchanges)]
+        self._cursor[route] += 1
+        self.outcomes["ok"] += 1
+        response = exchange.to_response()
+        response.request = request
+        return response
+
+    def _throttled(self, outcome: str, seconds: float, request: httpx.Request) -> httpx.Response:
+        self.outcomes[outcome] += 1
+        return httpx.Response(
+            429, headers={"Retry-After": str(math.ceil(seconds))}, request=request
+        )
+
+
+__all__ = [
+    "Cassette",
+    "ChaosProfile",
+    "Exchange",
+    "REDACTED",
+    "RecordingTransport",
+    "ReplayTransport",
+    "SECRET_PARAMS",
+    "fixed",
+    "lognormal",
+]
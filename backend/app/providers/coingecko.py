@@ -1,12 +1,27 @@
-"""CoinGecko provider client with simple JSON parsing."""
+"""CoinGecko provider client with columnar candle decoding and batched quotes."""
 
 from __future__ import annotations
 
+import asyncio
+import json
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence
 
 import httpx
-from app.main import Candle
+from app.candles import Candle, CandleColumns, decode_candles
+from app.http_pool import provider_client
+from app.main import Quote
+from app.provider_cache import Codec, model_codec, provider_cache
+from app.single_flight import single_flight
+
+_CANDLE_CODEC: Codec[CandleColumns] = Codec(
+    lambda columns: json.dumps(columns.to_rows()).encode(),
+    lambda raw: decode_candles(json.loads(raw), source="coingecko"),
+)
+
+_QUOTE_CODEC: Codec[Quote] = model_codec(Quote)
+# Ids per ``/simple/price`` call; keeps the query string well under URL limits.
+QUOTE_BATCH_SIZE = 250
 
 
 @dataclass
@@ -25,22 +40,95 @@ class CoinGeckoClient:
     transport: Optional[httpx.BaseTransport] = None
 
     async def get_candles(self, asset_id: str) -> List[Candle]:
-        """Fetch OHLCV candles for the given asset.
+        """Fetch OHLCV candles for the given asset as ``Candle`` models.
+
+        See :meth:`get_candle_columns`; models are built from the columns.
+        """
+
+        return (await self.get_candle_columns(asset_id)).to_models()
+
+    async def get_candle_columns(self, asset_id: str) -> CandleColumns:
+        """Fetch OHLCV candles for the given asset as columns.
 
         Notes
         -----
         This implementation assumes the upstream response JSON already matches the
         ``Candle`` schema except for the missing ``source`` field which is
-        injected for provenance tracking.
+        injected for provenance tracking. Results are served through the
+        provider cache and concurrent requests for the same asset share one
+        upstream call.
         """
 
+        return await provider_cache.get(
+            "coingecko",
+            "candles",
+            {"base_url": self.base_url, "asset_id": asset_id},
+            lambda: single_flight.do(
+                ("coingecko", self.base_url, "candles", asset_id),
+                lambda: self._fetch_candles(asset_id),
+            ),
+            _CANDLE_CODEC,
+        )
+
+    async def _fetch_candles(self, asset_id: str) -> CandleColumns:
         url = f"{self.base_url}/candles/{asset_id}"
-        async with httpx.AsyncClient(transport=self.transport) as client:
+        async with provider_client("coingecko", self.transport) as client:
             response = await client.get(url, timeout=5.0)
         response.raise_for_status()
-        data = response.json()
-        candles: List[Candle] = []
-        for item in data:
-            item.setdefault("source", "coingecko")  # ensure provider provenance
-            candles.append(Candle(**item))
-        return candles
+        return decode_candles(response.json(), source="coingecko")
+
+    async def get_quotes(self, ids: Sequence[str], vs_currency: str = "usd") -> Dict[str, Quote]:
+        """Fetch the latest quote of every CoinGecko id in ``ids``.
+
+        Cached quotes are read in one round trip and all remaining ids are
+        fetched together from ``/simple/price``, split into calls of at most
+        :data:`QUOTE_BATCH_SIZE` ids. Ids CoinGecko does not know are left out
+        of the result.
+        """
+
+        return await provider_cache.get_many(
+            "coingecko",
+            "quotes",
+            {
+                provider_id: {"base_url": self.base_url, "id": provider_id, "vs": vs_currency}
+                for provider_id in ids
+            },
+            lambda missing: self._fetch_quotes(missing, vs_currency),
+            _QUOTE_CODEC,
+        )
+
+    async def _fetch_quotes(self, ids: List[str], vs_currency: str) -> Dict[str, Quote]:
+        chunks = [ids[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(ids), QUOTE_BATCH_SIZE)]
+        async with provider_client("coingecko", self.transport) as client:
+            payloads = await asyncio.gather(
+                *(self._fetch_quote_chunk(client, chunk, vs_currency) for chunk in chunks)
+            )
+        quotes: Dict[str, Quote] = {}
+        for payload in payloads:
+            for provider_id, data in payload.items():
+                if vs_currency not in data:
+                    continue
+                quotes[provider_id] = Quote(
+                    price=data[vs_currency],
+                    change_24h=data.get(f"{vs_currency}_24h_change"),
+                    volume_24h=data.get(f"{vs_currency}_24h_vol"),
+                    asof=data.get("last_updated_at", 0),
+                )
+        return quotes
+
+    async def _fetch_quote_chunk(
+        self, client: httpx.AsyncClient, ids: List[str], vs_currency: str
+    ) -> dict:
+        response = await client.get(
+            f"{self.base_url}/simple/price",
+            params={
+                "ids": ",".join(ids),
+                "vs_currencies": vs_currency,
+                "include_24hr_change": "true",
+                "include_24hr_vol": "true",
+                "include_last_updated_at": "true",
+            },
+            timeout=5.0,
+        )
+        response.raise_for_status()
+        return response.json()
@@ -6,7 +6,12 @@ from dataclasses import dataclass
 from typing import Optional
 
 import httpx
+from app.http_pool import provider_client
 from app.main import GasPrices
+from app.provider_cache import model_codec, provider_cache
+from app.single_flight import single_flight
+
+_GAS_CODEC = model_codec(GasPrices)
 
 
 @dataclass
@@ -17,10 +22,38 @@ class EtherscanClient:
     transport: Optional[httpx.BaseTransport] = None
 
     async def get_gas_prices(self) -> GasPrices:
-        """Return gas price information from Etherscan."""
-
+        """Return gas price information from Etherscan.
+
+        Served through the provider cache; concurrent callers share one
+        upstream call.
+        """
+
+        return await provider_cache.get(
+            "etherscan",
+            "gas",
+            {"base_url": self.base_url},
+            lambda: single_flight.do(
+                ("etherscan", self.base_url, "gas"), self._fetch_gas_prices
+            ),
+            _GAS_CODEC,
+        )
+
+    async def refresh_gas_prices(self) -> GasPrices:
+        """Call the provider and store the result in the provider cache.
+
+        Meant for background pollers: the caller has already spent a rate
+        limit token, and readers of the cache get the value just fetched.
+        """
+
+        value = await single_flight.do(
+            ("etherscan", self.base_url, "gas"), self._fetch_gas_prices
+        )
+        await provider_cache.put("etherscan", "gas", {"base_url": self.base_url}, value, _GAS_CODEC)
+        return value
+
+    async def _fetch_gas_prices(self) -> GasPrices:
         url = f"{self.base_url}/gas"
-        async with httpx.AsyncClient(transport=self.transport) as client:
+        async with provider_client("etherscan", self.transport) as client:
             response = await client.get(url, timeout=5.0)
         response.raise_for_status()
         data = response.json()
@@ -1,17 +1,106 @@
-"""FX rate client with timeout, retry, and circuit breaker logic."""
+"""FX rate client with timeout, retry, and circuit breaker logic.
+
+Rates are fetched in batches: concurrent ``get_rates``/``get_rate`` calls for
+the same base currency within ``batch_window`` seconds share one upstream
+request for the union of their quotes. Rates are cached per ``(base, quote)``
+pair, so a pair cached by one batch is served to any later batch containing
+it and only the missing pairs go upstream. While the primary provider's breaker
+is open, an optional ECB end-of-day fallback (Frankfurter) answers instead;
+those quotes carry ``drift_bps`` against the last intraday rate and the
+``DELAYED_FX`` flag above :data:`DRIFT_THRESHOLD_BPS`, per the price/FX
+annotation contract.
+"""
 
 from __future__ import annotations
 
 import asyncio
+import json
 import time
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Dict, Iterable, List, Optional, Set, Tuple
 
 import httpx
 
+from app.http_pool import provider_client
+from app.provider_cache import CachedUpstreamError, Codec, provider_cache
+from app.rate_limiting.circuit_breaker import CircuitBreaker, CircuitBreakerOpen
+from app.single_flight import single_flight
+
+DRIFT_THRESHOLD_BPS = 25.0
+DELAYED_FX = "DELAYED_FX"
+
+
+@dataclass(frozen=True)
+class FXQuote:
+    """One FX rate with its provenance.
+
+    ``drift_bps`` is only set for fallback rates with a known intraday rate.
+    """
+
+    base: str
+    quote: str
+    rate: float
+    fx_source: str
+    asof: float
+    drift_bps: Optional[float] = None
+    flags: Tuple[str, ...] = ()
 
-class CircuitBreakerOpen(Exception):
-    """Raised when the circuit breaker is open and calls are blocked."""
+    def annotation(self) -> dict:
+        """Return the FX fields of the price/FX annotation schema."""
+
+        return {
+            "fx_source": self.fx_source,
+            "fx_rate": self.rate,
+            "drift_bps": self.drift_bps,
+            "flags": list(self.flags),
+        }
+
+
+@dataclass
+class FrankfurterClient:
+    """ECB end-of-day rates from a Frankfurter-compatible API.
+
+    Parameters
+    ----------
+    base_url: str
+        Base URL for the Frankfurter service.
+    timeout: float
+        Request timeout in seconds.
+    transport: Optional[httpx.BaseTransport]
+        Optional custom transport for testing/mocking.
+    """
+
+    base_url: str = "https://api.frankfurter.app"
+    timeout: float = 5.0
+    transport: Optional[httpx.BaseTransport] = None
+    source: str = "frankfurter"
+
+    async def get_rates(self, base: str, quotes: Iterable[str]) -> Tuple[Dict[str, float], float]:
+        """Return ``({quote: rate}, asof)`` for the latest ECB reference day."""
+
+        symbols = ",".join(quotes)
+        url = f"{self.base_url}/latest?from={base}&to={symbols}"
+        async with provider_client(self.source, self.transport) as client:
+            response = await client.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        day = datetime.strptime(data["date"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        return {quote: float(rate) for quote, rate in data["rates"].items()}, day.timestamp()
+
+
+def _load_quote(raw: bytes) -> FXQuote:
+    fields = json.loads(raw)
+    return FXQuote(**{**fields, "flags": tuple(fields["flags"])})
+
+
+_QUOTE_CODEC: Codec[FXQuote] = Codec(lambda fx: json.dumps(asdict(fx)).encode(), _load_quote)
+
+
+@dataclass
+class _Batch:
+    quotes: Set[str] = field(default_factory=set)
+    future: Optional[asyncio.Future] = None
 
 
 @dataclass
@@ -29,9 +118,22 @@ class FXClient:
     breaker_threshold: int
         Consecutive failures to open the circuit breaker.
     reset_timeout: float
-        Seconds after which an open breaker resets.
+        Seconds after which an open breaker admits a probe call.
     transport: Optional[httpx.BaseTransport]
         Optional custom transport for testing/mocking.
+    breaker: Optional[CircuitBreaker]
+        Optional breaker to use instead of a per-client one, e.g. one shared
+        across processes through a
+        :class:`~app.rate_limiting.breaker_store.RedisBreakerStore`.
+    fallback: Optional[FrankfurterClient]
+        End-of-day client used while the breaker is open or a recent
+        failure is negatively cached.
+    batch_window: float
+        Seconds to collect quotes for one base before fetching them together.
+        The default ``0`` batches callers arriving in the same event loop
+        iteration, e.g. under :func:`asyncio.gather`.
+    source: str
+        ``fx_source`` recorded for primary rates.
     """
 
     base_url: str
@@ -40,19 +142,22 @@ class FXClient:
     breaker_threshold: int = 5
     reset_timeout: float = 60.0
     transport: Optional[httpx.BaseTransport] = None
+    breaker: Optional[CircuitBreaker] = None
+    fallback: Optional[FrankfurterClient] = None
+    batch_window: float = 0.0
+    source: str = "exchangerate.host"
 
-    _failures: int = 0
-    _opened_at: Optional[float] = None
-
-    def _breaker_open(self) -> bool:
-        """Return True if breaker is currently open."""
-        if self._opened_at is None:
-            return False
-        if time.time() - self._opened_at > self.reset_timeout:
-            self._failures = 0
-            self._opened_at = None
-            return False
-        return True
+    def __post_init__(self) -> None:
+        if self.breaker is None:
+            self.breaker = CircuitBreaker(
+                self.breaker_threshold,
+                self.reset_timeout,
+                # Looked up on each call so the wall clock can be patched.
+                time_func=lambda: time.time(),
+            )
+        self._pending: Dict[str, _Batch] = {}
+        self._flushes: Set[asyncio.Task] = set()  # strong refs until each batch resolves
+        self._intraday: Dict[Tuple[str, str], float] = {}
 
     async def get_rate(self, base: str, quote: str) -> float:
         """Fetch FX rate from base to quote.
@@ -60,40 +165,142 @@ class FXClient:
         Raises
         ------
         CircuitBreakerOpen
-            If the circuit breaker is open.
+            If the circuit breaker is open and no fallback is configured.
+        CachedUpstreamError
+            If the last primary call failed recently and no fallback is
+            configured.
         httpx.RequestError
             On network-related errors.
         httpx.HTTPStatusError
             If the response status is not 200.
         KeyError
-            If the expected rate field is missing.
+            If the provider has no rate for ``quote``.
+        """
+
+        return (await self.get_rates(base, [quote]))[quote].rate
+
+    async def get_rates(self, base: str, quotes: Iterable[str]) -> Dict[str, FXQuote]:
+        """Fetch several quotes for ``base``, batched with concurrent callers.
+
+        Raises the same errors as :meth:`get_rate`.
         """
 
-        if self._breaker_open():
-            raise CircuitBreakerOpen("circuit breaker open")
+        wanted = list(dict.fromkeys(quotes))
+        batch = self._pending.get(base)
+        if batch is None:
+            batch = _Batch(future=asyncio.get_running_loop().create_future())
+            self._pending[base] = batch
+            task = asyncio.create_task(self._flush(base, batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        batch.quotes.update(wanted)
+        rates = await asyncio.shield(batch.future)
+        # Only the caller asking for an unknown quote fails, not its batch.
+        unknown = [quote for quote in wanted if quote not in rates]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        return {quote: rates[quote] for quote in wanted}
 
-        url = f"{self.base_url}/latest?base={base}&symbols={quote}"
+    async def _flush(self, base: str, batch: _Batch) -> None:
+        """Fetch every quote collected in ``batch`` once the window closes."""
+
+        await asyncio.sleep(self.batch_window)
+        if self._pending.get(base) is batch:
+            del self._pending[base]
+        try:
+            rates = await self._resolve(base, tuple(sorted(batch.quotes)))
+        except Exception as exc:  # shared with every caller of the batch
+            batch.future.set_exception(exc)
+            batch.future.exception()  # retrieved even if every caller left
+        else:
+            batch.future.set_result(rates)
+
+    async def _resolve(self, base: str, quotes: Tuple[str, ...]) -> Dict[str, FXQuote]:
+        def fetch(missing: List[str]) -> Awaitable[Dict[str, FXQuote]]:
+            pairs = tuple(missing)
+            return single_flight.do(
+                ("fx", self.base_url, base, pairs),
+                lambda: self.breaker.call(lambda: self._fetch_rates(base, pairs)),
+            )
+
+        try:
+            return await provider_cache.get_many(
+                "fx",
+                "fx",
+                {
+                    quote: {"base_url": self.base_url, "base": base, "quote": quote}
+                    for quote in quotes
+                },
+                fetch,
+                _QUOTE_CODEC,
+            )
+        except (CircuitBreakerOpen, CachedUpstreamError):
+            if self.fallback is None:
+                raise
+            return await self._fetch_fallback(base, quotes)
+
+    async def _fetch_rates(self, base: str, quotes: Tuple[str, ...]) -> Dict[str, FXQuote]:
+        """Fetch rates with retries; one breaker failure per exhausted call.
+
+        Quotes the provider does not know are left out of the result rather
+        than failing the call, so they never count against the breaker.
+        """
+
+        url = f"{self.base_url}/latest?base={base}&symbols={','.join(quotes)}"
         last_exc: Exception | None = None
 
-        for _ in range(self.retries):
-            try:
-                async with httpx.AsyncClient(transport=self.transport) as client:
+        async with provider_client("fx", self.transport) as client:
+            for _ in range(self.retries):
+                try:
                     response = await client.get(url, timeout=self.timeout)
-                response.raise_for_status()
-                data = response.json()
-                rate = float(data["rates"][quote])
-                # Reset failure count on success
-                self._failures = 0
-                self._opened_at = None
-                return rate
-            except (httpx.RequestError, httpx.HTTPStatusError, KeyError) as exc:
-                last_exc = exc
-                # Yield control to allow cooperative multitasking
-                await asyncio.sleep(0)
-
-        # All retries exhausted -> record failure
-        self._failures += 1
-        if self._failures >= self.breaker_threshold:
-            self._opened_at = time.time()
-        assert last_exc is not None
-        raise last_exc
+                    response.raise_for_status()
+                    data = response.json()
+                    known = data["rates"]
+                    rates = {quote: float(known[quote]) for quote in quotes if quote in known}
+                    break
+                except (httpx.RequestError, httpx.HTTPStatusError, KeyError) as exc:
+                    last_exc = exc
+                    # Yield control to allow cooperative multitasking
+                    await asyncio.sleep(0)
+            else:
+                assert last_exc is not None
+                raise last_exc
+
+        asof = time.time()
+        for quote, rate in rates.items():
+            self._intraday[base, quote] = rate
+        return {
+            quote: FXQuote(base, quote, rate, self.source, asof)
+            for quote, rate in rates.items()
+        }
+
+    async def _fetch_fallback(self, base: str, quotes: Tuple[str, ...]) -> Dict[str, FXQuote]:
+        """Fetch end-of-day rates, annotated with drift against intraday rates."""
+
+        rates, asof = await self.fallback.get_rates(base, quotes)
+        result: Dict[str, FXQuote] = {}
+        for quote in quotes:
+            if quote not in rates:
+                continue
+            rate = rates[quote]
+            intraday = self._intraday.get((base, quote))
+            drift: Optional[float] = None
+            flags: List[str] = []
+            if intraday:
+                drift = abs(rate - intraday) / intraday * 10_000
+                if drift > DRIFT_THRESHOLD_BPS:
+                    flags.append(DELAYED_FX)
+            result[quote] = FXQuote(
+                base, quote, rate, self.fallback.source, asof, drift, tuple(flags)
+            )
+        return result
+
+
+__all__ = [
+    "CircuitBreakerOpen",
+    "DELAYED_FX",
+    "DRIFT_THRESHOLD_BPS",
+    "FXClient",
+    "FXQuote",
+    "FrankfurterClient",
+]
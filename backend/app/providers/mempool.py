@@ -6,7 +6,12 @@ from dataclasses import dataclass
 from typing import Optional
 
 import httpx
+from app.http_pool import provider_client
 from app.main import MempoolData
+from app.provider_cache import model_codec, provider_cache
+from app.single_flight import single_flight
+
+_MEMPOOL_CODEC = model_codec(MempoolData)
 
 
 @dataclass
@@ -17,10 +22,40 @@ class MempoolSpaceClient:
     transport: Optional[httpx.BaseTransport] = None
 
     async def get_mempool(self) -> MempoolData:
-        """Return mempool statistics from mempool.space."""
-
+        """Return mempool statistics from mempool.space.
+
+        Served through the provider cache; concurrent callers share one
+        upstream call.
+        """
+
+        return await provider_cache.get(
+            "mempool_space",
+            "mempool",
+            {"base_url": self.base_url},
+            lambda: single_flight.do(
+                ("mempool_space", self.base_url, "mempool"), self._fetch_mempool
+            ),
+            _MEMPOOL_CODEC,
+        )
+
+    async def refresh_mempool(self) -> MempoolData:
+        """Call the provider and store the result in the provider cache.
+
+        Meant for background pollers: the caller has already spent a rate
+        limit token, and readers of the cache get the value just fetched.
+        """
+
+        value = await single_flight.do(
+            ("mempool_space", self.base_url, "mempool"), self._fetch_mempool
+        )
+        await provider_cache.put(
+            "mempool_space", "mempool", {"base_url": self.base_url}, value, _MEMPOOL_CODEC
+        )
+        return value
+
+    async def _fetch_mempool(self) -> MempoolData:
         url = f"{self.base_url}/mempool"
-        async with httpx.AsyncClient(transport=self.transport) as client:
+        async with provider_client("mempool_space", self.transport) as client:
             response = await client.get(url, timeout=5.0)
         response.raise_for_status()
         data = response.json()
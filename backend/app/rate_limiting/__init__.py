@@ -2,29 +2,100 @@
 
 from __future__ import annotations
 
-from typing import Callable, Dict, Optional
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Mapping, Optional, Tuple
 
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
 from .adaptive_clamps import AdaptiveClamp
-from .circuit_breaker import CircuitBreaker, CircuitBreakerOpen, CircuitState
-from .token_bucket import TokenBucket
+from .admission import AdmissionQueue, Priority
+from .breaker_store import RedisBreakerStore
+from .circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakerOpen,
+    CircuitState,
+    FailureRateBreaker,
+)
+from .leases import TokenLease
+from .token_bucket import (
+    TokenBucket,
+    acquire_all,
+    acquire_all_async,
+    release_all,
+    release_all_async,
+)
 from .provider_budgets import DEFAULT_BUDGETS, ProviderBudget
 
 __all__ = [
     "AdaptiveClamp",
+    "AdmissionQueue",
     "CircuitBreaker",
     "CircuitBreakerOpen",
     "CircuitState",
+    "FailureRateBreaker",
+    "Priority",
+    "RedisBreakerStore",
     "TokenBucket",
+    "TokenLease",
     "init",
     "acquire",
+    "acquire_async",
+    "acquire_all",
+    "acquire_all_async",
+    "set_async_client",
+    "start_freeze_listener",
+    "stop_freeze_listener",
+    "refund",
+    "refund_async",
+    "release_leases",
+    "release_leases_async",
+    "fallback_bucket_count",
+    "observe_response",
+    "observe_response_async",
+    "unfreeze",
+    "update_budget",
     "adjust_clamp",
 ]
 
-_buckets: Dict[tuple[str, str], TokenBucket] = {}
+Window = Tuple[TokenBucket, str]
+
+# Per-provider ``(bucket, redis_key)`` windows, built once in :func:`init` so
+# an acquire only touches the buckets of its own provider.
+_windows: Dict[str, Tuple[Window, ...]] = {}
+# Providers in lease mode spend from a process-local lease instead.
+_leases: Dict[str, TokenLease] = {}
+_lease_ttls: Dict[str, float] = {}
 _budgets: Dict[str, ProviderBudget] = DEFAULT_BUDGETS.copy()
 _clamp = AdaptiveClamp()
+_redis: Optional[Redis] = None
+_async_redis: Optional[AsyncRedis] = None
+_time_func: Callable[[], float] | None = None
+
+
+def _build_windows(provider: str, budget: ProviderBudget) -> Tuple[Window, ...]:
+    """Create the token bucket windows enforcing ``budget`` for ``provider``."""
+
+    periods = (
+        ("per_sec", budget.per_sec, 1.0),
+        ("per_min", budget.per_min, 60.0),
+        ("per_day", budget.per_day, 86400.0),
+    )
+    return tuple(
+        (
+            TokenBucket(
+                _redis,
+                capacity=float(limit),
+                refill_rate=float(limit) / seconds,
+                time_func=_time_func,
+            ),
+            f"{provider}:{period}",
+        )
+        for period, limit, seconds in periods
+        if limit
+    )
 
 
 def init(
@@ -32,65 +103,263 @@ def init(
     budgets: Dict[str, ProviderBudget] | None = None,
     *,
     time_func: Callable[[], float] | None = None,
+    async_client: AsyncRedis | None = None,
+    leases: Mapping[str, float] | None = None,
 ) -> None:
     """Initialize token buckets for all providers.
 
     ``budgets`` may override the default :data:`DEFAULT_BUDGETS` mapping.
+    ``async_client`` enables non-blocking I/O for :func:`acquire_async`; it
+    should share its connection pool across the whole process. ``leases``
+    maps hot providers to a lease TTL in seconds; their tokens are reserved
+    in batches and spent locally (see :class:`TokenLease`).
     """
 
-    global _buckets, _budgets
-    _buckets = {}
-    _budgets = budgets or DEFAULT_BUDGETS
+    global _windows, _budgets, _clamp, _redis, _async_redis, _time_func
+    _redis = redis_client
+    _async_redis = async_client
+    _time_func = time_func
+    _clamp.stop()
+    _clamp = AdaptiveClamp(
+        time_func=time_func, redis_client=redis_client, on_freeze=_drain_lease
+    )
+    _budgets = dict(budgets or DEFAULT_BUDGETS)
+    _lease_ttls.clear()
+    _lease_ttls.update(leases or {})
+    _windows = {}
+    _leases.clear()
     for provider, budget in _budgets.items():
-        if budget.per_sec:
-            _buckets[(provider, "per_sec")] = TokenBucket(
-                redis_client,
-                capacity=float(budget.per_sec),
-                refill_rate=float(budget.per_sec),
-                time_func=time_func,
-            )
-        if budget.per_min:
-            _buckets[(provider, "per_min")] = TokenBucket(
-                redis_client,
-                capacity=float(budget.per_min),
-                refill_rate=float(budget.per_min) / 60.0,
-                time_func=time_func,
-            )
-        if budget.per_day:
-            _buckets[(provider, "per_day")] = TokenBucket(
-                redis_client,
-                capacity=float(budget.per_day),
-                refill_rate=float(budget.per_day) / 86400.0,
-                time_func=time_func,
-            )
+        _install(provider, budget)
+
+
+def _install(provider: str, budget: ProviderBudget) -> None:
+    """Build windows (and a lease, if configured) for one provider."""
+
+    windows = _build_windows(provider, budget)
+    _windows[provider] = windows
+    ttl = _lease_ttls.get(provider)
+    if ttl and windows:
+        _leases[provider] = TokenLease(windows, ttl=ttl, guard=_clamp.guard(provider))
+
+
+def _drain_lease(provider: str) -> None:
+    """Return the leased tokens of a provider another process froze."""
+
+    lease = _leases.get(provider)
+    if lease is None:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        lease.release()
+        return
+    if _async_redis is None:
+        lease._spawn(asyncio.to_thread(lease.release))
+    else:
+        lease.release_soon(_async_redis)
+
+
+def start_freeze_listener(poll_interval: float = 0.1) -> None:
+    """Apply freezes set by any process as they happen, draining local leases.
+
+    Call from the event loop that serves :func:`acquire_async`; without the
+    listener a lease keeps spending for up to its TTL after a remote freeze.
+    """
+
+    _clamp.start(poll_interval)
+
+
+def stop_freeze_listener() -> None:
+    """Stop the listener started by :func:`start_freeze_listener`."""
+
+    _clamp.stop()
+
+
+def set_async_client(client: AsyncRedis | None) -> None:
+    """Attach or detach the asyncio client used by :func:`acquire_async`.
+
+    Pass ``None`` before the client is closed on shutdown.
+    """
+
+    global _async_redis
+    _async_redis = client
+
+
+# Hook for Operator Console budget edits.
+def update_budget(provider: str, budget: ProviderBudget | None) -> None:
+    """Replace (or remove, when ``budget`` is ``None``) one provider's budget.
+
+    Only the windows of ``provider`` are rebuilt; other providers keep their
+    bucket handles. Bucket state in Redis is preserved and capped to the new
+    capacity on the next acquire.
+    """
+
+    if _redis is None:  # pragma: no cover - defensive
+        raise RuntimeError("token buckets not initialized")
+    lease = _leases.pop(provider, None)
+    if lease is not None:
+        lease.release()
+    if budget is None:
+        _budgets.pop(provider, None)
+        _windows.pop(provider, None)
+        return
+    _budgets[provider] = budget
+    _install(provider, budget)
 
 
 # Security: Public API to acquire tokens. Relies on prior :func:`init` call.
 def acquire(provider: str, route: str, tokens: float = 1.0) -> tuple[bool, float]:
     """Acquire tokens for ``provider``.
 
-    Returns tuple of ``(allowed, retry_after_seconds)``.
+    Every window of the provider is checked and debited together, so a
+    denial by one window (e.g. ``per_day``) does not consume tokens from the
+    others. A provider frozen by an upstream ``Retry-After`` or 403 is denied
+    until the freeze expires. Returns tuple of
+    ``(allowed, retry_after_seconds)``.
     """
 
-    if not _buckets:  # pragma: no cover - defensive
+    if _redis is None:  # pragma: no cover - defensive
         raise RuntimeError("token buckets not initialized")
 
+    frozen = _clamp.frozen_for(provider)
+    if frozen:
+        return False, frozen
     clamp = _clamp.get(provider)
     cost = tokens / clamp if clamp > 0 else float("inf")
-    retry_after = 0.0
-    allowed = True
-    for (prov, period), bucket in _buckets.items():
-        if prov != provider:
-            continue
-        key = f"{provider}:{period}"
-        ok, wait = bucket.acquire(key, cost)
-        if not ok:
-            allowed = False
-            retry_after = max(retry_after, wait)
-    return allowed, retry_after
+    lease = _leases.get(provider)
+    if lease is not None:
+        return lease.acquire(cost, clamp)
+    windows = _windows.get(provider)
+    if not windows:
+        return True, 0.0
+    return acquire_all(windows, cost, guard=_clamp.guard(provider))
+
+
+async def acquire_async(
+    provider: str, route: str, tokens: float = 1.0
+) -> tuple[bool, float]:
+    """Asyncio variant of :func:`acquire` with identical semantics.
+
+    Uses the ``async_client`` given to :func:`init`; without one the
+    blocking call is moved to a worker thread so the event loop never waits
+    on Redis.
+    """
+
+    if _redis is None:  # pragma: no cover - defensive
+        raise RuntimeError("token buckets not initialized")
+    if _async_redis is None:
+        return await asyncio.to_thread(acquire, provider, route, tokens)
+
+    frozen = _clamp.frozen_for(provider)
+    if frozen:
+        return False, frozen
+    clamp = _clamp.get(provider)
+    cost = tokens / clamp if clamp > 0 else float("inf")
+    lease = _leases.get(provider)
+    if lease is not None:
+        return await lease.acquire_async(_async_redis, cost, clamp)
+    windows = _windows.get(provider)
+    if not windows:
+        return True, 0.0
+    return await acquire_all_async(
+        _async_redis, windows, cost, guard=_clamp.guard(provider)
+    )
+
+
+def refund(provider: str, tokens: float = 1.0) -> None:
+    """Credit ``tokens`` back to every window of ``provider``, capped at capacity."""
+
+    windows = _windows.get(provider)
+    if windows:
+        release_all(windows, tokens)
+
+
+async def refund_async(provider: str, tokens: float = 1.0) -> None:
+    """Asyncio variant of :func:`refund`."""
+
+    if _async_redis is None:
+        await asyncio.to_thread(refund, provider, tokens)
+        return
+    windows = _windows.get(provider)
+    if windows:
+        await release_all_async(_async_redis, windows, tokens)
+
+
+def release_leases() -> None:
+    """Return unused leased tokens of every provider, e.g. on shutdown."""
+
+    for lease in _leases.values():
+        lease.release()
+
+
+async def release_leases_async() -> None:
+    """Asyncio variant of :func:`release_leases`."""
+
+    if _async_redis is None:
+        await asyncio.to_thread(release_leases)
+        return
+    for lease in _leases.values():
+        await lease.release_async(_async_redis)
+
+
+def fallback_bucket_count() -> int:
+    """Return the number of keys held by in-process fallback stores."""
+
+    return sum(
+        len(bucket.local_buckets)
+        for windows in _windows.values()
+        for bucket, _ in windows
+    )
 
 
 def adjust_clamp(provider: str, success: bool) -> float:
     """Adjust and return the clamp for ``provider``."""
 
     return _clamp.adjust(provider, success)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given as seconds or an HTTP date."""
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def observe_response(
+    provider: str, status_code: int, headers: Mapping[str, str] | None = None
+) -> None:
+    """Feed an upstream response into the provider clamp and freeze state.
+
+    ``429`` with ``Retry-After`` and ``403`` freeze the provider in every
+    process sharing the Redis state (see :meth:`AdaptiveClamp.observe`).
+    """
+
+    retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+    _clamp.observe(provider, status_code, retry_after)
+
+
+async def observe_response_async(
+    provider: str, status_code: int, headers: Mapping[str, str] | None = None
+) -> None:
+    """Asyncio variant of :func:`observe_response`."""
+
+    retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+    if _async_redis is None or _clamp.redis is None:
+        await asyncio.to_thread(_clamp.observe, provider, status_code, retry_after)
+        return
+    await _clamp.observe_async(_async_redis, provider, status_code, retry_after)
+
+
+# Hook for Operator Console
+def unfreeze(provider: str) -> None:
+    """Lift an upstream-triggered freeze of ``provider`` in every process."""
+
+    _clamp.unfreeze(provider)
@@ -5,19 +5,91 @@ It adjusts in 10%% steps between 50%% and 100%% with a 60 second cooldown
 between adjustments. Failures have twice the weight of successes (2x
 hysteresis) meaning it takes two successful adjustments to offset one
 failure.
+
+With a Redis client the clamp, cooldown and hysteresis counter live in a
+shared hash updated atomically by a Lua script, so every API worker and the
+worker process converge on one clamp. Upstream ``Retry-After`` headers and
+403 bans freeze a provider; the freeze key is checked inside the token bucket
+script, so every process honours it on its next acquire. Each new freeze is
+also published on :data:`FREEZE_CHANNEL`; with :meth:`AdaptiveClamp.start`
+running, other processes learn of it within the pub/sub delivery time and
+call ``on_freeze``, which drains their token leases instead of spending
+them until the next renewal. Without Redis (or when it fails) state is kept
+per process as before.
 """
 
 from __future__ import annotations
 
+import asyncio
+import threading
 import time
 from dataclasses import dataclass
-from typing import Callable, Dict
+from typing import Callable, Dict, Optional
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError
+
+from .token_bucket import LuaScript, ProviderGuard
 
 MIN_CLAMP = 0.5
 MAX_CLAMP = 1.0
 STEP = 0.1
 COOLDOWN = 60
 HYSTERESIS = 2  # two successes required to offset one failure
+FORBIDDEN_FREEZE = 900  # seconds a provider stays frozen after an HTTP 403
+FREEZE_CHANNEL = "ratelimit:freezes"
+
+# KEYS[1] = clamp hash; ARGV = now, success, min, max, step, cooldown,
+# hysteresis. Returns the new clamp as a string.
+ADJUST_SCRIPT = """
+local now = tonumber(ARGV[1])
+local success = tonumber(ARGV[2])
+local min_clamp = tonumber(ARGV[3])
+local max_clamp = tonumber(ARGV[4])
+local step = tonumber(ARGV[5])
+local cooldown = tonumber(ARGV[6])
+local hysteresis = tonumber(ARGV[7])
+local state = redis.call('HMGET', KEYS[1], 'clamp', 'last_adjust', 'counter')
+local clamp = tonumber(state[1]) or max_clamp
+local last_adjust = tonumber(state[2]) or (now - cooldown)
+local counter = tonumber(state[3]) or 0
+if success == 1 then
+  counter = counter + 1
+else
+  counter = counter - 2
+end
+if now - last_adjust >= cooldown then
+  if counter <= -hysteresis then
+    clamp = math.max(min_clamp, clamp - step)
+    counter = 0
+    last_adjust = now
+  elseif counter >= hysteresis then
+    clamp = math.min(max_clamp, clamp + step)
+    counter = 0
+    last_adjust = now
+  end
+end
+redis.call('HSET', KEYS[1], 'clamp', tostring(clamp),
+  'last_adjust', tostring(last_adjust), 'counter', tostring(counter))
+return tostring(clamp)
+"""
+
+# KEYS[1] = freeze key; ARGV = freeze duration in ms, channel, provider. Only
+# ever extends an existing freeze; an extension is published as "provider|ms".
+FREEZE_SCRIPT = """
+local ttl = redis.call('PTTL', KEYS[1])
+local ms = tonumber(ARGV[1])
+if ttl == -1 or ttl >= ms then
+  return ttl
+end
+redis.call('SET', KEYS[1], '1', 'PX', ms)
+redis.call('PUBLISH', ARGV[2], ARGV[3] .. '|' .. ms)
+return ms
+"""
+
+_adjust_script = LuaScript(ADJUST_SCRIPT)
+_freeze_script = LuaScript(FREEZE_SCRIPT)
 
 
 @dataclass
@@ -28,11 +100,36 @@ class State:
 
 
 class AdaptiveClamp:
-    """Adaptive clamp manager per provider."""
+    """Adaptive clamp manager per provider.
+
+    Parameters
+    ----------
+    time_func:
+        Optional time provider for tests; defaults to :func:`time.time`.
+    redis_client:
+        Optional Redis connection sharing clamp and freeze state across
+        processes.
+    on_freeze:
+        Called with the provider name whenever the listener started by
+        :meth:`start` learns of a freeze, including this process's own.
+    """
 
-    def __init__(self, *, time_func: Callable[[], float] | None = None) -> None:
+    def __init__(
+        self,
+        *,
+        time_func: Callable[[], float] | None = None,
+        redis_client: Optional[Redis] = None,
+        on_freeze: Optional[Callable[[str], None]] = None,
+    ) -> None:
         self.time = time_func or time.time
+        self.redis = redis_client
+        self.on_freeze = on_freeze
         self.states: Dict[str, State] = {}
+        self.frozen_until: Dict[str, float] = {}
+        self._guards: Dict[str, ProviderGuard] = {}
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
     # Security: No external input is trusted; provider names are assumed internal.
     def adjust(self, provider: str, success: bool) -> float:
@@ -52,11 +149,52 @@ class AdaptiveClamp:
         """
 
         now = self.time()
+        if self.redis is not None:
+            try:
+                raw = _adjust_script(self.redis, *self._adjust_args(provider, now, success))
+            except RedisError:
+                pass  # fall back to the per-process state below
+            else:
+                return self._set(provider, float(raw))
+        return self._adjust_local(provider, now, success)
+
+    async def adjust_async(
+        self, client: AsyncRedis, provider: str, success: bool
+    ) -> float:
+        """Asyncio variant of :meth:`adjust` using ``client`` for shared state."""
+
+        now = self.time()
+        try:
+            raw = await _adjust_script.run_async(
+                client, *self._adjust_args(provider, now, success)
+            )
+        except RedisError:
+            return self._adjust_local(provider, now, success)
+        return self._set(provider, float(raw))
+
+    def _adjust_args(self, provider: str, now: float, success: bool):
+        """``KEYS`` and ``ARGV`` for :data:`ADJUST_SCRIPT`."""
+
+        args = (now, int(success), MIN_CLAMP, MAX_CLAMP, STEP, COOLDOWN, HYSTERESIS)
+        return (f"{provider}:clamp",), args
+
+    def _state(self, provider: str, now: float) -> State:
         state = self.states.get(provider)
         if state is None:
             state = State(clamp=MAX_CLAMP, last_adjust=now - COOLDOWN, counter=0)
             self.states[provider] = state
+        return state
+
+    def _set(self, provider: str, clamp: float) -> float:
+        """Record a clamp value read from the shared state."""
+
+        self._state(provider, self.time()).clamp = clamp
+        return clamp
 
+    def _adjust_local(self, provider: str, now: float, success: bool) -> float:
+        """Per-process clamp adjustment used without (or on failure of) Redis."""
+
+        state = self._state(provider, now)
         state.counter += 1 if success else -2
 
         if now - state.last_adjust < COOLDOWN:
@@ -74,7 +212,177 @@ class AdaptiveClamp:
         return state.clamp
 
     def get(self, provider: str) -> float:
-        """Return current clamp for ``provider`` without modifying state."""
+        """Return current clamp for ``provider`` without modifying state.
+
+        This never does I/O; with Redis the value is refreshed from every
+        token bucket call made through :meth:`guard`.
+        """
 
         state = self.states.get(provider)
         return state.clamp if state else MAX_CLAMP
+
+    def guard(self, provider: str) -> Optional[ProviderGuard]:
+        """Return the bucket script guard for ``provider`` when Redis-backed."""
+
+        if self.redis is None:
+            return None
+        guard = self._guards.get(provider)
+        if guard is None:
+            guard = ProviderGuard(
+                f"{provider}:freeze",
+                f"{provider}:clamp",
+                lambda value: self._set(provider, value),
+            )
+            self._guards[provider] = guard
+        return guard
+
+    def freeze(self, provider: str, seconds: float) -> None:
+        """Block all calls to ``provider`` for ``seconds`` in every process.
+
+        An existing longer freeze is never shortened.
+        """
+
+        ms = self._freeze_local(provider, seconds)
+        if self.redis is not None:
+            try:
+                _freeze_script(self.redis, *self._freeze_args(provider, ms))
+            except RedisError:
+                pass  # the local freeze still protects this process
+
+    async def freeze_async(self, client: AsyncRedis, provider: str, seconds: float) -> None:
+        """Asyncio variant of :meth:`freeze` using ``client``."""
+
+        ms = self._freeze_local(provider, seconds)
+        try:
+            await _freeze_script.run_async(client, *self._freeze_args(provider, ms))
+        except RedisError:
+            pass  # the local freeze still protects this process
+
+    @staticmethod
+    def _freeze_args(provider: str, ms: int):
+        """``KEYS`` and ``ARGV`` for :data:`FREEZE_SCRIPT`."""
+
+        return (f"{provider}:freeze",), (ms, FREEZE_CHANNEL, provider)
+
+    def _freeze_local(self, provider: str, seconds: float) -> int:
+        """Record the freeze for this process; return its length in ms."""
+
+        until = self.time() + seconds
+        self.frozen_until[provider] = max(until, self.frozen_until.get(provider, 0.0))
+        return max(1, int(seconds * 1000))
+
+    def unfreeze(self, provider: str) -> None:
+        """Lift a freeze via operator control."""
+
+        self.frozen_until.pop(provider, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(f"{provider}:freeze")
+            except RedisError:
+                pass
+
+    def frozen_for(self, provider: str) -> float:
+        """Seconds left on this process's view of a freeze, ``0`` if none."""
+
+        until = self.frozen_until.get(provider)
+        if until is None:
+            return 0.0
+        remaining = until - self.time()
+        if remaining <= 0:
+            del self.frozen_until[provider]
+            return 0.0
+        return remaining
+
+    def start(
+        self, poll_interval: float = 0.1, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
+        """Start the pub/sub listener thread for freezes set by any process.
+
+        Freezes are applied on ``loop``, by default the running loop, where
+        acquires read them; without one they are applied from the listener
+        thread. A no-op without Redis.
+        """
+
+        if self.redis is None or self._thread is not None:
+            return
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        self._loop = loop
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{FREEZE_CHANNEL: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=poll_interval, daemon=True)
+
+    def stop(self) -> None:
+        """Stop the listener thread and close its connection."""
+
+        if self._thread is None:
+            return
+        self._thread.stop()
+        self._thread.join(timeout=1)
+        self._pubsub.close()
+        self._thread = None
+        self._pubsub = None
+        self._loop = None
+
+    def _on_message(self, message: dict) -> None:
+        data = message["data"]
+        try:
+            provider, ms = (data.decode() if isinstance(data, bytes) else data).split("|")
+            seconds = int(ms) / 1000
+        except ValueError:
+            return  # not a freeze event
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._apply_freeze, provider, seconds)
+                return
+            except RuntimeError:
+                pass  # loop closed; apply from this thread
+        self._apply_freeze(provider, seconds)
+
+    def _apply_freeze(self, provider: str, seconds: float) -> None:
+        """Record a published freeze and let the owner drain its leases."""
+
+        self._freeze_local(provider, seconds)
+        if self.on_freeze is not None:
+            self.on_freeze(provider)
+
+    def observe(
+        self, provider: str, status_code: int, retry_after: Optional[float] = None
+    ) -> None:
+        """Feed an upstream response outcome into the clamp and freeze state.
+
+        ``429`` lowers the clamp and freezes for ``retry_after`` seconds when
+        given; ``403`` freezes for :data:`FORBIDDEN_FREEZE`; other 2xx/3xx
+        responses count as successes. Server errors are left to the circuit
+        breaker.
+        """
+
+        if status_code == 403:
+            self.freeze(provider, FORBIDDEN_FREEZE)
+        elif status_code == 429:
+            self.adjust(provider, success=False)
+            if retry_after:
+                self.freeze(provider, retry_after)
+        elif status_code < 400:
+            self.adjust(provider, success=True)
+
+    async def observe_async(
+        self,
+        client: AsyncRedis,
+        provider: str,
+        status_code: int,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Asyncio variant of :meth:`observe` using ``client``."""
+
+        if status_code == 403:
+            await self.freeze_async(client, provider, FORBIDDEN_FREEZE)
+        elif status_code == 429:
+            await self.adjust_async(client, provider, success=False)
+            if retry_after:
+                await self.freeze_async(client, provider, retry_after)
+        elif status_code < 400:
+            await self.adjust_async(client, provider, success=True)
@@ -0,0 +1,234 @@
+"""Queued admission in front of the provider token buckets.
+
+Instead of rejecting a request the moment a bucket is empty, callers wait in
+a per-provider priority queue until a token is available or their deadline
+passes. One dispatcher task per provider hands tokens to waiters in priority
+order (interactive before backfill, FIFO within a priority), so throughput
+stays smooth right at the ceiling. The queue is bounded: when it is full a
+new request displaces the newest lower-priority waiter or is rejected. A
+token acquired for waiters that all gave up meanwhile is refunded.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MAX_DEPTH = 100
+DEFAULT_DEADLINE = 5.0
+MAX_DEADLINE = 30.0
+MAX_POLL_INTERVAL = 1.0  # longest dispatcher sleep between bucket checks
+
+AcquireFunc = Callable[[str, str, float], Awaitable[Tuple[bool, float]]]
+RefundFunc = Callable[[str, float], Awaitable[None]]
+
+
+class Priority(IntEnum):
+    """Admission priority; lower values are served first."""
+
+    INTERACTIVE = 0
+    BACKFILL = 1
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    future: asyncio.Future = field(compare=False)
+    route: str = field(compare=False)
+    tokens: float = field(compare=False)
+
+
+class AdmissionQueue:
+    """Per-provider priority queues with deadlines over an acquire function.
+
+    Parameters
+    ----------
+    acquire:
+        Coroutine ``(provider, route, tokens) -> (allowed, retry_after)``,
+        usually :func:`app.rate_limiting.acquire_async`.
+    refund:
+        Optional coroutine ``(provider, tokens)`` crediting back a token no
+        live waiter can take, usually :func:`app.rate_limiting.refund_async`.
+    max_depth:
+        Maximum number of waiters per provider.
+    default_deadline:
+        Seconds a request waits when it does not set its own deadline.
+    max_deadline:
+        Upper bound for per-request deadlines.
+    time_func:
+        Optional time provider for wait metrics; defaults to
+        :func:`time.monotonic`.
+    """
+
+    def __init__(
+        self,
+        acquire: AcquireFunc,
+        *,
+        refund: Optional[RefundFunc] = None,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        default_deadline: float = DEFAULT_DEADLINE,
+        max_deadline: float = MAX_DEADLINE,
+        time_func: Callable[[], float] | None = None,
+    ) -> None:
+        self._acquire = acquire
+        self._refund = refund
+        self.max_depth = max_depth
+        self.default_deadline = default_deadline
+        self.max_deadline = max_deadline
+        self.time = time_func or time.monotonic
+        self._queues: Dict[str, List[_Waiter]] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        self._retry_after: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self.depth: Counter[str] = Counter()
+        self.admitted: Counter[str] = Counter()
+        self.rejected: Counter[Tuple[str, str]] = Counter()
+        self.wait_seconds: Counter[str] = Counter()
+
+    async def acquire(
+        self,
+        provider: str,
+        route: str,
+        tokens: float = 1.0,
+        *,
+        priority: Priority = Priority.INTERACTIVE,
+        deadline: Optional[float] = None,
+    ) -> Tuple[bool, float]:
+        """Wait for a token for ``provider`` for at most ``deadline`` seconds.
+
+        Returns ``(allowed, retry_after)`` like
+        :func:`app.rate_limiting.acquire_async`.
+        """
+
+        timeout = min(self.max_deadline, self.default_deadline if deadline is None else deadline)
+        if not self.depth[provider]:
+            allowed, retry_after = await self._acquire(provider, route, tokens)
+            if allowed:
+                return True, 0.0
+            self._retry_after[provider] = retry_after
+            if retry_after > timeout:
+                self.rejected[provider, "deadline"] += 1
+                return False, retry_after
+        if self.depth[provider] >= self.max_depth and not self._shed(provider, priority):
+            self.rejected[provider, "full"] += 1
+            return False, self._retry_after.get(provider, 0.0)
+
+        waiter = _Waiter(
+            int(priority),
+            next(self._seq),
+            asyncio.get_running_loop().create_future(),
+            route,
+            tokens,
+        )
+        heapq.heappush(self._queues.setdefault(provider, []), waiter)
+        self.depth[provider] += 1
+        if provider not in self._dispatchers:
+            self._dispatchers[provider] = asyncio.create_task(self._dispatch(provider))
+
+        started = self.time()
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                return waiter.future.result()
+            self.rejected[provider, "deadline"] += 1
+            return False, self._retry_after.get(provider, 0.0)
+        finally:
+            if not waiter.future.done():  # timed out or caller cancelled
+                waiter.future.cancel()
+                self.depth[provider] -= 1
+            self.wait_seconds[provider] += self.time() - started
+
+    def _resolve(self, provider: str, waiter: _Waiter, result: Tuple[bool, float]) -> None:
+        waiter.future.set_result(result)
+        self.depth[provider] -= 1
+
+    def _shed(self, provider: str, priority: Priority) -> bool:
+        """Reject the newest waiter of lower priority to make room."""
+
+        live = [w for w in self._queues.get(provider, ()) if not w.future.done()]
+        if not live:
+            return True
+        worst = max(live)
+        if worst.priority <= priority:
+            return False
+        self._resolve(provider, worst, (False, self._retry_after.get(provider, 0.0)))
+        self.rejected[provider, "shed"] += 1
+        return True
+
+    async def _dispatch(self, provider: str) -> None:
+        """Hand tokens to waiters of ``provider`` in priority order."""
+
+        queue = self._queues[provider]
+        try:
+            while True:
+                while queue and queue[0].future.done():
+                    heapq.heappop(queue)
+                if not queue:
+                    return
+                head = queue[0]
+                allowed, retry_after = await self._acquire(provider, head.route, head.tokens)
+                if not allowed:
+                    self._retry_after[provider] = retry_after
+                    if retry_after == float("inf"):
+                        self._reject_all(provider, retry_after)
+                        return
+                    await asyncio.sleep(min(retry_after, MAX_POLL_INTERVAL))
+                    continue
+                # The head may have timed out while acquiring; give the token
+                # to the next live waiter instead.
+                while queue and queue[0].future.done():
+                    heapq.heappop(queue)
+                if queue:
+                    self._resolve(provider, heapq.heappop(queue), (True, 0.0))
+                    self.admitted[provider] += 1
+                elif self._refund is not None:
+                    await self._refund(provider, head.tokens)
+        finally:
+            del self._dispatchers[provider]
+
+    def _reject_all(self, provider: str, retry_after: float) -> None:
+        queue = self._queues.get(provider, [])
+        for waiter in queue:
+            if not waiter.future.done():
+                self._resolve(provider, waiter, (False, retry_after))
+        queue.clear()
+
+    async def close(self) -> None:
+        """Reject every waiter and stop the dispatchers."""
+
+        for provider in list(self._queues):
+            self._reject_all(provider, self._retry_after.get(provider, 0.0))
+        tasks = list(self._dispatchers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def render_metrics(self) -> str:
+        """Return queue depth, admissions, rejections and wait time for Prometheus."""
+
+        lines = []
+        for provider, value in sorted(self.depth.items()):
+            lines.append(f'rate_limit_queue_depth{{provider="{provider}"}} {value}')
+        for provider, value in sorted(self.admitted.items()):
+            lines.append(f'rate_limit_queue_admitted_total{{provider="{provider}"}} {value}')
+        for (provider, reason), value in sorted(self.rejected.items()):
+            lines.append(
+                f'rate_limit_queue_rejected_total{{provider="{provider}",reason="{reason}"}}'
+                f" {value}"
+            )
+        for provider, value in sorted(self.wait_seconds.items()):
+            lines.append(
+                f'rate_limit_queue_wait_seconds_total{{provider="{provider}"}} {value:f}'
+            )
+        return "".join(line + "\n" for line in lines)
+
+
+__all__ = ["AdmissionQueue", "Priority"]
@@ -0,0 +1,200 @@
+"""Redis-backed circuit breaker state shared across processes.
+
+Each named breaker has a ``breaker:{name}`` hash holding ``state``,
+``opened_at`` (wall clock) and a ``version`` counter. Transitions are written
+by a Lua script that bumps the version and publishes the change on a pub/sub
+channel in the same call, so every process flips together. Breakers keep a
+local cached view updated by a listener thread; only transitions touch Redis,
+so the CLOSED path does no I/O. Claiming the single HALF_OPEN probe is a
+compare-and-set on ``version``, which lets one process probe for the fleet.
+
+Transitions are rare, so the store uses a synchronous client; breakers
+call it from a worker thread so the event loop never waits on Redis. The
+listener hands remote changes to the event loop the store was started on,
+where every other breaker state change happens.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .circuit_breaker import CircuitState
+from .token_bucket import LuaScript
+
+if TYPE_CHECKING:  # pragma: no cover - typing only
+    from .circuit_breaker import CircuitBreaker
+
+DEFAULT_CHANNEL = "breaker:events"
+DEFAULT_PREFIX = "breaker:"
+
+# KEYS[1] = breaker hash; ARGV = expected version ('' = unconditional), state,
+# opened_at, channel, origin, name. Returns {won, version, state, opened_at}.
+TRANSITION_SCRIPT = """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version')) or 0
+if ARGV[1] ~= '' and tonumber(ARGV[1]) ~= version then
+  local current = redis.call('HMGET', KEYS[1], 'state', 'opened_at')
+  return {0, version, current[1] or '', current[2] or ''}
+end
+version = version + 1
+redis.call('HSET', KEYS[1], 'state', ARGV[2], 'opened_at', ARGV[3],
+  'version', version)
+redis.call('PUBLISH', ARGV[4], ARGV[5] .. '|' .. version .. '|' .. ARGV[2]
+  .. '|' .. ARGV[3] .. '|' .. ARGV[6])
+return {1, version, ARGV[2], ARGV[3]}
+"""
+
+_transition_script = LuaScript(TRANSITION_SCRIPT)
+
+# ``(state, opened_at wall clock, version)`` of a shared breaker.
+Snapshot = Tuple[CircuitState, float, int]
+
+
+def _decode(value: bytes | str | None) -> str:
+    if isinstance(value, bytes):
+        return value.decode()
+    return value or ""
+
+
+def _snapshot(state: bytes | str | None, opened_at, version) -> Optional[Snapshot]:
+    state = _decode(state)
+    if not state:
+        return None
+    opened = _decode(opened_at)
+    return CircuitState(state), float(opened) if opened else 0.0, int(version or 0)
+
+
+class RedisBreakerStore:
+    """Shares the state of named circuit breakers through Redis.
+
+    Parameters
+    ----------
+    redis_client:
+        Redis connection used for transitions and the pub/sub listener.
+    channel:
+        Pub/sub channel carrying state changes.
+    prefix:
+        Key prefix of the per-breaker hashes.
+    wall_time:
+        Clock comparable across processes; defaults to :func:`time.time`.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        *,
+        channel: str = DEFAULT_CHANNEL,
+        prefix: str = DEFAULT_PREFIX,
+        wall_time: Callable[[], float] | None = None,
+    ) -> None:
+        self.redis = redis_client
+        self.channel = channel
+        self.prefix = prefix
+        self.wall_time = wall_time or time.time
+        self.origin = uuid.uuid4().hex
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, name: str, breaker: CircuitBreaker) -> None:
+        """Track ``breaker`` under ``name`` and load its shared state."""
+
+        self._breakers[name] = breaker
+        try:
+            snapshot = self.load(name)
+        except RedisError:
+            return  # starts from the local view until the next change
+        if snapshot is not None:
+            breaker._apply_remote(*snapshot)
+
+    def load(self, name: str) -> Optional[Snapshot]:
+        """Return the shared state of ``name`` or ``None`` if never written."""
+
+        state, opened_at, version = self.redis.hmget(
+            self.prefix + name, "state", "opened_at", "version"
+        )
+        return _snapshot(state, opened_at, version)
+
+    def transition(
+        self,
+        name: str,
+        state: CircuitState,
+        opened_at: float,
+        expected_version: Optional[int] = None,
+    ) -> Tuple[bool, Optional[Snapshot]]:
+        """Write ``state`` for ``name`` and notify every process.
+
+        With ``expected_version`` the write only happens if nobody else has
+        transitioned the breaker since; otherwise the current shared state is
+        returned. Returns ``(written, snapshot)``.
+        """
+
+        expected = "" if expected_version is None else expected_version
+        won, version, current, current_opened = _transition_script(
+            self.redis,
+            (self.prefix + name,),
+            (expected, state.value, repr(opened_at), self.channel, self.origin, name),
+        )
+        return bool(won), _snapshot(current, current_opened, version)
+
+    def start(
+        self, poll_interval: float = 0.1, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
+        """Start the pub/sub listener thread.
+
+        Remote changes are applied on ``loop``, by default the running loop;
+        without one they are applied from the listener thread.
+        """
+
+        if self._thread is not None:
+            return
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        self._loop = loop
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=poll_interval, daemon=True)
+
+    def stop(self) -> None:
+        """Stop the listener thread and close its connection."""
+
+        if self._thread is None:
+            return
+        self._thread.stop()
+        self._thread.join(timeout=1)
+        self._pubsub.close()
+        self._thread = None
+        self._pubsub = None
+        self._loop = None
+
+    def _on_message(self, message: dict) -> None:
+        """Apply a state change published by another process."""
+
+        try:
+            origin, version, state, opened_at, name = _decode(message["data"]).split("|", 4)
+            snapshot = _snapshot(state, opened_at, version)
+        except ValueError:
+            return  # not a breaker event
+        breaker = self._breakers.get(name)
+        if origin == self.origin or breaker is None or snapshot is None:
+            return
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(breaker._apply_remote, *snapshot)
+                return
+            except RuntimeError:
+                pass  # loop closed; apply from this thread under the breaker lock
+        breaker._apply_remote(*snapshot)
+
+
+__all__ = ["DEFAULT_CHANNEL", "RedisBreakerStore", "Snapshot"]
@@ -3,13 +3,43 @@
 This module provides a reusable circuit breaker with the classic CLOSED →
 OPEN → HALF_OPEN transitions. It supports a probe interval, manual operator
 controls, and raises :class:`CircuitBreakerOpen` when the breaker blocks calls.
+
+HALF_OPEN admits at most ``half_open_max_calls`` concurrent probes and
+fast-fails everyone else, so a recovering provider is not hit by the whole
+backlog at once. Time spent in each state is recorded for MTTR reporting.
+:class:`FailureRateBreaker` trips on the failure rate over a sliding window
+instead of a run of consecutive failures.
+
+With a :class:`~app.rate_limiting.breaker_store.RedisBreakerStore`, state
+transitions are shared by every process using the same breaker ``name``.
+:meth:`CircuitBreaker.call` runs its store writes in a worker thread and
+serializes its state steps on the event loop, so a transition never blocks
+the loop and concurrent callers never act on a state that is being changed.
 """
 
 from __future__ import annotations
 
+import asyncio
+import threading
 import time
+from collections import deque
 from enum import Enum
-from typing import Awaitable, Callable, Generic, Optional, TypeVar
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from redis.exceptions import RedisError
+
+if TYPE_CHECKING:  # pragma: no cover - typing only
+    from .breaker_store import RedisBreakerStore, Snapshot
 
 
 class CircuitBreakerOpen(Exception):
@@ -36,8 +66,15 @@ class CircuitBreaker(Generic[T]):
         Consecutive failures required to open the circuit.
     probe_interval:
         Seconds to wait before allowing a probe call after opening.
+    half_open_max_calls:
+        Concurrent probes admitted in HALF_OPEN; this many successful probes
+        close the circuit again.
     time_func:
         Optional time provider for tests; defaults to :func:`time.monotonic`.
+    name:
+        Breaker name; required with ``store``.
+    store:
+        Optional shared store flipping the breaker in every process.
     """
 
     def __init__(
@@ -45,14 +82,36 @@ class CircuitBreaker(Generic[T]):
         failure_threshold: int,
         probe_interval: float,
         *,
+        half_open_max_calls: int = 1,
         time_func: Callable[[], float] | None = None,
+        name: str | None = None,
+        store: Optional[RedisBreakerStore] = None,
     ) -> None:
+        if store is not None and not name:
+            raise ValueError("a shared circuit breaker needs a name")
         self.failure_threshold = failure_threshold
         self.probe_interval = probe_interval
+        self.half_open_max_calls = half_open_max_calls
         self.time = time_func or time.monotonic
         self._failures = 0
         self._state: CircuitState = CircuitState.CLOSED
         self._opened_at: Optional[float] = None
+        self._probes = 0
+        self._probe_successes = 0
+        self._state_since = self.time()
+        self._durations: Dict[CircuitState, float] = {state: 0.0 for state in CircuitState}
+        self._outage_started: Optional[float] = None
+        self.open_count = 0
+        self.last_recovery: Optional[float] = None
+        self.name = name
+        self.store = store
+        self._version = 0
+        self._remote_probe = False
+        self._lock = threading.RLock()
+        self._steps: Optional[asyncio.Lock] = None
+        self._steps_loop: Optional[asyncio.AbstractEventLoop] = None
+        if store is not None:
+            store.register(name, self)
 
     @property
     def state(self) -> CircuitState:
@@ -60,62 +119,334 @@ class CircuitBreaker(Generic[T]):
 
         return self._state
 
+    def state_durations(self) -> Dict[CircuitState, float]:
+        """Return cumulative seconds spent in each state, including the current one."""
+
+        durations = dict(self._durations)
+        durations[self._state] += self.time() - self._state_since
+        return durations
+
+    def _set_state(self, state: CircuitState, now: float) -> None:
+        """Move to ``state``, recording per-state timing and outage length."""
+
+        if state is self._state:
+            if state is CircuitState.OPEN:
+                self._opened_at = now
+            return
+        self._durations[self._state] += now - self._state_since
+        self._state_since = now
+        if state is CircuitState.OPEN:
+            self.open_count += 1
+            self._opened_at = now
+            if self._outage_started is None:
+                self._outage_started = now
+        elif state is CircuitState.CLOSED:
+            if self._outage_started is not None:
+                self.last_recovery = now - self._outage_started
+            self._outage_started = None
+            self._opened_at = None
+            self._reset()
+        self._probes = 0
+        self._probe_successes = 0
+        self._remote_probe = False
+        self._state = state
+
+    def _store_args(self, state: CircuitState, now: float, claim: bool) -> tuple:
+        """Arguments of :meth:`RedisBreakerStore.transition` for moving to ``state``."""
+
+        with self._lock:
+            if state is CircuitState.CLOSED:
+                opened_at = 0.0
+            elif state is CircuitState.OPEN or self._opened_at is None:
+                opened_at = self.store.wall_time()
+            else:
+                opened_at = self.store.wall_time() - (now - self._opened_at)
+            return self.name, state, opened_at, self._version if claim else None
+
+    def _write(self, args: tuple) -> Optional[Tuple[bool, Optional[Snapshot]]]:
+        """Write a transition to the store; ``None`` if Redis is unavailable."""
+
+        try:
+            return self.store.transition(*args)
+        except RedisError:
+            return None  # keep working on the per-process view
+
+    def _commit(
+        self,
+        state: CircuitState,
+        now: float,
+        outcome: Optional[Tuple[bool, Optional[Snapshot]]],
+    ) -> bool:
+        """Apply a transition locally after the shared ``outcome``, if any."""
+
+        with self._lock:
+            if outcome is not None:
+                won, snapshot = outcome
+                if not won:
+                    if snapshot is not None:
+                        self._apply_remote(*snapshot, force=True)
+                    return False
+                self._version = snapshot[2]
+            self._set_state(state, now)
+            return True
+
+    def _transition(self, state: CircuitState, now: float, *, claim: bool = False) -> bool:
+        """Move to ``state`` locally and, with a store, in every process.
+
+        With ``claim`` the shared transition only succeeds if no other process
+        has changed the breaker since our last view; on a lost claim the
+        shared state is adopted instead and ``False`` is returned. This
+        blocking variant serves the operator controls; :meth:`call` uses
+        :meth:`_transition_async`.
+        """
+
+        outcome = None
+        if self.store is not None:
+            outcome = self._write(self._store_args(state, now, claim))
+        return self._commit(state, now, outcome)
+
+    async def _transition_async(
+        self, state: CircuitState, now: float, *, claim: bool = False
+    ) -> bool:
+        """Asyncio variant of :meth:`_transition` writing from a worker thread."""
+
+        outcome = None
+        if self.store is not None:
+            args = self._store_args(state, now, claim)
+            outcome = await asyncio.to_thread(self._write, args)
+        return self._commit(state, now, outcome)
+
+    def _apply_remote(
+        self, state: CircuitState, opened_at: float, version: int, *, force: bool = False
+    ) -> None:
+        """Adopt a state written by another process.
+
+        ``opened_at`` is wall-clock time and converted to this breaker's clock.
+        A remote HALF_OPEN means another process holds the probe, so every
+        local probe slot is marked taken.
+        """
+
+        with self._lock:
+            if version <= self._version and not force:
+                return
+            self._version = version
+            now = self.time()
+            self._set_state(state, now)
+            if state is CircuitState.OPEN:
+                self._opened_at = now - max(0.0, self.store.wall_time() - opened_at)
+            elif state is CircuitState.HALF_OPEN:
+                self._probes = self.half_open_max_calls
+                self._remote_probe = True
+
+    def _reset(self) -> None:
+        """Clear failure statistics when the circuit closes."""
+
+        self._failures = 0
+
+    def _record(self, now: float, failed: bool) -> bool:
+        """Record a CLOSED-state outcome; return ``True`` to open the circuit."""
+
+        self._failures = self._failures + 1 if failed else 0
+        return self._failures >= self.failure_threshold
+
     # Hooks for Operator Console
     def force_open(self) -> None:
         """Manually open the circuit via operator control."""
 
-        self._state = CircuitState.OPEN
-        self._opened_at = self.time()
+        self._transition(CircuitState.OPEN, self.time())
 
     def force_close(self) -> None:
         """Manually close the circuit and reset counters."""
 
-        self._state = CircuitState.CLOSED
-        self._failures = 0
-        self._opened_at = None
+        self._transition(CircuitState.CLOSED, self.time())
+        self._reset()
 
-    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
-        """Execute ``func`` respecting circuit breaker state.
+    def _step_lock(self) -> asyncio.Lock:
+        """Lock serializing state steps of :meth:`call` on the running loop."""
+
+        loop = asyncio.get_running_loop()
+        if self._steps is None or self._steps_loop is not loop:
+            self._steps = asyncio.Lock()
+            self._steps_loop = loop
+        return self._steps
+
+    async def _admit(self, now: float) -> bool:
+        """Check whether a call may proceed; return ``True`` for a probe.
 
         Raises
         ------
         CircuitBreakerOpen
-            If the circuit breaker is open or probing interval has not elapsed.
-        Exception
-            Propagates errors from ``func``.
+            If the circuit is open or every probe slot is taken.
         """
 
-        now = self.time()
         if self._state is CircuitState.OPEN:
             if (
                 self._opened_at is not None
                 and now - self._opened_at >= self.probe_interval
             ):
-                self._state = CircuitState.HALF_OPEN
+                if not await self._transition_async(CircuitState.HALF_OPEN, now, claim=True):
+                    if self._state is CircuitState.CLOSED:
+                        return False
+                    raise CircuitBreakerOpen("circuit breaker open")
             else:
                 raise CircuitBreakerOpen("circuit breaker open")
+        if (
+            self._state is CircuitState.HALF_OPEN
+            and self._remote_probe
+            and now - self._state_since >= self.probe_interval
+            and await self._transition_async(CircuitState.HALF_OPEN, now, claim=True)
+        ):
+            # The remote prober went silent for a whole interval; take over.
+            self._probes = 0
+            self._remote_probe = False
+        if self._state is CircuitState.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                raise CircuitBreakerOpen("circuit breaker half-open; probe in flight")
+            self._probes += 1
+            return True
+        return False
+
+    async def _on_failure(self, now: float, probe: bool) -> None:
+        probe = probe and self._state is CircuitState.HALF_OPEN
+        if probe:
+            await self._transition_async(CircuitState.OPEN, now)
+        elif self._state is CircuitState.CLOSED and self._record(now, True):
+            await self._transition_async(CircuitState.OPEN, now)
+
+    async def _on_success(self, now: float, probe: bool) -> None:
+        probe = probe and self._state is CircuitState.HALF_OPEN
+        if probe:
+            self._probes -= 1
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_max_calls:
+                await self._transition_async(CircuitState.CLOSED, now)
+        elif self._state is CircuitState.CLOSED:
+            self._record(now, False)
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Execute ``func`` respecting circuit breaker state.
 
+        Raises
+        ------
+        CircuitBreakerOpen
+            If the circuit breaker is open, probing interval has not elapsed,
+            or the half-open probe slots are taken.
+        Exception
+            Propagates errors from ``func``.
+        """
+
+        async with self._step_lock():
+            probe = await self._admit(self.time())
         try:
             result = await func()
         except Exception:
-            self._failures += 1
-            if (
-                self._state is CircuitState.HALF_OPEN
-                or self._failures >= self.failure_threshold
-            ):
-                self._state = CircuitState.OPEN
-                self._opened_at = now
+            async with self._step_lock():
+                await self._on_failure(self.time(), probe)
+            raise
+        except BaseException:
+            # Cancelled probes free their slot without counting as an outcome.
+            if probe and self._state is CircuitState.HALF_OPEN:
+                self._probes -= 1
             raise
         else:
-            self._failures = 0
-            self._state = CircuitState.CLOSED
-            self._opened_at = None
+            async with self._step_lock():
+                await self._on_success(self.time(), probe)
             return result
 
 
+class FailureRateBreaker(CircuitBreaker[T]):
+    """Circuit breaker tripping on the failure rate over a sliding window.
+
+    Outcomes are kept in a ring buffer bounded by both ``window_size`` calls
+    and ``window_seconds``. The circuit opens once at least ``minimum_calls``
+    outcomes are in the window and the share of failures reaches
+    ``failure_rate_threshold``.
+
+    Parameters
+    ----------
+    failure_rate_threshold:
+        Failure ratio in ``(0, 1]`` that opens the circuit.
+    probe_interval:
+        Seconds to wait before allowing probe calls after opening.
+    minimum_calls:
+        Outcomes required in the window before the rate is evaluated.
+    window_size:
+        Maximum number of outcomes kept.
+    window_seconds:
+        Maximum age of kept outcomes.
+    half_open_max_calls:
+        Concurrent probes admitted in HALF_OPEN.
+    time_func:
+        Optional time provider for tests; defaults to :func:`time.monotonic`.
+    name, store:
+        Optional shared state, see :class:`CircuitBreaker`.
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        probe_interval: float = 30.0,
+        *,
+        minimum_calls: int = 10,
+        window_size: int = 100,
+        window_seconds: float = 60.0,
+        half_open_max_calls: int = 1,
+        time_func: Callable[[], float] | None = None,
+        name: str | None = None,
+        store: Optional[RedisBreakerStore] = None,
+    ) -> None:
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self._window: Deque[Tuple[float, bool]] = deque()
+        self._window_failures = 0
+        super().__init__(
+            minimum_calls,
+            probe_interval,
+            half_open_max_calls=half_open_max_calls,
+            time_func=time_func,
+            name=name,
+            store=store,
+        )
+
+    @property
+    def failure_rate(self) -> float:
+        """Failure ratio over the current window, ``0`` when empty."""
+
+        self._expire(self.time())
+        if not self._window:
+            return 0.0
+        return self._window_failures / len(self._window)
+
+    def _expire(self, now: float) -> None:
+        """Drop outcomes that are too old or beyond ``window_size``."""
+
+        window = self._window
+        cutoff = now - self.window_seconds
+        while window and (len(window) > self.window_size or window[0][0] <= cutoff):
+            _, failed = window.popleft()
+            self._window_failures -= failed
+
+    def _reset(self) -> None:
+        super()._reset()
+        self._window.clear()
+        self._window_failures = 0
+
+    def _record(self, now: float, failed: bool) -> bool:
+        self._window.append((now, failed))
+        self._window_failures += failed
+        self._expire(now)
+        return (
+            len(self._window) >= self.minimum_calls
+            and self._window_failures / len(self._window) >= self.failure_rate_threshold
+        )
+
+
 # Security: no secrets stored; manual controls allow Operator Console oversight.
 __all__ = [
     "CircuitBreaker",
     "CircuitBreakerOpen",
     "CircuitState",
+    "FailureRateBreaker",
 ]
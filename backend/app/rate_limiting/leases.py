@@ -0,0 +1,248 @@
+"""Process-local token leases over the shared Redis token buckets.
+
+A lease reserves a small batch of tokens from every window of a provider in
+one round trip and then spends them locally without I/O. Unused tokens are
+returned on renewal, by a timer when the lease expires unrenewed, when the
+provider is frozen by any process, or on shutdown, and every leased token
+has already been debited from the shared buckets, so the sum of all leases
+never exceeds the provider ceilings. Lease size follows observed demand and
+is capped by the provider's adaptive clamp.
+
+A freeze set elsewhere reaches a lease through the freeze listener (see
+:meth:`~app.rate_limiting.adaptive_clamps.AdaptiveClamp.start`); without it
+a lease only sees the freeze on renewal, so up to ``ttl`` seconds later.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+from typing import Any, Callable, Optional, Set
+
+from redis.asyncio import Redis as AsyncRedis
+
+from .token_bucket import (
+    ProviderGuard,
+    Windows,
+    release_all,
+    release_all_async,
+    reserve_all,
+    reserve_all_async,
+)
+
+DEFAULT_LEASE_TTL = 1.0
+MAX_FRACTION = 0.5  # largest lease as a share of the smallest window capacity
+SMOOTHING = 0.5  # EWMA weight given to the latest demand observation
+
+
+class TokenLease:
+    """Locally spendable batch of tokens reserved from shared windows.
+
+    Parameters
+    ----------
+    windows:
+        ``(bucket, key)`` windows of one provider, as used by
+        :func:`~app.rate_limiting.token_bucket.acquire_all`.
+    ttl:
+        Seconds a lease may be spent before unused tokens are returned.
+    min_size:
+        Smallest batch requested on renewal.
+    max_fraction:
+        Largest batch as a fraction of the smallest window capacity.
+    time_func:
+        Optional time provider; defaults to the first bucket's clock.
+    guard:
+        Optional provider freeze/clamp guard checked on every renewal.
+    """
+
+    def __init__(
+        self,
+        windows: Windows,
+        *,
+        ttl: float = DEFAULT_LEASE_TTL,
+        min_size: float = 1.0,
+        max_fraction: float = MAX_FRACTION,
+        time_func: Callable[[], float] | None = None,
+        guard: Optional[ProviderGuard] = None,
+    ) -> None:
+        self.windows = tuple(windows)
+        self.guard = guard
+        self.ttl = ttl
+        self.min_size = min_size
+        smallest = min(bucket.capacity for bucket, _ in self.windows)
+        self.max_size = max(min_size, smallest * max_fraction)
+        self.time = time_func or self.windows[0][0].time
+        self.remaining = 0.0
+        self.expires_at = 0.0
+        self.renewals = 0
+        self._started: Optional[float] = None
+        self._spent = 0.0
+        self._rate: Optional[float] = None
+        self._lock = threading.Lock()
+        # Serializes async renewals so concurrent callers share one batch.
+        self._renewal = asyncio.Lock()
+        self._expiry: Any = None  # timer returning leftovers of the current lease
+        self._tasks: Set[asyncio.Task] = set()
+
+    def acquire(self, tokens: float = 1.0, clamp: float = 1.0) -> tuple[bool, float]:
+        """Spend ``tokens`` from the lease, renewing it from Redis if needed.
+
+        Returns ``(allowed, retry_after)`` like
+        :func:`~app.rate_limiting.token_bucket.acquire_all`.
+        """
+
+        with self._lock:
+            now = self.time()
+            if self._spend(now, tokens):
+                return True, 0.0
+            if math.isinf(tokens):
+                return False, float("inf")
+            refund, size = self._begin_renewal(now, tokens, clamp)
+            allowed, granted, retry_after = reserve_all(
+                self.windows, tokens, size, refund=refund, guard=self.guard
+            )
+            result = self._finish_renewal(now, tokens, allowed, granted, retry_after)
+            if allowed:
+                timer = threading.Timer(self.ttl, self._expire, args=(self.renewals,))
+                timer.daemon = True
+                timer.start()
+                self._expiry = timer
+            return result
+
+    async def acquire_async(
+        self, client: AsyncRedis, tokens: float = 1.0, clamp: float = 1.0
+    ) -> tuple[bool, float]:
+        """Asyncio variant of :meth:`acquire` using ``client`` for renewals.
+
+        Renewals are serialized: callers that find the lease exhausted while
+        another coroutine renews it wait and spend from the new batch
+        instead of each reserving their own.
+        """
+
+        if self._spend(self.time(), tokens):
+            return True, 0.0
+        if math.isinf(tokens):
+            return False, float("inf")
+        async with self._renewal:
+            now = self.time()
+            if self._spend(now, tokens):
+                return True, 0.0
+            refund, size = self._begin_renewal(now, tokens, clamp)
+            allowed, granted, retry_after = await reserve_all_async(
+                client, self.windows, tokens, size, refund=refund, guard=self.guard
+            )
+            result = self._finish_renewal(now, tokens, allowed, granted, retry_after)
+            if allowed:
+                self._expiry = asyncio.get_running_loop().call_later(
+                    self.ttl, self._expire_soon, client, self.renewals
+                )
+            return result
+
+    def release(self) -> None:
+        """Return unused tokens to the shared windows."""
+
+        with self._lock:
+            refund = self._detach()
+        release_all(self.windows, refund)
+
+    async def release_async(self, client: AsyncRedis) -> None:
+        """Asyncio variant of :meth:`release`."""
+
+        async with self._renewal:
+            refund = self._detach()
+        await release_all_async(client, self.windows, refund)
+
+    def release_soon(self, client: AsyncRedis) -> None:
+        """Schedule :meth:`release_async` on the running loop."""
+
+        self._spawn(self.release_async(client))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _detach(self, renewal: Optional[int] = None) -> float:
+        """Empty the lease and return its leftover tokens.
+
+        With ``renewal``, only a lease still on that renewal is emptied; a
+        later renewal has already taken the leftovers over.
+        """
+
+        if renewal is not None and renewal != self.renewals:
+            return 0.0
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        refund, self.remaining = self.remaining, 0.0
+        self.expires_at = 0.0
+        return refund
+
+    def _expire(self, renewal: int) -> None:
+        """Timer callback returning the leftovers of an unrenewed lease."""
+
+        with self._lock:
+            refund = self._detach(renewal)
+        if refund:
+            release_all(self.windows, refund)
+
+    def _expire_soon(self, client: AsyncRedis, renewal: int) -> None:
+        self._spawn(self._expire_async(client, renewal))
+
+    async def _expire_async(self, client: AsyncRedis, renewal: int) -> None:
+        async with self._renewal:
+            refund = self._detach(renewal)
+        if refund:
+            await release_all_async(client, self.windows, refund)
+
+    def _spend(self, now: float, tokens: float) -> bool:
+        """Take ``tokens`` from the local lease without I/O if possible."""
+
+        if now < self.expires_at and self.remaining >= tokens:
+            self.remaining -= tokens
+            self._spent += tokens
+            return True
+        return False
+
+    def _begin_renewal(self, now: float, tokens: float, clamp: float) -> tuple[float, float]:
+        """Detach leftover tokens and size the next lease.
+
+        Demand is the smoothed rate of tokens spent from previous leases; the
+        lease covers ``ttl`` seconds of it, bounded by ``max_size`` scaled by
+        the current clamp.
+        """
+
+        if self._started is not None:
+            observed = self._spent / max(now - self._started, 1e-3)
+            if self._rate is None:
+                self._rate = observed
+            else:
+                self._rate = SMOOTHING * observed + (1 - SMOOTHING) * self._rate
+        self._started = now
+        self._spent = 0.0
+        refund = self._detach()
+        demand = (self._rate or 0.0) * self.ttl
+        size = max(self.min_size, min(self.max_size * clamp, demand))
+        return refund, max(tokens, size)
+
+    def _finish_renewal(
+        self,
+        now: float,
+        tokens: float,
+        allowed: bool,
+        granted: float,
+        retry_after: float,
+    ) -> tuple[bool, float]:
+        """Record the outcome of a renewal and spend ``tokens`` from it."""
+
+        self.renewals += 1
+        if not allowed:
+            return False, retry_after
+        self.remaining += granted - tokens
+        self._spent += tokens
+        self.expires_at = now + self.ttl
+        return True, 0.0
+
+
+__all__ = ["DEFAULT_LEASE_TTL", "TokenLease"]
@@ -0,0 +1,121 @@
+"""Bounded in-process bucket store used while Redis is unavailable.
+
+Each :class:`~app.rate_limiting.token_bucket.TokenBucket` keeps its fallback
+levels here. The store holds at most ``max_entries`` keys in LRU order. When
+it is full, buckets that have refilled to capacity are evicted first;
+forgetting them is lossless because an unknown key starts full. If nothing
+can be evicted, new keys are denied (default-deny) rather than growing
+memory without bound during long outages.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Iterator, Tuple
+
+DEFAULT_MAX_LOCAL_BUCKETS = 1024
+
+
+class LocalEntry:
+    """Level of one fallback bucket at time ``ts``."""
+
+    __slots__ = ("tokens", "ts")
+
+    def __init__(self, tokens: float, ts: float) -> None:
+        self.tokens = tokens
+        self.ts = ts
+
+
+class LocalBucketStore:
+    """LRU-bounded mapping of bucket key to :class:`LocalEntry`.
+
+    Parameters
+    ----------
+    capacity:
+        Capacity of the owning bucket; unknown keys start at this level.
+    refill_rate:
+        Tokens added per second for the owning bucket.
+    max_entries:
+        Maximum number of keys tracked at once.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_rate: float,
+        *,
+        max_entries: int = DEFAULT_MAX_LOCAL_BUCKETS,
+    ) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, LocalEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __getitem__(self, key: str) -> Tuple[float, float]:
+        entry = self._entries[key]
+        return entry.tokens, entry.ts
+
+    def level(self, key: str, now: float) -> float:
+        """Return the refilled level of ``key`` at ``now``."""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return self.capacity
+        return self._level(entry, now)
+
+    def has_room(self, key: str, now: float) -> bool:
+        """Return whether ``key`` can be stored, evicting refilled keys if full."""
+
+        if key in self._entries or len(self._entries) < self.max_entries:
+            return True
+        self._evict_refilled(now)
+        return len(self._entries) < self.max_entries
+
+    def next_refill(self, now: float) -> float:
+        """Seconds until the earliest tracked bucket is full again."""
+
+        if self.refill_rate <= 0:
+            return float("inf")
+        fullest = max(
+            (self._level(entry, now) for entry in self._entries.values()),
+            default=self.capacity,
+        )
+        return max(0.0, (self.capacity - fullest) / self.refill_rate)
+
+    def store(self, key: str, tokens: float, now: float) -> None:
+        """Record the level of ``key``, marking it most recently used.
+
+        Callers must check :meth:`has_room` first for keys not yet tracked.
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = LocalEntry(tokens, now)
+            return
+        entry.tokens = tokens
+        entry.ts = now
+        self._entries.move_to_end(key)
+
+    def _level(self, entry: LocalEntry, now: float) -> float:
+        delta = max(0.0, now - entry.ts) * self.refill_rate
+        return min(self.capacity, entry.tokens + delta)
+
+    def _evict_refilled(self, now: float) -> None:
+        """Drop every bucket that has refilled to capacity, oldest first."""
+
+        full = [
+            key
+            for key, entry in self._entries.items()
+            if self._level(entry, now) >= self.capacity
+        ]
+        for key in full:
+            del self._entries[key]
+
+
+__all__ = ["DEFAULT_MAX_LOCAL_BUCKETS", "LocalBucketStore", "LocalEntry"]
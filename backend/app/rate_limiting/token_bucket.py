@@ -1,18 +1,141 @@
 """Token bucket rate limiter with Redis backend and local fallback.
 
-This module implements a simple token bucket algorithm. Tokens are stored in
-Redis for cross-process coordination. When Redis is unavailable, an
-in-process dictionary is used as a fallback to avoid unlimited requests.
+This module implements a simple token bucket algorithm. Bucket state is kept
+in a Redis hash and updated by a server-side Lua script so refill and debit
+happen atomically in a single round trip, even when several processes share
+the bucket. :func:`acquire_all` extends this to several windows (per second,
+minute, day) that are debited together or not at all. When Redis is
+unavailable, an in-process dictionary is used as a fallback to avoid
+unlimited requests.
 """
 
 from __future__ import annotations
 
-import json
+import hashlib
+import math
 import time
-from typing import Callable, Dict
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple
 
 from redis import Redis
-from redis.exceptions import RedisError
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import NoScriptError, RedisError
+
+from .local_store import DEFAULT_MAX_LOCAL_BUCKETS, LocalBucketStore
+
+# KEYS = one hash per window, optionally followed by a provider freeze key and
+# shared clamp hash; ARGV = now, refund, min_tokens, max_tokens, then a
+# capacity/refill_rate pair per window. ``refund`` tokens are first credited
+# back to every window, then between ``min_tokens`` and ``max_tokens`` are
+# debited from every window or from none of them. While the freeze key exists
+# nothing is debited. Returns ``{allowed, granted, retry_after, clamp}``;
+# floats are returned as strings because Redis truncates Lua numbers to
+# integers, and ``clamp`` is empty when no shared clamp is known.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local refund = tonumber(ARGV[2])
+local min_tokens = tonumber(ARGV[3])
+local max_tokens = tonumber(ARGV[4])
+local windows = (#ARGV - 4) / 2
+local frozen_ms = -2
+local clamp = ''
+if #KEYS > windows then
+  frozen_ms = redis.call('PTTL', KEYS[windows + 1])
+  clamp = redis.call('HGET', KEYS[windows + 2], 'clamp') or ''
+end
+local levels = {}
+local granted = max_tokens
+for i = 1, windows do
+  local capacity = tonumber(ARGV[3 + 2 * i])
+  local rate = tonumber(ARGV[4 + 2 * i])
+  local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local available = tonumber(state[1])
+  local last = tonumber(state[2])
+  if available == nil or last == nil then
+    available = capacity
+    last = now
+  end
+  available = math.min(capacity, available + math.max(0, now - last) * rate + refund)
+  levels[i] = available
+  granted = math.min(granted, available)
+end
+local allowed = 1
+local retry_after = 0
+if frozen_ms ~= -2 and min_tokens > 0 then
+  allowed = 0
+  granted = 0
+  if frozen_ms == -1 then
+    retry_after = -1
+  else
+    retry_after = frozen_ms / 1000
+  end
+elseif granted < min_tokens then
+  allowed = 0
+  granted = 0
+  for i = 1, windows do
+    local rate = tonumber(ARGV[4 + 2 * i])
+    if levels[i] < min_tokens then
+      if rate <= 0 or retry_after < 0 then
+        retry_after = -1
+      else
+        retry_after = math.max(retry_after, (min_tokens - levels[i]) / rate)
+      end
+    end
+  end
+end
+if granted > 0 or refund > 0 then
+  for i = 1, windows do
+    local capacity = tonumber(ARGV[3 + 2 * i])
+    local rate = tonumber(ARGV[4 + 2 * i])
+    local available = levels[i] - granted
+    redis.call('HSET', KEYS[i], 'tokens', tostring(available), 'ts', tostring(now))
+    if rate > 0 then
+      redis.call('PEXPIRE', KEYS[i], math.ceil((capacity - available) / rate * 1000) + 1000)
+    end
+  end
+end
+return {allowed, tostring(granted), tostring(retry_after), clamp}
+"""
+
+
+class LuaScript:
+    """Server-side script executed via ``EVALSHA`` with ``EVAL`` fallback.
+
+    The SHA1 digest is computed locally so the script is only shipped to
+    Redis when the server does not have it cached yet.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def __call__(self, client: Redis, keys: Sequence[str], args: Sequence[object]):
+        """Run the script on ``client`` and return the raw reply."""
+
+        try:
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            return client.eval(self.source, len(keys), *keys, *args)
+
+    async def run_async(
+        self, client: AsyncRedis, keys: Sequence[str], args: Sequence[object]
+    ):
+        """Run the script on an asyncio ``client`` and return the raw reply."""
+
+        try:
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            return await client.eval(self.source, len(keys), *keys, *args)
+
+
+_acquire_script = LuaScript(ACQUIRE_SCRIPT)
+
+
+def _parse_retry_after(raw: bytes | str) -> float:
+    """Decode a script ``retry_after`` reply; ``-1`` means never refills."""
+
+    value = float(raw)
+    return float("inf") if value < 0 else value
 
 
 class TokenBucket:
@@ -28,6 +151,8 @@ class TokenBucket:
         Number of tokens added per second.
     time_func:
         Optional time provider for testing; defaults to :func:`time.time`.
+    max_local_buckets:
+        Bound on keys tracked by the in-process fallback store.
     """
 
     def __init__(
@@ -37,12 +162,16 @@ class TokenBucket:
         refill_rate: float,
         *,
         time_func: Callable[[], float] | None = None,
+        max_local_buckets: int = DEFAULT_MAX_LOCAL_BUCKETS,
     ) -> None:
         self.redis = redis_client
         self.capacity = capacity
         self.refill_rate = refill_rate
         self.time = time_func or time.time
-        self.local_buckets: Dict[str, Tuple[float, float]] = {}
+        self.local_buckets = LocalBucketStore(
+            capacity, refill_rate, max_entries=max_local_buckets
+        )
+        self._args = (repr(float(capacity)), repr(float(refill_rate)))
 
     # Security: No secrets stored; fallback prevents unlimited calls on Redis outage.
     def acquire(self, key: str, tokens: float = 1.0) -> tuple[bool, float]:
@@ -53,46 +182,195 @@ class TokenBucket:
         request is denied.
         """
 
-        now = self.time()
-        try:
-            data = self.redis.get(key)
-            if data is None:
-                available = self.capacity
-                last = now
-            else:
-                if isinstance(data, bytes):
-                    data = data.decode("utf-8")
-                available, last = json.loads(data)
-            available = float(available)
-            last = float(last)
-
-            delta = max(0.0, now - last) * self.refill_rate
-            available = min(self.capacity, available + delta)
-            allowed = available >= tokens
-            retry_after = 0.0
-            if allowed:
-                available -= tokens
-            else:
-                deficit = tokens - available
-                retry_after = deficit / self.refill_rate if self.refill_rate > 0 else float("inf")
-            self.redis.set(key, json.dumps([available, now]))
-            return allowed, retry_after
-        except RedisError:
-            # Fallback to in-process bucket on Redis failure
-            return self._acquire_local(key, now, tokens)
-
-    def _acquire_local(self, key: str, now: float, tokens: float) -> tuple[bool, float]:
-        """Local in-memory bucket used when Redis is unavailable."""
-
-        available, last = self.local_buckets.get(key, (self.capacity, now))
-        delta = max(0.0, now - last) * self.refill_rate
-        available = min(self.capacity, available + delta)
-        allowed = available >= tokens
-        retry_after = 0.0
-        if allowed:
-            available -= tokens
-        else:
-            deficit = tokens - available
-            retry_after = deficit / self.refill_rate if self.refill_rate > 0 else float("inf")
-        self.local_buckets[key] = (available, now)
-        return allowed, retry_after
+        return acquire_all(((self, key),), tokens)
+
+    def _retry_after(self, available: float, tokens: float) -> float:
+        """Seconds until ``tokens`` are available given the current level."""
+
+        deficit = tokens - available
+        return deficit / self.refill_rate if self.refill_rate > 0 else float("inf")
+
+
+Windows = Sequence[Tuple[TokenBucket, str]]
+
+
+@dataclass(frozen=True)
+class ProviderGuard:
+    """Provider-wide state checked inside the bucket script.
+
+    ``freeze_key`` blocks every debit while it exists; the value of
+    ``clamp_key`` is passed to ``on_clamp`` after each call so processes pick
+    up the shared clamp without an extra round trip.
+    """
+
+    freeze_key: str
+    clamp_key: str
+    on_clamp: Callable[[float], None]
+
+
+# Security: fallback keeps the all-or-nothing semantics during Redis outages.
+def acquire_all(
+    windows: Windows,
+    tokens: float = 1.0,
+    *,
+    guard: Optional[ProviderGuard] = None,
+) -> tuple[bool, float]:
+    """Take ``tokens`` from every ``(bucket, key)`` window or from none.
+
+    All windows are checked and debited by one script call on the Redis
+    client of the first bucket, so a provider with ``per_sec`` and
+    ``per_day`` windows costs a single round trip and a denial by any window
+    leaves the others untouched. ``retry_after`` is the longest wait across
+    the denying windows. An optional ``guard`` adds the provider freeze and
+    shared clamp to the same call.
+    """
+
+    if math.isinf(tokens):
+        return False, float("inf")
+    allowed, _, retry_after = reserve_all(windows, tokens, tokens, guard=guard)
+    return allowed, retry_after
+
+
+async def acquire_all_async(
+    client: AsyncRedis,
+    windows: Windows,
+    tokens: float = 1.0,
+    *,
+    guard: Optional[ProviderGuard] = None,
+) -> tuple[bool, float]:
+    """Asyncio variant of :func:`acquire_all` using ``client`` for I/O.
+
+    Bucket parameters and the in-process fallback state are shared with the
+    synchronous path, so both may be used against the same windows.
+    """
+
+    if math.isinf(tokens):
+        return False, float("inf")
+    allowed, _, retry_after = await reserve_all_async(
+        client, windows, tokens, tokens, guard=guard
+    )
+    return allowed, retry_after
+
+
+def reserve_all(
+    windows: Windows,
+    min_tokens: float,
+    max_tokens: float,
+    *,
+    refund: float = 0.0,
+    guard: Optional[ProviderGuard] = None,
+) -> tuple[bool, float, float]:
+    """Take as many tokens as possible, up to ``max_tokens``, from all windows.
+
+    The request is denied unless at least ``min_tokens`` are available in
+    every window. ``refund`` tokens are credited back first in the same
+    round trip. Returns ``(allowed, granted, retry_after)``.
+    """
+
+    first = windows[0][0]
+    now = first.time()
+    keys, args = _script_args(windows, now, refund, min_tokens, max_tokens, guard)
+    try:
+        reply = _acquire_script(first.redis, keys, args)
+    except RedisError:
+        # Fallback to in-process buckets on Redis failure
+        return _reserve_all_local(windows, now, refund, min_tokens, max_tokens)
+    return _parse_reply(reply, guard)
+
+
+async def reserve_all_async(
+    client: AsyncRedis,
+    windows: Windows,
+    min_tokens: float,
+    max_tokens: float,
+    *,
+    refund: float = 0.0,
+    guard: Optional[ProviderGuard] = None,
+) -> tuple[bool, float, float]:
+    """Asyncio variant of :func:`reserve_all` using ``client`` for I/O."""
+
+    now = windows[0][0].time()
+    keys, args = _script_args(windows, now, refund, min_tokens, max_tokens, guard)
+    try:
+        reply = await _acquire_script.run_async(client, keys, args)
+    except RedisError:
+        # Fallback to in-process buckets on Redis failure
+        return _reserve_all_local(windows, now, refund, min_tokens, max_tokens)
+    return _parse_reply(reply, guard)
+
+
+def release_all(windows: Windows, tokens: float) -> None:
+    """Credit ``tokens`` back to every window, capped at capacity."""
+
+    if tokens > 0:
+        reserve_all(windows, 0.0, 0.0, refund=tokens)
+
+
+async def release_all_async(client: AsyncRedis, windows: Windows, tokens: float) -> None:
+    """Asyncio variant of :func:`release_all` using ``client`` for I/O."""
+
+    if tokens > 0:
+        await reserve_all_async(client, windows, 0.0, 0.0, refund=tokens)
+
+
+def _script_args(
+    windows: Windows,
+    now: float,
+    refund: float,
+    min_tokens: float,
+    max_tokens: float,
+    guard: Optional[ProviderGuard] = None,
+) -> tuple[list[str], list[str]]:
+    """Build ``KEYS`` and ``ARGV`` for :data:`ACQUIRE_SCRIPT`."""
+
+    keys = [key for _, key in windows]
+    if guard is not None:
+        keys.extend((guard.freeze_key, guard.clamp_key))
+    args = [repr(now), repr(float(refund)), repr(float(min_tokens)), repr(float(max_tokens))]
+    for bucket, _ in windows:
+        args.extend(bucket._args)
+    return keys, args
+
+
+def _parse_reply(
+    reply: Sequence[bytes | str | int], guard: Optional[ProviderGuard] = None
+) -> tuple[bool, float, float]:
+    """Decode an :data:`ACQUIRE_SCRIPT` reply, reporting the shared clamp."""
+
+    allowed, granted, retry_after, clamp = reply
+    if guard is not None and clamp:
+        guard.on_clamp(float(clamp))
+    return bool(int(allowed)), float(granted), _parse_retry_after(retry_after)
+
+
+def _reserve_all_local(
+    windows: Windows,
+    now: float,
+    refund: float,
+    min_tokens: float,
+    max_tokens: float,
+) -> tuple[bool, float, float]:
+    """Local in-memory equivalent of :func:`reserve_all`.
+
+    Keys that no longer fit in a full fallback store are denied until a
+    tracked bucket refills and can be evicted.
+    """
+
+    stores = [(bucket.local_buckets, key) for bucket, key in windows]
+    if not all(store.has_room(key, now) for store, key in stores):
+        return False, 0.0, max(store.next_refill(now) for store, _ in stores)
+    levels = [
+        min(store.capacity, store.level(key, now) + refund) for store, key in stores
+    ]
+    granted = min([max_tokens, *levels])
+    allowed = granted >= min_tokens
+    retry_after = 0.0
+    if not allowed:
+        granted = 0.0
+        for (bucket, _), available in zip(windows, levels):
+            if available < min_tokens:
+                retry_after = max(retry_after, bucket._retry_after(available, min_tokens))
+    if granted > 0 or refund > 0:
+        for (store, key), available in zip(stores, levels):
+            store.store(key, available - granted, now)
+    return allowed, granted, retry_after
@@ -0,0 +1,276 @@
+"""Background refreshers keeping provider snapshots hot in memory.
+
+A :class:`SnapshotRefresher` polls one provider call on an asyncio task and
+keeps the latest result in :attr:`~SnapshotRefresher.value`, so endpoints can
+serve it without any I/O. The polling cadence is derived from the provider
+budget (see :func:`budget_interval`) and every poll still takes a token from
+the shared bucket, so refreshers in several processes stay within budget.
+
+Polling backs off exponentially, up to ``max_backoff``, while the provider
+breaker is open, while the provider keeps failing, and while the
+:class:`DiskGuard` reports low disk space.
+
+Subscribers of :meth:`SnapshotRefresher.events` are woken by the poll that
+changes the snapshot, so one upstream call feeds any number of live streams.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from pydantic import BaseModel
+
+from app.http_cache import mark_token_spent
+from app.rate_limiting import CircuitBreaker, CircuitBreakerOpen, acquire_async
+from app.rate_limiting.provider_budgets import ProviderBudget
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+DISK_GUARD_MIN_FREE = 2 * 1024**3  # bytes; below this ingest cadence is reduced
+
+
+def without_asof(value: Any) -> Any:
+    """Fingerprint a snapshot ignoring its retrieval time."""
+
+    if isinstance(value, BaseModel):
+        return value.model_dump(exclude={"asof"})
+    return value
+
+
+def budget_interval(budget: ProviderBudget, share: float = 0.5) -> float:
+    """Seconds between polls spending ``share`` of the tightest budget window.
+
+    For example mempool.space's 1 req/s budget yields one poll every two
+    seconds, leaving the other half for on-demand calls.
+    """
+
+    periods = (
+        (budget.per_sec, 1.0),
+        (budget.per_min, 60.0),
+        (budget.per_day, 86400.0),
+    )
+    spacing = max((seconds / limit for limit, seconds in periods if limit), default=1.0)
+    return spacing / share
+
+
+class DiskGuard:
+    """Report whether free space on ``path`` fell below ``min_free`` bytes.
+
+    Parameters
+    ----------
+    path:
+        Directory on the volume holding the Parquet/DuckDB data.
+    min_free:
+        Free-space threshold in bytes.
+    """
+
+    def __init__(
+        self,
+        path: str = ".",
+        min_free: int = DISK_GUARD_MIN_FREE,
+        *,
+        disk_usage: Callable[[str], Tuple[int, int, int]] = shutil.disk_usage,
+    ) -> None:
+        self.path = path
+        self.min_free = min_free
+        self._disk_usage = disk_usage
+
+    @classmethod
+    def from_env(cls) -> "DiskGuard":
+        """Build from ``DATA_DIR`` and ``DISK_GUARD_MIN_FREE_BYTES``."""
+
+        return cls(
+            os.getenv("DATA_DIR", "data"),
+            int(os.getenv("DISK_GUARD_MIN_FREE_BYTES", str(DISK_GUARD_MIN_FREE))),
+        )
+
+    def engaged(self) -> bool:
+        try:
+            free = self._disk_usage(self.path)[2]
+        except OSError:
+            return False  # a missing data dir does not stop polling
+        return free < self.min_free
+
+
+class SnapshotRefresher(Generic[T]):
+    """Poll ``fetch`` in the background and hold its latest result.
+
+    Parameters
+    ----------
+    provider:
+        Provider name used for the token bucket and metrics.
+    route:
+        Route label passed to the token bucket.
+    fetch:
+        Coroutine function returning a fresh snapshot.
+    interval:
+        Seconds between polls while healthy.
+    breaker:
+        Breaker guarding ``fetch``; a private one is created when omitted.
+    disk_guard:
+        Optional guard slowing polls down on low disk space.
+    max_backoff:
+        Upper bound for the delay between polls while backing off.
+    acquire:
+        Token bucket check taken before every poll.
+    fingerprint:
+        Maps a snapshot to the value compared to detect a change.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        route: str,
+        fetch: Callable[[], Awaitable[T]],
+        *,
+        interval: float,
+        breaker: Optional[CircuitBreaker] = None,
+        disk_guard: Optional[DiskGuard] = None,
+        max_backoff: float = 60.0,
+        acquire: Callable[[str, str], Awaitable[Tuple[bool, float]]] = acquire_async,
+        time_func: Callable[[], float] | None = None,
+        fingerprint: Callable[[T], Any] = without_asof,
+    ) -> None:
+        self.provider = provider
+        self.route = route
+        self.fetch = fetch
+        self.interval = interval
+        self.breaker = breaker or CircuitBreaker(3, 30.0)
+        self.disk_guard = disk_guard
+        self.max_backoff = max(max_backoff, interval)
+        self.acquire = acquire
+        self.time = time_func or time.time
+        self.fingerprint = fingerprint
+        self.value: Optional[T] = None
+        self.updated_at: Optional[float] = None
+        self.version = 0
+        self.subscribers = 0
+        self.polls: Counter[str] = Counter()
+        # Event ids survive a restart without colliding with earlier ones.
+        self._epoch = int(self.time())
+        self._changed = asyncio.Event()
+        self._delay = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh_once(self) -> float:
+        """Poll once if allowed and return the delay before the next poll."""
+
+        if self.disk_guard is not None and self.disk_guard.engaged():
+            return self._back_off("disk_guard")
+        allowed, retry_after = await self.acquire(self.provider, self.route)
+        if not allowed:
+            self.polls["throttled"] += 1
+            return max(self.interval, retry_after)
+        mark_token_spent(self.provider)
+        try:
+            value = await self.breaker.call(self.fetch)
+        except CircuitBreakerOpen:
+            return self._back_off("breaker_open")
+        except Exception:
+            logger.warning("refresh of %s failed", self.provider, exc_info=True)
+            return self._back_off("failed")
+        self._publish(value)
+        self.updated_at = self.time()
+        self.polls["ok"] += 1
+        self._delay = self.interval
+        return self.interval
+
+    def _publish(self, value: T) -> None:
+        """Store ``value`` and wake subscribers if it differs from the last one."""
+
+        changed = self.value is None or self.fingerprint(value) != self.fingerprint(
+            self.value
+        )
+        self.value = value
+        if changed:
+            self.version += 1
+            waiter, self._changed = self._changed, asyncio.Event()
+            waiter.set()
+
+    @property
+    def event_id(self) -> str:
+        """Identifier of the current snapshot, for ``Last-Event-ID`` resume."""
+
+        return f"{self._epoch}.{self.version}"
+
+    async def events(
+        self, last_event_id: Optional[str] = None, heartbeat: float = 15.0
+    ) -> AsyncIterator[Optional[Tuple[str, T]]]:
+        """Yield ``(event_id, snapshot)`` on every change, ``None`` as a heartbeat.
+
+        The current snapshot is sent first unless ``last_event_id`` names it.
+        """
+
+        self.subscribers += 1
+        try:
+            sent = last_event_id
+            while True:
+                if self.value is not None and self.event_id != sent:
+                    sent = self.event_id
+                    yield sent, self.value
+                    continue
+                waiter = self._changed
+                try:
+                    await asyncio.wait_for(waiter.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+    def _back_off(self, reason: str) -> float:
+        self.polls[reason] += 1
+        self._delay = min(self._delay * 2, self.max_backoff)
+        return self._delay
+
+    async def run(self) -> None:
+        """Poll until cancelled."""
+
+        while True:
+            await asyncio.sleep(await self.refresh_once())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the polling task and wait for it to finish."""
+
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def render_metrics(self) -> str:
+        """Render poll outcomes and snapshot age in Prometheus text format."""
+
+        lines = [
+            f'refresher_polls_total{{provider="{self.provider}",outcome="{outcome}"}} {count}'
+            for outcome, count in sorted(self.polls.items())
+        ]
+        lines.append(
+            f'refresher_subscribers{{provider="{self.provider}"}} {self.subscribers}'
+        )
+        if self.updated_at is not None:
+            age = self.time() - self.updated_at
+            lines.append(f'refresher_snapshot_age_seconds{{provider="{self.provider}"}} {age:f}')
+        return "".join(line + "\n" for line in lines)
+
+
+__all__ = ["DiskGuard", "SnapshotRefresher", "budget_interval", "without_asof"]
@@ -0,0 +1,79 @@
+"""Read-only view of the asset registry (``registry/assets.json``).
+
+The registry is authoritative and immutable at runtime. It maps the opaque
+``asset_id`` used across the system, and any of its aliases, to the ids each
+provider knows the asset by (``provider_ids``).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+DEFAULT_REGISTRY_PATH = Path(__file__).resolve().parents[2] / "registry" / "assets.json"
+
+
+@dataclass(frozen=True)
+class RegistryAsset:
+    """One registry entry."""
+
+    asset_id: str
+    provider_ids: Mapping[str, str] = field(default_factory=dict)
+    aliases: Tuple[str, ...] = ()
+
+
+class AssetRegistry:
+    """Resolve asset ids and aliases to registry entries.
+
+    Lookups are case-insensitive.
+    """
+
+    def __init__(self, assets: Iterable[RegistryAsset] = ()) -> None:
+        self._index: Dict[str, RegistryAsset] = {}
+        for asset in assets:
+            for name in (asset.asset_id, *asset.aliases):
+                self._index.setdefault(name.lower(), asset)
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "AssetRegistry":
+        return cls(
+            RegistryAsset(
+                asset_id=item["asset_id"],
+                provider_ids=dict(item.get("provider_ids", {})),
+                aliases=tuple(item.get("aliases", ())),
+            )
+            for item in data.get("assets", ())
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "AssetRegistry":
+        """Load ``path``; a missing file yields an empty registry."""
+
+        try:
+            text = Path(path).read_text()
+        except FileNotFoundError:
+            return cls()
+        return cls.from_dict(json.loads(text))
+
+    def resolve(self, name: str) -> Optional[RegistryAsset]:
+        return self._index.get(name.lower())
+
+    def provider_id(self, name: str, provider: str) -> Optional[str]:
+        """Return ``provider``'s id for the asset called ``name``, if known."""
+
+        asset = self.resolve(name)
+        return None if asset is None else asset.provider_ids.get(provider)
+
+
+@lru_cache(maxsize=1)
+def get_registry() -> AssetRegistry:
+    """Registry from ``ASSET_REGISTRY_PATH``, loaded once per process."""
+
+    return AssetRegistry.load(os.getenv("ASSET_REGISTRY_PATH", str(DEFAULT_REGISTRY_PATH)))
+
+
+__all__ = ["AssetRegistry", "RegistryAsset", "get_registry"]
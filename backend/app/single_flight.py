@@ -0,0 +1,129 @@
+"""Keyed single-flight coalescing for provider calls.
+
+Concurrent calls with the same key share one in-flight task: the first
+caller starts it and later callers await the same result or exception. The
+shared task is shielded, so a cancelled caller does not cancel the call for
+the others. Results are shared objects and must be treated as read-only.
+
+:meth:`SingleFlight.do_many` does the same per item of a batch call: items
+already in flight are joined and only the rest go into one new call.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from functools import partial
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Mapping, Tuple, TypeVar
+
+T = TypeVar("T")
+Key = Tuple[Hashable, ...]
+
+# Stands in for items a batch call did not return.
+_MISSING = object()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls onto one in-flight task.
+
+    Keys are tuples whose first item names the provider; it is used to label
+    the ``calls`` (upstream calls started) and ``coalesced`` (callers that
+    joined an in-flight call) counters.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls: Counter[str] = Counter()
+        self.coalesced: Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Tuple[Hashable, ...], func: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of ``func()``, sharing it with identical calls.
+
+        Raises
+        ------
+        Exception
+            Whatever ``func`` raised, re-raised in every waiting caller.
+        """
+
+        provider = str(key[0])
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._done, key))
+            self.calls[provider] += 1
+        else:
+            self.coalesced[provider] += 1
+        return await asyncio.shield(task)
+
+    async def do_many(
+        self,
+        keys: Iterable[Key],
+        func: Callable[[List[Key]], Awaitable[Mapping[Key, T]]],
+    ) -> Dict[Key, T]:
+        """Return ``func``'s results for ``keys``, sharing each item with concurrent calls.
+
+        Keys already in flight (from another ``do_many``) are joined; the
+        others are passed to a single ``func(keys)`` call that later callers
+        can join item by item. Keys ``func`` does not return are left out of
+        the result. Use keys distinct from those given to :meth:`do`.
+
+        Raises
+        ------
+        Exception
+            Whatever a joined or started ``func`` raised.
+        """
+
+        tasks: Dict[Key, asyncio.Future] = {}
+        fresh: List[Key] = []
+        for key in dict.fromkeys(keys):
+            task = self._inflight.get(key)
+            if task is None:
+                fresh.append(key)
+            else:
+                self.coalesced[str(key[0])] += 1
+                tasks[key] = task
+        if fresh:
+            batch = asyncio.ensure_future(func(fresh))
+            self.calls[str(fresh[0][0])] += 1
+            for key in fresh:
+                task = asyncio.ensure_future(_item(batch, key))
+                self._inflight[key] = task
+                task.add_done_callback(partial(self._done, key))
+                tasks[key] = task
+        results: Dict[Key, T] = {}
+        for key, task in tasks.items():
+            value = await asyncio.shield(task)
+            if value is not _MISSING:
+                results[key] = value
+        return results
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller was cancelled
+
+    def render_metrics(self) -> str:
+        """Return the counters in Prometheus text format."""
+
+        lines = []
+        for name, counter in (("calls", self.calls), ("coalesced", self.coalesced)):
+            for provider, value in sorted(counter.items()):
+                lines.append(
+                    f'provider_singleflight_{name}_total{{provider="{provider}"}} {value}'
+                )
+        return "".join(line + "\n" for line in lines)
+
+
+async def _item(batch: "asyncio.Future[Mapping[Key, T]]", key: Key) -> object:
+    return (await batch).get(key, _MISSING)
+
+
+# Shared by every provider client in the process.
+single_flight = SingleFlight()
+
+__all__ = ["SingleFlight", "single_flight"]
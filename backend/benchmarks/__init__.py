@@ -0,0 +1 @@
+"""Ad-hoc performance benchmarks for the backend (not part of the test suite)."""
@@ -0,0 +1,77 @@
+"""Measure indicator throughput in bars per second on a single core.
+
+Runs each function of :mod:`app.indicators` over a synthetic random-walk
+close series and reports the best of ``--repeat`` runs. The default target
+is one million bars per second for the full ``/assets/{asset_id}/metrics``
+set; ``--check`` exits non-zero when it is missed.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.indicators --bars 1000000
+    OMP_NUM_THREADS=1 python -m benchmarks.indicators --check
+
+numpy does not multithread these kernels, so one process measures one core.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+from app import indicators
+
+TARGET_BARS_PER_SEC = 1_000_000
+
+
+def _cases(close: np.ndarray) -> Dict[str, Callable[[], object]]:
+    return {
+        "sma(50)": lambda: indicators.sma(close, 50),
+        "ema(26)": lambda: indicators.ema(close, 26),
+        "ema(200)": lambda: indicators.ema(close, 200),
+        "rsi(14)": lambda: indicators.rsi(close, 14),
+        "macd(12,26,9)": lambda: indicators.macd(close),
+        "drawdown": lambda: indicators.drawdown(close),
+        "drawdown(365)": lambda: indicators.drawdown(close, 365),
+        # Defaults of the metrics endpoint.
+        "endpoint set": lambda: indicators.compute(
+            close,
+            sma_windows=(20, 50),
+            ema_spans=(12, 26),
+            rsi_period=14,
+            macd_spans=(12, 26, 9),
+        ),
+    }
+
+
+def _best(run: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bars", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="fail below the target rate")
+    args = parser.parse_args()
+
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(size=args.bars))
+    rates = {}
+    for name, run in _cases(close).items():
+        elapsed = _best(run, args.repeat)
+        rates[name] = args.bars / elapsed
+        print(f"{name:<14} {elapsed * 1000:8.2f} ms  {rates[name] / 1e6:8.2f} M bars/s")
+    if args.check and rates["endpoint set"] < TARGET_BARS_PER_SEC:
+        sys.exit(f"endpoint set below {TARGET_BARS_PER_SEC:,} bars/s")
+
+
+if __name__ == "__main__":
+    main()
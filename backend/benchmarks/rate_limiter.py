@@ -0,0 +1,129 @@
+"""Compare the asyncio rate limiter against the legacy threadpool path.
+
+Drives ``/health`` and ``/fx/{base}/{quote}`` in-process through
+:class:`httpx.ASGITransport` with a fixed number of concurrent clients and
+reports throughput and latency percentiles for each limiter mode.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.rate_limiter --requests 2000 --concurrency 64
+    python -m benchmarks.rate_limiter --redis-url redis://127.0.0.1:6379/15
+
+Without ``--redis-url`` an in-memory fakeredis server is used, which
+measures limiter and dispatch overhead but not network latency.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import statistics
+import time
+from typing import Callable
+
+import httpx
+from fastapi import HTTPException, Request
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from app.main import Health, app, get_health_data, rate_limiter
+from app.rate_limiting import acquire, init, set_async_client
+from app.rate_limiting.provider_budgets import ProviderBudget
+
+ROUTES = ("/health", "/fx/USD/EUR")
+
+# Ceilings high enough that the benchmark measures overhead, not throttling.
+BENCH_BUDGETS = {"coingecko": ProviderBudget(per_sec=1e9, per_min=1e9)}
+
+
+def sync_rate_limiter(request: Request) -> None:
+    """Previous synchronous dependency; FastAPI runs it in the threadpool."""
+
+    provider = request.headers.get("X-Provider", "coingecko")
+    allowed, retry_after = acquire(provider, request.url.path)
+    if not allowed:
+        raise HTTPException(
+            status_code=429, headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+
+async def _health() -> Health:
+    return Health(status="ok", versions={}, uptime=0.0)
+
+
+async def _drive(route: str, requests: int, concurrency: int) -> tuple[float, list[float]]:
+    """Issue ``requests`` GETs with ``concurrency`` workers; return wall time and latencies."""
+
+    latencies: list[float] = []
+    remaining = iter(range(requests))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker() -> None:
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.get(route)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start, latencies
+
+
+def _report(mode: str, route: str, elapsed: float, latencies: list[float]) -> None:
+    cuts = statistics.quantiles(latencies, n=100)
+    print(
+        f"{mode:<5} {route:<12} {len(latencies) / elapsed:>9.0f} req/s  "
+        f"p50 {cuts[49] * 1000:6.2f} ms  p99 {cuts[98] * 1000:6.2f} ms"
+    )
+
+
+async def _run(args: argparse.Namespace, clients: tuple[Callable, Callable]) -> None:
+    make_sync, make_async = clients
+    app.dependency_overrides[get_health_data] = _health
+    try:
+        for mode in ("sync", "async"):
+            async_client = make_async() if mode == "async" else None
+            init(make_sync(), budgets=BENCH_BUDGETS, async_client=async_client)
+            if mode == "sync":
+                app.dependency_overrides[rate_limiter] = sync_rate_limiter
+            else:
+                app.dependency_overrides.pop(rate_limiter, None)
+            for route in ROUTES:
+                await _drive(route, args.concurrency, args.concurrency)  # warm-up
+                elapsed, latencies = await _drive(route, args.requests, args.concurrency)
+                _report(mode, route, elapsed, latencies)
+            if async_client is not None:
+                set_async_client(None)
+                await async_client.aclose()
+    finally:
+        app.dependency_overrides.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    if args.redis_url:
+        clients = (
+            lambda: Redis.from_url(args.redis_url),
+            lambda: AsyncRedis.from_url(args.redis_url, max_connections=args.concurrency),
+        )
+    else:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        clients = (
+            lambda: fakeredis.FakeRedis(server=server),
+            lambda: fakeredis.FakeAsyncRedis(server=server),
+        )
+    asyncio.run(_run(args, clients))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from pathlib import Path
 
 import jsonschema
 import pytest
+from app.candles import decode_candles
 from app.main import (Candle, ErrorResponse, GasPrices, Health, ImportResult,
                       MempoolData, app, fetch_candles, get_btc_mempool_data,
                       get_eth_gas_data, rate_limiter)
@@ -49,9 +50,9 @@ def clean_schema(schema: dict) -> dict:
 
 @pytest.fixture(autouse=True)
 def provider_overrides(coingecko_candles, etherscan_gas, mempool_space):
-    app.dependency_overrides[fetch_candles] = lambda asset_id: [
-        Candle(**c) for c in coingecko_candles
-    ]
+    app.dependency_overrides[fetch_candles] = lambda asset_id: decode_candles(
+        coingecko_candles, source="coingecko"
+    )
     app.dependency_overrides[get_eth_gas_data] = lambda: GasPrices(**etherscan_gas)
     app.dependency_overrides[get_btc_mempool_data] = lambda: MempoolData(
         **mempool_space
@@ -0,0 +1,183 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app import main
+from app.main import NDJSON, Health, admission_priority, app, get_health_data
+from app.rate_limiting import AdmissionQueue, Priority
+
+pytestmark = pytest.mark.unit
+
+
+class FakeBucket:
+    """Acquire function handing out tokens only when refilled by the test."""
+
+    def __init__(self, tokens: int = 0, retry_after: float = 0.01) -> None:
+        self.tokens = tokens
+        self.retry_after = retry_after
+        self.calls = 0
+
+    async def __call__(self, provider: str, route: str, tokens: float = 1.0):
+        self.calls += 1
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        return False, self.retry_after
+
+
+@pytest.mark.asyncio
+async def test_fast_path_without_waiters():
+    bucket = FakeBucket(tokens=1)
+    queue = AdmissionQueue(bucket)
+    assert await queue.acquire("cg", "/candles") == (True, 0.0)
+    assert bucket.calls == 1
+    assert queue.depth["cg"] == 0
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_admitted_by_priority_then_fifo():
+    bucket = FakeBucket()
+    queue = AdmissionQueue(bucket, default_deadline=2)
+    order = []
+
+    async def request(name: str, priority: Priority):
+        allowed, _ = await queue.acquire("cg", "/x", priority=priority)
+        order.append((name, allowed))
+
+    tasks = [
+        asyncio.create_task(request("backfill-1", Priority.BACKFILL)),
+        asyncio.create_task(request("backfill-2", Priority.BACKFILL)),
+        asyncio.create_task(request("candles-1", Priority.INTERACTIVE)),
+        asyncio.create_task(request("candles-2", Priority.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0.02)
+    assert queue.depth["cg"] == 4
+    for _ in range(4):
+        bucket.tokens += 1
+        await asyncio.sleep(0.03)
+    await asyncio.gather(*tasks)
+
+    assert order == [
+        ("candles-1", True),
+        ("candles-2", True),
+        ("backfill-1", True),
+        ("backfill-2", True),
+    ]
+    assert queue.admitted["cg"] == 4
+    assert 'rate_limit_queue_admitted_total{provider="cg"} 4' in queue.render_metrics()
+
+
+@pytest.mark.asyncio
+async def test_deadline_rejects_with_retry_after():
+    queue = AdmissionQueue(FakeBucket(retry_after=0.01))
+    allowed, retry_after = await queue.acquire("cg", "/x", deadline=0.05)
+    assert not allowed
+    assert retry_after == 0.01
+    assert queue.rejected["cg", "deadline"] == 1
+    assert queue.depth["cg"] == 0
+    assert queue.wait_seconds["cg"] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_unreachable_deadline_is_rejected_immediately():
+    bucket = FakeBucket(retry_after=60)
+    queue = AdmissionQueue(bucket)
+    assert await queue.acquire("cg", "/x", deadline=1) == (False, 60)
+    assert bucket.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_sheds_backfill_then_rejects():
+    bucket = FakeBucket()
+    queue = AdmissionQueue(bucket, max_depth=1)
+    backfill = asyncio.create_task(queue.acquire("cg", "/x", priority=Priority.BACKFILL))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(queue.acquire("cg", "/x"))
+    await asyncio.sleep(0)
+
+    assert (await backfill)[0] is False
+    assert queue.rejected["cg", "shed"] == 1
+    assert await queue.acquire("cg", "/x") == (False, 0.01)
+    assert queue.rejected["cg", "full"] == 1
+
+    bucket.tokens = 1
+    assert await interactive == (True, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_token_for_expired_waiters_is_refunded():
+    refunds = []
+    calls = 0
+
+    async def acquire(provider, route, tokens=1.0):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            return False, 0.01
+        await asyncio.sleep(0.1)  # the waiter's deadline passes meanwhile
+        return True, 0.0
+
+    async def refund(provider, tokens):
+        refunds.append((provider, tokens))
+
+    queue = AdmissionQueue(acquire, refund=refund)
+    assert (await queue.acquire("cg", "/x", deadline=0.05))[0] is False
+    await asyncio.sleep(0.15)
+
+    assert refunds == [("cg", 1.0)]
+    assert queue.admitted["cg"] == 0
+
+
+def _routed(path: str, **headers: str) -> Request:
+    raw = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request(
+        {"type": "http", "headers": raw, "route": SimpleNamespace(path=path), "path": path}
+    )
+
+
+def test_admission_priority_comes_from_the_route_not_the_client():
+    candles = "/assets/{asset_id}/candles"
+
+    assert admission_priority(_routed("/portfolio/holdings/import")) is Priority.BACKFILL
+    assert admission_priority(
+        _routed("/portfolio/holdings/import", **{"X-Priority": "interactive"})
+    ) is Priority.BACKFILL
+    assert admission_priority(_routed(candles, Accept=NDJSON)) is Priority.BACKFILL
+    assert admission_priority(_routed(candles)) is Priority.INTERACTIVE
+    assert admission_priority(
+        _routed("/health", **{"X-Priority": "backfill"})
+    ) is Priority.INTERACTIVE
+
+
+@pytest.mark.asyncio
+async def test_close_rejects_waiters():
+    queue = AdmissionQueue(FakeBucket())
+    waiter = asyncio.create_task(queue.acquire("cg", "/x"))
+    await asyncio.sleep(0.02)
+    await queue.close()
+    assert (await waiter)[0] is False
+
+
+def test_rate_limiter_waits_in_queue(monkeypatch: pytest.MonkeyPatch) -> None:
+    bucket = FakeBucket(tokens=1)
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setenv("RATE_LIMIT_QUEUE_DEPTH", "10")
+    monkeypatch.setattr(main, "acquire_async", bucket)
+
+    async def override() -> Health:
+        return Health(status="ok", versions={}, uptime=1.0)
+
+    app.dependency_overrides[get_health_data] = override
+    try:
+        with TestClient(app) as client:
+            assert client.get("/health").status_code == 200
+            response = client.get("/health", headers={"X-Queue-Deadline": "0.05"})
+            assert response.status_code == 429
+            assert response.headers["Retry-After"] == "1"
+            assert app.state.admission_queue.rejected["coingecko", "deadline"] == 1
+    finally:
+        app.dependency_overrides.clear()
+    assert app.state.admission_queue is None
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import pytest
+from redis.exceptions import RedisError
+
+from app.providers.fx import FXClient
+from app.rate_limiting import (
+    CircuitBreaker,
+    CircuitBreakerOpen,
+    CircuitState,
+    FailureRateBreaker,
+    RedisBreakerStore,
+)
+
+pytestmark = pytest.mark.unit
+
+
+def _clock(start: float = 1000.0):
+    current = {"value": start}
+
+    def now() -> float:
+        return current["value"]
+
+    def advance(seconds: float) -> None:
+        current["value"] += seconds
+
+    return now, advance
+
+
+def _wait_for(predicate, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "state change not propagated"
+        time.sleep(0.01)
+
+
+async def _eventually(predicate, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "state change not propagated"
+        await asyncio.sleep(0.01)
+
+
+async def _fail():
+    raise RuntimeError("boom")
+
+
+async def _ok():
+    return "ok"
+
+
+@pytest.fixture
+def stores():
+    server = fakeredis.FakeServer()
+    now, advance = _clock()
+    started = []
+
+    def make(listen: bool = True) -> RedisBreakerStore:
+        store = RedisBreakerStore(fakeredis.FakeRedis(server=server), wall_time=now)
+        if listen:
+            store.start(poll_interval=0.01)
+            started.append(store)
+        return store
+
+    try:
+        yield make, now, advance
+    finally:
+        for store in started:
+            store.stop()
+
+
+@pytest.mark.asyncio
+async def test_open_propagates_to_every_process(stores):
+    make, now, advance = stores
+    api = CircuitBreaker(1, 30, time_func=now, name="fx", store=make())
+    worker = CircuitBreaker(1, 30, time_func=now, name="fx", store=make())
+
+    with pytest.raises(RuntimeError):
+        await worker.call(_fail)
+    await _eventually(lambda: api.state is CircuitState.OPEN)
+    with pytest.raises(CircuitBreakerOpen):
+        await api.call(_ok)
+
+    advance(30)
+    assert await api.call(_ok) == "ok"  # the API process probed and closed it
+    await _eventually(lambda: worker.state is CircuitState.CLOSED)
+    assert worker.last_recovery == 30
+
+
+@pytest.mark.asyncio
+async def test_new_process_loads_shared_state(stores):
+    make, now, advance = stores
+    CircuitBreaker(1, 30, time_func=now, name="fx", store=make()).force_open()
+    advance(10)
+
+    late = CircuitBreaker(1, 30, time_func=now, name="fx", store=make(listen=False))
+    assert late.state is CircuitState.OPEN
+    with pytest.raises(CircuitBreakerOpen):
+        await late.call(_ok)
+    advance(20)  # opened_at is shared, not reset by the late joiner
+    assert await late.call(_ok) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_single_probe_across_processes(stores):
+    make, now, advance = stores
+    first = FailureRateBreaker(
+        1.0, 30, minimum_calls=1, time_func=now, name="cg", store=make(listen=False)
+    )
+    second = FailureRateBreaker(
+        1.0, 30, minimum_calls=1, time_func=now, name="cg", store=make(listen=False)
+    )
+    first.force_open()
+    second._apply_remote(*second.store.load("cg"))
+    advance(30)
+
+    assert await first._admit(now()) is True  # claims the fleet-wide probe
+    with pytest.raises(CircuitBreakerOpen):
+        await second._admit(now())  # lost the claim, adopts HALF_OPEN
+    assert second.state is CircuitState.HALF_OPEN
+
+    advance(30)  # the prober went silent; another process takes over
+    assert await second._admit(now()) is True
+
+
+@pytest.mark.asyncio
+async def test_store_io_runs_off_the_loop_and_remote_changes_on_it(stores):
+    make, now, _ = stores
+    loop_thread = threading.get_ident()
+    writers, appliers = [], []
+
+    class Recording(CircuitBreaker):
+        def _apply_remote(self, *args, **kwargs):
+            appliers.append(threading.get_ident())
+            super()._apply_remote(*args, **kwargs)
+
+    worker_store = make()
+    original = worker_store.transition
+
+    def transition(*args):
+        writers.append(threading.get_ident())
+        return original(*args)
+
+    worker_store.transition = transition
+    api = Recording(1, 30, time_func=now, name="fx", store=make())
+    worker = CircuitBreaker(1, 30, time_func=now, name="fx", store=worker_store)
+    appliers.clear()
+
+    with pytest.raises(RuntimeError):
+        await worker.call(_fail)
+    await _eventually(lambda: api.state is CircuitState.OPEN)
+
+    assert writers and loop_thread not in writers
+    assert appliers == [loop_thread]
+
+
+def test_force_controls_apply_fleet_wide(stores):
+    make, now, _ = stores
+    breakers = [CircuitBreaker(5, 30, time_func=now, name="fx", store=make()) for _ in range(3)]
+
+    breakers[0].force_open()
+    _wait_for(lambda: all(b.state is CircuitState.OPEN for b in breakers))
+    breakers[2].force_close()
+    _wait_for(lambda: all(b.state is CircuitState.CLOSED for b in breakers))
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_keeps_local_breaker():
+    class FailingRedis:
+        def evalsha(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+        def hmget(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+    now, _ = _clock()
+    store = RedisBreakerStore(FailingRedis())
+    breaker = CircuitBreaker(1, 30, time_func=now, name="fx", store=store)
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_shared_breaker_requires_name(fake_redis):
+    with pytest.raises(ValueError):
+        CircuitBreaker(1, 30, store=RedisBreakerStore(fake_redis))
+
+
+@pytest.mark.asyncio
+async def test_fx_client_uses_injected_breaker():
+    breaker = CircuitBreaker(1, 30)
+    breaker.force_open()
+    client = FXClient(base_url="https://fx.local", breaker=breaker)
+    with pytest.raises(CircuitBreakerOpen):
+        await client.get_rate("USD", "EUR")
@@ -0,0 +1,296 @@
+import json
+
+import numpy as np
+import pytest
+from app.candles import CandleColumns
+from app.main import (
+    ARROW_STREAM,
+    CANDLE_COLUMNS_JSON,
+    NDJSON,
+    app,
+    negotiate,
+    rate_limiter,
+)
+from fastapi.testclient import TestClient
+
+pytest.importorskip("duckdb")
+pa = pytest.importorskip("pyarrow")
+
+from app.candle_store import CandleStore  # noqa: E402
+
+pytestmark = pytest.mark.unit
+
+DAY = 86400
+START = 1_700_006_400  # 2023-11-15T00:00:00Z
+
+
+def _columns(start: int, count: int, step: int, resolution: str) -> CandleColumns:
+    t = start + step * np.arange(count, dtype=np.int64)
+    prices = np.arange(count, dtype=np.float64)
+    return CandleColumns(
+        t=t,
+        o=prices,
+        h=prices + 1,
+        l=prices - 1,
+        c=prices + 0.5,
+        v=prices * 10,
+        asof=np.full(count, 1.0),
+        resolution=[resolution] * count,
+        source=["coingecko"] * count,
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CandleStore(tmp_path)
+    store.write(_columns(START, 72, 3600, "1h"), "btc")
+    store.write(_columns(START, 3, DAY, "1d"), "btc")
+    store.write(_columns(START, 72, 3600, "1h"), "eth")
+    yield store
+    store.close()
+
+
+def test_range_is_half_open_and_sorted(store):
+    columns = store.query("btc", "1h", START + 20 * 3600, START + 30 * 3600)
+
+    assert columns.t.tolist() == [START + hour * 3600 for hour in range(20, 30)]
+    assert columns.o.tolist() == list(map(float, range(20, 30)))
+    assert set(columns.resolution) == {"1h"}
+    assert columns.t.dtype == np.int64
+
+
+def test_interval_and_asset_are_filtered(store):
+    daily = store.query("btc", "1d", START, START + 3 * DAY)
+    hourly = store.query("btc", "1h", START, START + 3 * DAY)
+
+    assert len(daily) == 3
+    assert len(hourly) == 72
+    assert len(store.query("doge", "1h", START, START + DAY)) == 0
+
+
+def test_partitions_outside_the_window_are_not_read(store, tmp_path):
+    corrupt = tmp_path / "dt=2023-11-17" / "asset_id=btc" / "broken.parquet"
+    corrupt.write_bytes(b"not parquet")
+
+    columns = store.query("btc", "1h", START, START + 2 * DAY)
+
+    assert len(columns) == 48
+    with pytest.raises(Exception):
+        store.query("btc", "1h", START, START + 3 * DAY)
+
+
+def test_writes_to_one_partition_append(tmp_path):
+    store = CandleStore(tmp_path)
+    store.write(_columns(START, 12, 3600, "1h"), "sol")
+    store.write(_columns(START + 12 * 3600, 12, 3600, "1h"), "sol")
+
+    columns = store.query("sol", "1h", START, START + DAY)
+    store.close()
+
+    assert len(list((tmp_path / "dt=2023-11-15" / "asset_id=sol").iterdir())) == 2
+    assert columns.t.tolist() == [START + hour * 3600 for hour in range(24)]
+
+
+def test_partition_listing_is_cached_until_written_or_stale(tmp_path, monkeypatch):
+    clock = {"now": 0.0}
+    store = CandleStore(tmp_path, listing_ttl=5.0, time_func=lambda: clock["now"])
+    store.write(_columns(START, 24, 3600, "1h"), "sol")
+    globs = []
+    original = type(tmp_path).glob
+
+    def counting_glob(self, pattern):
+        globs.append(pattern)
+        return original(self, pattern)
+
+    monkeypatch.setattr(type(tmp_path), "glob", counting_glob)
+
+    first = store.version("sol")
+    assert store.version("sol") == first
+    assert len(store.query("sol", "1h", START, START + DAY)) == 24
+    assert len(globs) == 1  # one listing serves ETags and queries alike
+
+    store.write(_columns(START + DAY, 24, 3600, "1h"), "sol")
+    written = store.version("sol")
+    assert written != first  # own writes are visible at once
+
+    (tmp_path / "dt=2023-11-20" / "asset_id=sol").mkdir(parents=True)  # another process
+    assert store.version("sol") == written
+    clock["now"] = 5.0
+    assert store.version("sol") != written
+    store.close()
+
+
+def test_rejects_invalid_arguments(store):
+    with pytest.raises(ValueError):
+        store.query("../btc", "1h", START, START + DAY)
+    with pytest.raises(ValueError):
+        store.query("btc", "15m", START, START + DAY)
+
+
+@pytest.mark.asyncio
+async def test_query_async_matches_sync(store):
+    expected = store.query("eth", "1h", START, START + DAY)
+    columns = await store.query_async("eth", "1h", START, START + DAY)
+    assert columns.to_models() == expected.to_models()
+
+
+def test_endpoint_reads_from_store(store):
+    app.state.candle_store = store
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    try:
+        window = {"interval": "1d", "start": START, "end": START + 2 * DAY}
+        body = client.get("/assets/btc/candles", params=window).json()
+        empty = client.get("/assets/btc/candles", params={**window, "start": START + 2 * DAY})
+        bad_interval = client.get("/assets/btc/candles", params={"interval": "2h"})
+    finally:
+        app.dependency_overrides.clear()
+        app.state.candle_store = None
+
+    assert [candle["t"] for candle in body] == [START, START + DAY]
+    assert body[0]["resolution"] == "1d"
+    assert empty.status_code == 400
+    assert bad_interval.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, "application/json"),
+        ("*/*", "application/json"),
+        (ARROW_STREAM, ARROW_STREAM),
+        (f"{CANDLE_COLUMNS_JSON}, {ARROW_STREAM}", CANDLE_COLUMNS_JSON),
+        (f"{CANDLE_COLUMNS_JSON};q=0.5, {ARROW_STREAM};q=0.9", ARROW_STREAM),
+        (f"{ARROW_STREAM};q=0", "application/json"),
+        ("text/html", "application/json"),
+    ],
+)
+def test_negotiate(accept, expected):
+    offers = ("application/json", CANDLE_COLUMNS_JSON, ARROW_STREAM)
+    assert negotiate(accept, offers) == expected
+
+
+def test_endpoint_negotiates_columnar_formats(store):
+    app.state.candle_store = store
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    window = {"interval": "1h", "start": START, "end": START + 3 * DAY}
+    try:
+        rows = client.get("/assets/btc/candles", params=window)
+        compact = client.get(
+            "/assets/btc/candles", params=window, headers={"Accept": CANDLE_COLUMNS_JSON}
+        )
+        arrow = client.get(
+            "/assets/btc/candles", params=window, headers={"Accept": ARROW_STREAM}
+        )
+    finally:
+        app.dependency_overrides.clear()
+        app.state.candle_store = None
+
+    assert "Accept" in rows.headers["vary"].split(", ")
+    assert compact.headers["content-type"] == CANDLE_COLUMNS_JSON
+    document = compact.json()
+    assert document["resolution"] == "1h"
+    assert document["columns"]["t"] == [candle["t"] for candle in rows.json()]
+    assert len(compact.content) * 2 < len(rows.content)
+
+    assert arrow.headers["content-type"] == ARROW_STREAM
+    table = pa.ipc.open_stream(arrow.content).read_all()
+    assert table.column("t").to_pylist() == document["columns"]["t"]
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_bounded_batches(store):
+    batches = [
+        batch
+        async for batch in store.stream("btc", "1h", START, START + 3 * DAY, batch_size=10)
+    ]
+
+    assert max(len(batch) for batch in batches) <= 10
+    assert np.concatenate([batch.t for batch in batches]).tolist() == (
+        store.query("btc", "1h", START, START + 3 * DAY).t.tolist()
+    )
+    limited = [batch async for batch in store.stream("btc", "1h", START, START + DAY, 5)]
+    assert sum(map(len, limited)) == 5
+
+
+def test_ndjson_pages_follow_next_cursor(store):
+    app.state.candle_store = store
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    params = {"interval": "1h", "start": START, "end": START + 3 * DAY, "limit": 30}
+    pages = []
+    try:
+        while True:
+            response = client.get("/assets/btc/candles", params=params, headers={"Accept": NDJSON})
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            pages.append([line["t"] for line in lines if "t" in line])
+            if "next_cursor" not in lines[-1]:
+                break
+            params["cursor"] = lines[-1]["next_cursor"]
+    finally:
+        app.dependency_overrides.clear()
+        app.state.candle_store = None
+
+    assert response.headers["content-type"] == NDJSON
+    assert list(map(len, pages)) == [30, 30, 12]
+    assert sum(pages, []) == [START + hour * 3600 for hour in range(72)]
+
+
+def test_limit_reports_next_cursor_for_materialized_formats(store):
+    app.state.candle_store = store
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    params = {"interval": "1d", "start": START, "end": START + 3 * DAY, "limit": 2}
+    try:
+        rows = client.get("/assets/btc/candles", params=params)
+        compact = client.get(
+            "/assets/btc/candles", params=params, headers={"Accept": CANDLE_COLUMNS_JSON}
+        )
+        last = client.get("/assets/btc/candles", params={**params, "cursor": START + 2 * DAY})
+        too_large = client.get("/assets/btc/candles", params={**params, "limit": 10**6})
+    finally:
+        app.dependency_overrides.clear()
+        app.state.candle_store = None
+
+    assert [candle["t"] for candle in rows.json()] == [START, START + DAY]
+    assert rows.headers["x-next-cursor"] == str(START + 2 * DAY)
+    assert compact.json()["next_cursor"] == START + 2 * DAY
+    assert [candle["t"] for candle in last.json()] == [START + 2 * DAY]
+    assert "x-next-cursor" not in last.headers
+    assert too_large.status_code == 400
+
+
+def test_not_modified_skips_the_query_until_data_changes(store):
+    queries = []
+    query = store.query
+
+    def counting_query(*args):
+        queries.append(args)
+        return query(*args)
+
+    store.query = counting_query
+    app.state.candle_store = store
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    params = {"interval": "1d", "start": START, "end": START + 5 * DAY}
+    try:
+        first = client.get("/assets/btc/candles", params=params)
+        etag = first.headers["etag"]
+        cached = client.get("/assets/btc/candles", params=params, headers={"If-None-Match": etag})
+        compact = client.get(
+            "/assets/btc/candles",
+            params=params,
+            headers={"If-None-Match": etag, "Accept": CANDLE_COLUMNS_JSON},
+        )
+        store.write(_columns(START + 3 * DAY, 1, DAY, "1d"), "btc")
+        changed = client.get("/assets/btc/candles", params=params, headers={"If-None-Match": etag})
+    finally:
+        app.dependency_overrides.clear()
+        app.state.candle_store = None
+
+    assert cached.status_code == 304
+    assert compact.status_code == 200  # representation is part of the tag
+    assert changed.status_code == 200
+    assert len(changed.json()) == 4
+    assert len(queries) == 3
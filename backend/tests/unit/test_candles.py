@@ -0,0 +1,102 @@
+import httpx
+import numpy as np
+import pytest
+
+from app.candles import Candle, CandleColumns, decode_candles
+from app.providers import CoinGeckoClient
+
+pytestmark = pytest.mark.unit
+
+
+def test_decode_matches_per_row_validation(load_provider_fixture):
+    rows = load_provider_fixture("coingecko_candles.json")
+    for row in rows:
+        row.pop("source")
+
+    columns = decode_candles(rows, source="coingecko")
+
+    assert len(columns) == 2
+    assert columns.t.dtype == np.int64
+    assert columns.c.tolist() == [11.0, 12.0]
+    expected = [Candle(**row, source="coingecko") for row in rows]
+    assert columns.to_models() == expected
+    assert all(isinstance(candle.o, float) for candle in columns.to_models())
+
+
+def test_decode_empty_payload():
+    columns = decode_candles([], source="coingecko")
+    assert len(columns) == 0
+    assert columns.to_models() == []
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        {"o": "10.0"},
+        {"v": None},
+        {"t": 1.5},
+        {"resolution": 5},
+    ],
+)
+def test_decode_rejects_invalid_rows(load_provider_fixture, patch):
+    rows = load_provider_fixture("coingecko_candles.json")
+    rows[1].update(patch)
+    with pytest.raises(ValueError):
+        decode_candles(rows, source="coingecko")
+
+
+def test_decode_rejects_missing_field(load_provider_fixture):
+    rows = load_provider_fixture("coingecko_candles.json")
+    del rows[0]["h"]
+    with pytest.raises(ValueError):
+        decode_candles(rows, source="coingecko")
+
+
+def test_rows_round_trip(load_provider_fixture):
+    columns = decode_candles(load_provider_fixture("coingecko_candles.json"), source="x")
+    again = decode_candles(columns.to_rows(), source="y")
+    assert again.to_models() == columns.to_models()
+
+
+def test_to_arrow_has_parquet_columns(load_provider_fixture):
+    pa = pytest.importorskip("pyarrow")
+    table = decode_candles(load_provider_fixture("coingecko_candles.json"), source="x").to_arrow()
+    assert table.column_names[:6] == ["t", "o", "h", "l", "c", "v"]
+    assert table.schema.field("t").type == pa.int64()
+    assert table.num_rows == 2
+
+
+@pytest.mark.asyncio
+async def test_client_returns_columns(load_provider_fixture):
+    fixture = load_provider_fixture("coingecko_candles.json")
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=fixture)
+
+    client = CoinGeckoClient(base_url="https://cols.local", transport=httpx.MockTransport(handler))
+    columns = await client.get_candle_columns("btc")
+    assert columns.h.tolist() == [12.0, 13.0]
+    assert columns.source == ["coingecko", "coingecko"]
+
+
+def test_columns_hoist_shared_labels(load_provider_fixture):
+    columns = decode_candles(load_provider_fixture("coingecko_candles.json"), source="x")
+
+    document = columns.to_columns()
+
+    assert document["resolution"] == "1d"
+    assert document["source"] == "coingecko"
+    assert document["count"] == 2
+    assert document["columns"]["t"] == [1, 2]
+    assert document["columns"]["asof"] == [1.0, 2.0]  # differs per row
+    assert "resolution" not in document["columns"]
+
+
+def test_arrow_ipc_round_trip(load_provider_fixture):
+    pa = pytest.importorskip("pyarrow")
+    columns = decode_candles(load_provider_fixture("coingecko_candles.json"), source="x")
+
+    table = pa.ipc.open_stream(columns.to_arrow_ipc()).read_all()
+
+    assert table.equals(columns.to_arrow())
+    assert CandleColumns.from_arrow(table).to_models() == columns.to_models()
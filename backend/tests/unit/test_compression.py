@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from app.compression import CompressionMiddleware, choose_encoding, encoded_etag
+from app.conditional import check_not_modified
+from fastapi import FastAPI, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+pytestmark = pytest.mark.unit
+
+BODY = json.dumps([{"t": t, "c": 1.0, "source": "coingecko"} for t in range(200)])
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/big")
+    async def big():
+        return PlainTextResponse(BODY, headers={"ETag": '"abc"'})
+
+    @app.get("/cached")
+    async def cached(if_none_match: str | None = Header(None)):
+        check_not_modified(if_none_match, '"abc"')
+        return PlainTextResponse(BODY, headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("tiny")
+
+    @app.get("/lines")
+    async def lines():
+        async def chunks():
+            for index in range(3):
+                yield f'{{"n":{index}}}\n'
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/events")
+    async def events():
+        return StreamingResponse(iter(["data: 1\n\n"]), media_type="text/event-stream")
+
+    return app
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("gzip, br", "br"),
+        ("gzip;q=1.0, br;q=0.5", "gzip"),
+        ("*", "zstd"),
+        ("br;q=0, *;q=0.1", "zstd"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding(accept, expected):
+    assert choose_encoding(accept) == expected
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_large_bodies_are_compressed(encoding):
+    response = TestClient(_app()).get("/big", headers={"Accept-Encoding": encoding})
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == f'"abc-{encoding}"'
+    assert int(response.headers["content-length"]) < len(BODY) / 4
+    assert response.text == BODY  # httpx decodes all three encodings
+
+
+def test_small_bodies_and_identity_are_untouched():
+    client = TestClient(_app())
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/big", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] == '"abc"'
+
+
+def test_uncompressed_variants_still_vary_on_accept_encoding():
+    client = TestClient(_app())
+
+    for response in (
+        client.get("/small", headers={"Accept-Encoding": "gzip"}),
+        client.get("/big", headers={"Accept-Encoding": "identity"}),
+        client.get("/big", headers={"Accept-Encoding": ""}),
+    ):
+        assert "content-encoding" not in response.headers
+        assert response.headers["vary"] == "Accept-Encoding"
+    assert "vary" not in client.get("/events", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_not_modified_carries_the_validated_representation_tag():
+    client = TestClient(_app())
+    gzip = {"Accept-Encoding": "gzip"}
+
+    tag = client.get("/cached", headers=gzip).headers["etag"]
+    encoded = client.get("/cached", headers={**gzip, "If-None-Match": tag})
+    plain = client.get("/cached", headers={**gzip, "If-None-Match": '"abc"'})
+    identity = client.get(
+        "/cached", headers={"Accept-Encoding": "identity", "If-None-Match": '"abc"'}
+    )
+
+    assert tag == '"abc-gzip"'
+    assert encoded.status_code == 304 and encoded.headers["etag"] == '"abc-gzip"'
+    assert plain.status_code == 304 and plain.headers["etag"] == '"abc"'
+    assert identity.status_code == 304 and identity.headers["etag"] == '"abc"'
+    assert {r.headers["vary"] for r in (encoded, plain, identity)} == {"Accept-Encoding"}
+
+
+def test_streams_are_compressed_per_chunk_but_events_are_not():
+    client = TestClient(_app())
+
+    lines = client.get("/lines", headers={"Accept-Encoding": "gzip"})
+    events = client.get("/events", headers={"Accept-Encoding": "gzip"})
+
+    assert lines.headers["content-encoding"] == "gzip"
+    assert [json.loads(line)["n"] for line in lines.text.splitlines()] == [0, 1, 2]
+    assert "content-encoding" not in events.headers
+
+
+def test_encoded_etag_keeps_weak_tags():
+    assert encoded_etag('"x"', "br") == '"x-br"'
+    assert encoded_etag('W/"x"', "br") == 'W/"x"'
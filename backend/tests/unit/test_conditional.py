@@ -0,0 +1,61 @@
+import pytest
+from app.conditional import etag_matches, make_etag
+from app.main import FXRate, app, fx_watermark, get_fx_rate_data, rate_limiter
+from fastapi.testclient import TestClient
+
+pytestmark = pytest.mark.unit
+
+
+def test_make_etag_is_strong_and_stable():
+    etag = make_etag("fx", "USD", "EUR", 60.0)
+
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("fx", "USD", "EUR", 60.0)
+    assert etag != make_etag("fx", "USD", "EUR", 120.0)
+
+
+@pytest.mark.parametrize(
+    "header,matches",
+    [
+        (None, False),
+        ('"other"', False),
+        ('"tag"', True),
+        ('W/"tag"', True),
+        ('"other", "tag-gzip"', True),
+        ('"tag-br"', True),
+        ("*", True),
+    ],
+)
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"tag"') is matches
+
+
+def test_fx_watermark_is_the_cache_window_start():
+    assert fx_watermark(125.0) == 120.0
+    assert fx_watermark(179.9) == 120.0
+
+
+def test_fx_not_modified_skips_the_rate_lookup():
+    data = FXRate(base="USD", quote="EUR", rate=1.0, asof=0.0, source="test")
+    calls = []
+
+    def lookup(base: str, quote: str) -> FXRate:
+        calls.append((base, quote))
+        return data
+
+    app.dependency_overrides[get_fx_rate_data] = lookup
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    try:
+        first = client.get("/fx/USD/EUR")
+        second = client.get("/fx/USD/EUR", headers={"If-None-Match": first.headers["etag"]})
+        other = client.get("/fx/USD/JPY", headers={"If-None-Match": first.headers["etag"]})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.content == b""
+    assert other.status_code == 200
+    assert calls == [("USD", "EUR"), ("USD", "JPY")]
@@ -0,0 +1,183 @@
+import asyncio
+import json
+from pathlib import Path
+
+import fakeredis
+import httpx
+import pytest
+from jsonschema import Draft7Validator
+
+from app.provider_cache import provider_cache
+from app.providers.fx import DELAYED_FX, CircuitBreakerOpen, FrankfurterClient, FXClient
+from app.rate_limiting import CircuitState
+
+pytestmark = pytest.mark.unit
+
+SCHEMA_PATH = (
+    Path(__file__).resolve().parents[3]
+    / "DATA_CONTRACTS"
+    / "schemas"
+    / "price_fx.annotation.schema.json"
+)
+
+
+def _primary(rates, calls):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.params["symbols"])
+        if rates is None:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"base": "USD", "rates": rates})
+
+    return httpx.MockTransport(handler)
+
+
+def _frankfurter(rates, calls):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        return httpx.Response(
+            200, json={"base": "USD", "date": "2024-01-02", "rates": rates}
+        )
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_batched_request():
+    calls = []
+    client = FXClient(
+        base_url="https://fx.local",
+        transport=_primary({"EUR": 0.9, "GBP": 0.8, "JPY": 150.0}, calls),
+    )
+
+    results = await asyncio.gather(
+        client.get_rates("USD", ["EUR", "GBP"]),
+        client.get_rates("USD", ["GBP", "JPY"]),
+        client.get_rate("USD", "EUR"),
+    )
+
+    assert calls == ["EUR,GBP,JPY"]
+    assert set(results[0]) == {"EUR", "GBP"}
+    assert results[1]["JPY"].rate == 150.0
+    assert results[1]["GBP"].fx_source == "exchangerate.host"
+    assert results[2] == pytest.approx(0.9)
+
+
+@pytest.mark.asyncio
+async def test_pairs_are_cached_across_differently_shaped_batches():
+    calls = []
+    client = FXClient(
+        base_url="https://fx.local",
+        transport=_primary({"EUR": 0.9, "GBP": 0.8, "JPY": 150.0}, calls),
+    )
+    provider_cache.attach(fakeredis.FakeAsyncRedis())
+    try:
+        await client.get_rates("USD", ["EUR", "GBP"])
+        assert client._flushes == set()  # flush task released once it resolved
+        quotes = await client.get_rates("USD", ["GBP", "JPY"])
+        await client.get_rates("USD", ["JPY", "EUR"])
+    finally:
+        await provider_cache.aclose()
+
+    assert calls == ["EUR,GBP", "JPY"]
+    assert quotes["GBP"].rate == 0.8 and quotes["JPY"].rate == 150.0
+
+
+@pytest.mark.asyncio
+async def test_pending_flush_task_is_referenced():
+    client = FXClient(
+        base_url="https://fx.local", batch_window=0.01, transport=_primary({"EUR": 0.9}, [])
+    )
+
+    pending = asyncio.create_task(client.get_rate("USD", "EUR"))
+    await asyncio.sleep(0)
+    assert len(client._flushes) == 1
+    assert await pending == pytest.approx(0.9)
+
+
+@pytest.mark.asyncio
+async def test_unknown_quote_fails_only_its_caller():
+    calls = []
+    client = FXClient(
+        base_url="https://fx.local",
+        retries=2,
+        breaker_threshold=1,
+        transport=_primary({"EUR": 0.9, "GBP": 0.8}, calls),
+    )
+
+    good, bad = await asyncio.gather(
+        client.get_rates("USD", ["EUR", "GBP"]),
+        client.get_rates("USD", ["EUR", "XXX"]),
+        return_exceptions=True,
+    )
+
+    assert calls == ["EUR,GBP,XXX"]  # one batch, no retries for a bad symbol
+    assert {quote: fx.rate for quote, fx in good.items()} == {"EUR": 0.9, "GBP": 0.8}
+    assert isinstance(bad, KeyError) and "XXX" in str(bad)
+    assert client.breaker.state is CircuitState.CLOSED
+    assert (await client.get_rate("USD", "GBP")) == pytest.approx(0.8)
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_falls_back_to_ecb_with_drift():
+    primary_calls, ecb_calls = [], []
+    rates = {"EUR": 0.9, "GBP": 0.8}
+    transport = _primary(rates, primary_calls)
+    client = FXClient(
+        base_url="https://fx.local",
+        retries=1,
+        breaker_threshold=1,
+        transport=transport,
+        fallback=FrankfurterClient(
+            base_url="https://ecb.local",
+            transport=_frankfurter({"EUR": 0.9018, "GBP": 0.8001}, ecb_calls),
+        ),
+    )
+    await client.get_rates("USD", ["EUR", "GBP"])  # intraday reference
+
+    rates.clear()
+    transport.handler = _primary(None, primary_calls).handler
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.get_rates("USD", ["EUR", "GBP"])
+
+    quotes = await client.get_rates("USD", ["EUR", "GBP"])
+    assert len(primary_calls) == 2
+    assert ecb_calls == ["https://ecb.local/latest?from=USD&to=EUR,GBP"]
+    assert quotes["EUR"].fx_source == "frankfurter"
+    assert quotes["EUR"].drift_bps == pytest.approx(20.0)
+    assert quotes["EUR"].flags == ()
+    assert quotes["GBP"].drift_bps == pytest.approx(1.25)
+
+    client.fallback.transport = _frankfurter({"EUR": 0.93}, ecb_calls)
+    delayed = await client.get_rates("USD", ["EUR"])
+    assert delayed["EUR"].flags == (DELAYED_FX,)
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_without_fallback_raises():
+    client = FXClient(base_url="https://fx.local", transport=_primary(None, []))
+    client.breaker.force_open()
+
+    with pytest.raises(CircuitBreakerOpen):
+        await client.get_rates("USD", ["EUR"])
+
+
+@pytest.mark.asyncio
+async def test_annotation_matches_price_fx_contract():
+    client = FXClient(
+        base_url="https://fx.local",
+        transport=_primary(None, []),
+        fallback=FrankfurterClient(transport=_frankfurter({"EUR": 0.95}, [])),
+    )
+    client.breaker.force_open()
+    validator = Draft7Validator(json.loads(SCHEMA_PATH.read_text()))
+
+    quote = (await client.get_rates("USD", ["EUR"]))["EUR"]
+    annotation = {
+        "price_source": "coingecko",
+        "resolution": "1d",
+        "asof": "2024-01-02T00:00:00Z",
+        **quote.annotation(),
+    }
+
+    assert quote.drift_bps is None  # no intraday rate to compare against
+    assert list(validator.iter_errors(annotation)) == []
@@ -0,0 +1,214 @@
+import fakeredis
+import httpx
+import pytest
+from redis.exceptions import RedisError
+
+from app import http_pool
+from app.http_cache import (
+    TOKEN_EXTENSION,
+    CachedResponse,
+    ConditionalCacheTransport,
+    DiskResponseStore,
+    RedisResponseStore,
+    mark_token_spent,
+)
+from app.providers import EtherscanClient
+from app.providers.fx import FXClient
+from app.rate_limiting import acquire, init
+from app.rate_limiting.provider_budgets import ProviderBudget
+from app.refreshers import SnapshotRefresher
+
+pytestmark = pytest.mark.unit
+
+
+class Upstream:
+    """Mock provider honouring ``If-None-Match``/``If-Modified-Since``."""
+
+    def __init__(self, **validators: str) -> None:
+        self.validators = {key.replace("_", "-"): value for key, value in validators.items()}
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        etag = self.validators.get("etag")
+        modified = self.validators.get("last-modified")
+        if (etag and request.headers.get("If-None-Match") == etag) or (
+            modified and request.headers.get("If-Modified-Since") == modified
+        ):
+            return httpx.Response(304)
+        return httpx.Response(
+            200, json={"rates": {"EUR": 0.9}}, headers=self.validators
+        )
+
+
+class DictStore:
+    def __init__(self) -> None:
+        self.entries = {}
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, entry):
+        self.entries[key] = entry
+
+
+@pytest.mark.asyncio
+async def test_etag_revalidation_served_from_redis():
+    redis = fakeredis.FakeAsyncRedis()
+    upstream = Upstream(etag='"v1"', cache_control="max-age=0")
+    store = RedisResponseStore(redis)
+    async with http_pool.running(
+        transport=httpx.MockTransport(upstream), cache_store=store
+    ) as pool:
+        client = FXClient(base_url="https://fx.cache")
+        assert await client.get_rate("USD", "EUR") == pytest.approx(0.9)
+        assert await client.get_rate("USD", "EUR") == pytest.approx(0.9)
+        transport = pool.client("fx")._transport
+
+    assert [r.headers.get("If-None-Match") for r in upstream.requests] == [None, '"v1"']
+    assert transport.revalidated == 1
+    assert transport.stored == 1
+    assert len(await redis.keys("httpcache:*")) == 1
+    await redis.aclose()
+
+
+@pytest.mark.asyncio
+async def test_last_modified_revalidation_from_disk(tmp_path):
+    upstream = Upstream(last_modified="Wed, 01 Jan 2025 00:00:00 GMT")
+    transport = ConditionalCacheTransport(
+        httpx.MockTransport(upstream), DiskResponseStore(tmp_path), provider="fx"
+    )
+    async with httpx.AsyncClient(transport=transport) as client:
+        first = await client.get("https://fx.cache/latest")
+        second = await client.get("https://fx.cache/latest")
+
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["last-modified"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert upstream.requests[1].headers["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert len(list(tmp_path.iterdir())) == 1
+    assert "fx.cache" not in list(tmp_path.iterdir())[0].name
+
+
+@pytest.mark.asyncio
+async def test_not_modified_refunds_token_when_configured(fake_redis):
+    now = lambda: 0.0  # noqa: E731
+    init(fake_redis, budgets={"fx": ProviderBudget(per_min=1)}, time_func=now)
+    upstream = Upstream(etag='"v1"')
+    spent = {TOKEN_EXTENSION: True}
+    async with httpx.AsyncClient(
+        transport=ConditionalCacheTransport(
+            httpx.MockTransport(upstream),
+            DictStore(),
+            provider="fx",
+            count_not_modified=False,
+        )
+    ) as client:
+        assert acquire("fx", "/fx")[0]
+        await client.get("https://fx.cache/latest", extensions=spent)
+        assert not acquire("fx", "/fx")[0]
+        await client.get("https://fx.cache/latest", extensions=spent)  # 304 gives it back
+        assert acquire("fx", "/fx")[0]
+
+
+@pytest.mark.asyncio
+async def test_not_modified_without_spent_token_leaves_buckets_unchanged(fake_redis):
+    now = lambda: 0.0  # noqa: E731
+    init(fake_redis, budgets={"fx": ProviderBudget(per_sec=5, per_min=10)}, time_func=now)
+    assert acquire("fx", "/fx", 3)[0]
+    levels = {key: fake_redis.hget(key, "tokens") for key in ("fx:per_sec", "fx:per_min")}
+    upstream = Upstream(etag='"v1"')
+    async with httpx.AsyncClient(
+        transport=ConditionalCacheTransport(
+            httpx.MockTransport(upstream),
+            DictStore(),
+            provider="fx",
+            count_not_modified=False,
+        )
+    ) as client:
+        await client.get("https://fx.cache/latest")
+        assert (await client.get("https://fx.cache/latest")).status_code == 200
+
+    assert len(upstream.requests) == 2 and upstream.requests[1].headers["If-None-Match"]
+    assert {key: fake_redis.hget(key, "tokens") for key in levels} == levels
+
+
+@pytest.mark.asyncio
+async def test_refresher_poll_gets_its_token_back_on_304(fake_redis):
+    now = lambda: 0.0  # noqa: E731
+    init(fake_redis, budgets={"etherscan": ProviderBudget(per_min=3)}, time_func=now)
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"g1"':
+            return httpx.Response(304)
+        body = {"safe": 1, "propose": 2, "fast": 3, "asof": 1}
+        return httpx.Response(200, json=body, headers={"ETag": '"g1"'})
+
+    requests = []
+    async with http_pool.running(
+        transport=httpx.MockTransport(upstream), cache_store=DictStore(), count_not_modified=False
+    ):
+        client = EtherscanClient(base_url="https://gas.cache")
+        refresher = SnapshotRefresher("etherscan", "gas", client.refresh_gas_prices, interval=1)
+        await refresher.refresh_once()
+        level = fake_redis.hget("etherscan:per_min", "tokens")
+        assert float(level) == 2
+        for _ in range(2):
+            await refresher.refresh_once()  # each 304 refunds the poll's token
+            assert fake_redis.hget("etherscan:per_min", "tokens") == level
+
+    assert [r.headers.get("If-None-Match") for r in requests] == [None, '"g1"', '"g1"']
+    assert refresher.polls["ok"] == 3
+
+
+@pytest.mark.asyncio
+async def test_one_spent_token_is_refunded_once(fake_redis):
+    now = lambda: 0.0  # noqa: E731
+    init(fake_redis, budgets={"fx": ProviderBudget(per_min=5)}, time_func=now)
+    upstream = Upstream(etag='"v1"')
+    async with http_pool.running(
+        transport=httpx.MockTransport(upstream), cache_store=DictStore(), count_not_modified=False
+    ) as pool:
+        client = pool.client("fx")
+        await client.get("https://fx.cache/latest")  # stored, no token involved
+        assert acquire("fx", "/fx")[0]
+        mark_token_spent("fx")
+        level = fake_redis.hget("fx:per_min", "tokens")
+        await client.get("https://fx.cache/latest")
+        await client.get("https://fx.cache/latest")  # same token, nothing left to refund
+        mark_token_spent("coingecko")
+        await client.get("https://fx.cache/latest")  # another provider's token
+
+    assert float(fake_redis.hget("fx:per_min", "tokens")) == float(level) + 1
+
+
+@pytest.mark.asyncio
+async def test_uncacheable_and_broken_store_fall_through():
+    class BrokenStore:
+        async def get(self, key):
+            raise RedisError("down")
+
+        async def set(self, key, entry):
+            raise RedisError("down")
+
+    upstream = Upstream(etag='"v1"')
+    transport = ConditionalCacheTransport(
+        httpx.MockTransport(upstream), BrokenStore(), provider="fx"
+    )
+    async with httpx.AsyncClient(transport=transport) as client:
+        assert (await client.get("https://fx.cache/latest")).status_code == 200
+        assert (await client.get("https://fx.cache/latest")).status_code == 200
+        await client.post("https://fx.cache/latest")
+    assert all("If-None-Match" not in r.headers for r in upstream.requests)
+    assert transport.stored == 0
+
+    no_store = Upstream(etag='"v1"', cache_control="no-store")
+    assert not ConditionalCacheTransport._cacheable(
+        httpx.Response(200, headers=no_store.validators)
+    )
+
+
+def test_cached_response_round_trip():
+    entry = CachedResponse(200, [("etag", '"x"')], b'{"a":\n1}')
+    assert CachedResponse.from_bytes(entry.to_bytes()) == entry
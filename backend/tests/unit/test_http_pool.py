@@ -0,0 +1,66 @@
+import httpx
+import pytest
+
+from app import http_pool, rate_limiting
+from app.http_pool import HTTPClientPool, provider_client
+from app.providers import EtherscanClient
+from app.rate_limiting import acquire, init
+from app.rate_limiting.provider_budgets import ProviderBudget
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_one_client_per_provider():
+    pool = HTTPClientPool(limits={"etherscan": httpx.Limits(max_connections=3)})
+    client = pool.client("etherscan")
+    assert pool.client("etherscan") is client
+    assert pool.client("coingecko") is not client
+    assert client._transport._pool._max_connections == 3
+    assert pool.client("coingecko")._transport._pool._max_connections == 10
+
+    await pool.aclose()
+    assert client.is_closed
+
+
+def test_http2_requires_h2(monkeypatch):
+    monkeypatch.setattr(http_pool, "http2_available", lambda: False)
+    assert HTTPClientPool(http2=True).http2 is False
+    monkeypatch.setattr(http_pool, "http2_available", lambda: True)
+    assert HTTPClientPool(http2=True).http2 is True
+
+
+@pytest.mark.asyncio
+async def test_running_installs_and_closes_pool():
+    seen = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.host)
+        return httpx.Response(200, json={"safe": 1, "propose": 2, "fast": 3, "asof": 0})
+
+    async with http_pool.running(transport=httpx.MockTransport(handler)) as pool:
+        assert http_pool.get_pool() is pool
+        client = EtherscanClient(base_url="https://pooled.local")
+        await client.get_gas_prices()
+        await client.get_gas_prices()
+        async with provider_client("etherscan") as shared:
+            assert shared is pool.client("etherscan")
+    assert seen == ["pooled.local", "pooled.local"]
+    assert shared.is_closed
+    assert http_pool.get_pool() is not pool
+
+
+@pytest.mark.asyncio
+async def test_upstream_retry_after_freezes_provider(fake_redis):
+    now = lambda: 0.0  # noqa: E731
+    init(fake_redis, budgets={"etherscan": ProviderBudget(per_sec=10)}, time_func=now)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": "30"})
+
+    client = EtherscanClient(base_url="https://es.local", transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.get_gas_prices()
+
+    assert acquire("etherscan", "/gas") == (False, 30.0)
+    assert rate_limiting._clamp.get("etherscan") == 0.9
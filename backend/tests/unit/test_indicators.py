@@ -0,0 +1,210 @@
+import numpy as np
+import pytest
+from app import indicators
+from app.candles import CandleColumns
+from app.main import app, rate_limiter
+from fastapi.testclient import TestClient
+
+pytestmark = pytest.mark.unit
+
+DAY = 86400
+START = 1_700_006_400  # 2023-11-15T00:00:00Z
+
+
+def _walk(count: int, seed: int = 7) -> np.ndarray:
+    return 100 + np.cumsum(np.random.default_rng(seed).normal(size=count))
+
+
+def _reference_ema(values, alpha, initial):
+    out, state = [], initial
+    for value in values:
+        state = (1 - alpha) * state + alpha * value
+        out.append(state)
+    return np.array(out)
+
+
+def _reference_rsi(values, period):
+    change = np.diff(values)
+    gains, losses = np.clip(change, 0, None), np.clip(-change, 0, None)
+    out = np.full(len(values), np.nan)
+    avg_gain, avg_loss = gains[:period].mean(), losses[:period].mean()
+    out[period] = 100 - 100 / (1 + avg_gain / avg_loss)
+    for i in range(period, len(change)):
+        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+        out[i + 1] = 100 - 100 / (1 + avg_gain / avg_loss)
+    return out
+
+
+def test_sma_matches_window_means():
+    values = _walk(50)
+
+    result = indicators.sma(values, 5)
+
+    assert np.isnan(result[:4]).all()
+    expected = [values[i - 4:i + 1].mean() for i in range(4, 50)]
+    np.testing.assert_allclose(result[4:], expected, rtol=1e-12)
+    assert np.isnan(indicators.sma(values[:3], 5)).all()
+
+
+@pytest.mark.parametrize("span", [1, 2, 12, 26, 200, 5000])
+def test_ema_matches_recursive_definition(span):
+    values = _walk(3000)
+
+    result = indicators.ema(values, span)
+
+    expected = _reference_ema(values, 2 / (span + 1), values[0])
+    np.testing.assert_allclose(result, expected, rtol=1e-10)
+
+
+def test_rsi_matches_wilder_smoothing():
+    values = _walk(500)
+
+    result = indicators.rsi(values, 14)
+
+    assert np.isnan(result[:14]).all()
+    np.testing.assert_allclose(result[14:], _reference_rsi(values, 14)[14:], rtol=1e-10)
+
+
+def test_rsi_handles_one_sided_and_flat_series():
+    assert indicators.rsi(np.arange(20.0), 14)[-1] == 100.0
+    assert indicators.rsi(np.arange(20.0)[::-1], 14)[-1] == 0.0
+    assert indicators.rsi(np.ones(20), 14)[-1] == 50.0
+
+
+def test_macd_lines():
+    values = _walk(400)
+
+    result = indicators.macd(values, 12, 26, 9)
+
+    line = indicators.ema(values, 12) - indicators.ema(values, 26)
+    np.testing.assert_allclose(result.macd, line)
+    np.testing.assert_allclose(result.signal, _reference_ema(line, 0.2, line[0]), rtol=1e-10)
+    np.testing.assert_allclose(result.histogram, result.macd - result.signal)
+    with pytest.raises(ValueError):
+        indicators.macd(values, 26, 12, 9)
+
+
+@pytest.mark.parametrize("window", [1, 3, 7, 100])
+def test_rolling_max_and_drawdown(window):
+    values = _walk(250)
+
+    peaks = indicators.rolling_max(values, window)
+
+    expected = [values[max(0, i - window + 1):i + 1].max() for i in range(250)]
+    np.testing.assert_array_equal(peaks, expected)
+    np.testing.assert_allclose(indicators.drawdown(values, window), values / peaks - 1)
+
+
+def test_running_drawdown():
+    result = indicators.drawdown(np.array([100.0, 120.0, 90.0, 130.0, 65.0]))
+
+    np.testing.assert_allclose(result, [0.0, 0.0, -0.25, 0.0, -0.5])
+
+
+def test_empty_input_and_invalid_window():
+    empty = np.empty(0)
+
+    assert len(indicators.ema(empty, 12)) == 0
+    assert len(indicators.rsi(empty, 14)) == 0
+    assert len(indicators.drawdown(empty, 5)) == 0
+    with pytest.raises(ValueError):
+        indicators.sma(empty, 0)
+
+
+def test_compute_drops_warmup_bars():
+    values = _walk(300)
+
+    result = indicators.compute(
+        values, sma_windows=[20], rsi_period=14, macd_spans=(12, 26, 9), skip=100
+    )
+
+    np.testing.assert_allclose(result["sma"][20], indicators.sma(values, 20)[100:])
+    np.testing.assert_allclose(result["rsi"], indicators.rsi(values, 14)[100:])
+    assert len(result["macd"].histogram) == 200
+    np.testing.assert_allclose(result["drawdown"], indicators.drawdown(values[100:]))
+    assert "ema" in result and result["ema"] == {}
+
+
+@pytest.fixture
+def store(tmp_path):
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pyarrow")
+    from app.candle_store import CandleStore
+
+    count = 400
+    close = _walk(count)
+    store = CandleStore(tmp_path)
+    store.write(
+        CandleColumns(
+            t=START + DAY * np.arange(count, dtype=np.int64),
+            o=close,
+            h=close + 1,
+            l=close - 1,
+            c=close,
+            v=np.ones(count),
+            asof=np.ones(count),
+            resolution=["1d"] * count,
+            source=["coingecko"] * count,
+        ),
+        "btc",
+    )
+    app.state.candle_store = store
+    app.dependency_overrides[rate_limiter] = lambda: None
+    yield close
+    app.dependency_overrides.clear()
+    app.state.candle_store = None
+    store.close()
+
+
+def test_metrics_endpoint_uses_warmup_history(store):
+    close = store
+    client = TestClient(app)
+    window = {"interval": "1d", "start": START + 300 * DAY, "end": START + 400 * DAY}
+
+    response = client.get(
+        "/assets/btc/metrics", params={**window, "sma": [5, 20], "ema": [10], "rsi": 14}
+    )
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["t"][0] == START + 300 * DAY and len(body["t"]) == 100
+    assert set(body["sma"]) == {"5", "20"} and set(body["ema"]) == {"10"}
+    np.testing.assert_allclose(body["sma"]["20"], indicators.sma(close, 20)[300:])
+    # Only a bounded warm-up is read, so seeded indicators agree closely, not exactly.
+    np.testing.assert_allclose(body["rsi"], indicators.rsi(close, 14)[300:], rtol=1e-4)
+    assert body["max_drawdown"] == pytest.approx(min(body["drawdown"]))
+
+    revalidated = client.get(
+        "/assets/btc/metrics",
+        params={**window, "sma": [5, 20], "ema": [10], "rsi": 14},
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert revalidated.status_code == 304
+
+
+def test_metrics_endpoint_reports_warmup_as_null(store):
+    client = TestClient(app)
+
+    body = client.get(
+        "/assets/btc/metrics",
+        params={"start": START, "end": START + 10 * DAY, "sma": [20]},
+    ).json()
+
+    assert body["sma"]["20"] == [None] * 10
+    assert body["rsi"] == [None] * 10
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"sma": [0]},
+        {"rsi": 5000},
+        {"macd_fast": 26, "macd_slow": 12},
+        {"start": START + DAY, "end": START},
+    ],
+)
+def test_metrics_endpoint_rejects_invalid_parameters(store, params):
+    response = TestClient(app).get("/assets/btc/metrics", params=params)
+
+    assert response.status_code == 400
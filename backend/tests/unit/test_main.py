@@ -1,7 +1,10 @@
 import os
 import re
+from types import SimpleNamespace
 
+import fakeredis
 import pytest
+from app import main, rate_limiting
 from app.main import (
     Health,
     app,
@@ -215,3 +218,36 @@ def test_separate_provider_budgets(client: TestClient, fake_redis) -> None:
             )
     finally:
         _clear_overrides()
+
+
+def test_lifespan_wires_shared_async_redis(monkeypatch: pytest.MonkeyPatch) -> None:
+    server = fakeredis.FakeServer()
+    monkeypatch.setenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+    monkeypatch.setattr(
+        main,
+        "Redis",
+        SimpleNamespace(from_url=lambda url: fakeredis.FakeRedis(server=server)),
+    )
+    monkeypatch.setattr(
+        main,
+        "AsyncRedis",
+        SimpleNamespace(
+            from_url=lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server)
+        ),
+    )
+
+    async def override() -> Health:
+        return Health(status="ok", versions={}, uptime=1.0)
+
+    app.dependency_overrides[get_health_data] = override
+    try:
+        with TestClient(app) as test_client:
+            assert rate_limiting._async_redis is not None
+            statuses = [test_client.get("/health").status_code for _ in range(6)]
+    finally:
+        _clear_overrides()
+
+    assert statuses == [200] * 5 + [429]
+    assert rate_limiting._async_redis is None
+    assert app.state.breaker_store._thread is None
+    assert app.state.refreshers == {}
@@ -0,0 +1,348 @@
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+from app.main import GasPrices
+from app.provider_cache import (
+    CachedUpstreamError,
+    CachePolicy,
+    ProviderCache,
+    model_codec,
+    provider_cache,
+)
+from app.providers.etherscan import EtherscanClient
+
+pytestmark = pytest.mark.unit
+
+GAS_CODEC = model_codec(GasPrices)
+POLICIES = {"gas": CachePolicy(ttl=10, stale_ttl=50, negative_ttl=5)}
+
+
+def _clock(start: float = 1000.0):
+    current = {"value": start}
+
+    def now() -> float:
+        return current["value"]
+
+    def advance(seconds: float) -> None:
+        current["value"] += seconds
+
+    return now, advance
+
+
+class Upstream:
+    """Counting fake provider returning a new gas price per call."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.error: Exception | None = None
+        self.gate: asyncio.Event | None = None
+
+    async def __call__(self) -> GasPrices:
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return GasPrices(safe=self.calls, propose=2, fast=3, asof=0, source="test")
+
+
+def _cache(now, *, allowed: bool = True, **kwargs) -> ProviderCache:
+    async def acquire(provider: str, route: str):
+        return allowed, 0.0 if allowed else 1.0
+
+    return ProviderCache(
+        fakeredis.FakeAsyncRedis(),
+        policies=POLICIES,
+        time_func=now,
+        acquire=acquire,
+        **kwargs,
+    )
+
+
+async def _get(cache: ProviderCache, upstream: Upstream) -> GasPrices:
+    return await cache.get("etherscan", "gas", {"chain": 1}, upstream, GAS_CODEC)
+
+
+@pytest.mark.asyncio
+async def test_fresh_entries_are_served_from_redis():
+    now, advance = _clock()
+    cache, upstream = _cache(now), Upstream()
+
+    first = await _get(cache, upstream)
+    advance(9)
+    second = await _get(cache, upstream)
+
+    assert upstream.calls == 1
+    assert second == first
+    assert cache.results == {("etherscan", "miss"): 1, ("etherscan", "hit"): 1}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_fetch():
+    now, _ = _clock()
+    cache, upstream = _cache(now), Upstream()
+
+    results = await asyncio.gather(*(_get(cache, upstream) for _ in range(5)))
+
+    assert upstream.calls == 1
+    assert {result.safe for result in results} == {1}
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_refreshing_in_background():
+    now, advance = _clock()
+    cache, upstream = _cache(now), Upstream()
+    await _get(cache, upstream)
+
+    advance(11)
+    upstream.gate = asyncio.Event()
+    assert (await _get(cache, upstream)).safe == 1
+    assert (await _get(cache, upstream)).safe == 1
+    upstream.gate.set()
+    await asyncio.gather(*cache._tasks)
+
+    assert upstream.calls == 2  # one refresh for both stale reads
+    assert (await _get(cache, upstream)).safe == 2
+    assert cache.results["etherscan", "stale"] == 2
+    assert cache.refreshes == {("etherscan", "ok"): 1}
+
+
+@pytest.mark.asyncio
+async def test_refresh_is_skipped_when_the_bucket_is_empty():
+    now, advance = _clock()
+    cache, upstream = _cache(now, allowed=False), Upstream()
+    await _get(cache, upstream)
+
+    advance(30)
+    assert (await _get(cache, upstream)).safe == 1
+    await asyncio.gather(*cache._tasks)
+
+    assert upstream.calls == 1
+    assert cache.refreshes == {("etherscan", "throttled"): 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_the_stale_entry():
+    now, advance = _clock()
+    cache, upstream = _cache(now), Upstream()
+    await _get(cache, upstream)
+
+    upstream.error = httpx.ConnectError("down")
+    advance(30)
+    await _get(cache, upstream)
+    await asyncio.gather(*cache._tasks)
+
+    assert (await _get(cache, upstream)).safe == 1
+    assert cache.refreshes["etherscan", "failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_entry_is_a_miss():
+    now, advance = _clock()
+    cache, upstream = _cache(now), Upstream()
+    await _get(cache, upstream)
+
+    advance(61)
+    assert (await _get(cache, upstream)).safe == 2
+    assert cache.results["etherscan", "miss"] == 2
+
+
+@pytest.mark.asyncio
+async def test_upstream_errors_are_negatively_cached():
+    now, advance = _clock()
+    cache, upstream = _cache(now), Upstream()
+    upstream.error = httpx.ConnectError("down")
+
+    with pytest.raises(httpx.ConnectError):
+        await _get(cache, upstream)
+    with pytest.raises(CachedUpstreamError, match="ConnectError: down"):
+        await _get(cache, upstream)
+    assert upstream.calls == 1
+
+    upstream.error = None
+    advance(5)
+    assert (await _get(cache, upstream)).safe == 2
+    assert cache.results["etherscan", "negative"] == 1
+
+
+@pytest.mark.asyncio
+async def test_other_errors_are_not_cached():
+    now, _ = _clock()
+    cache, upstream = _cache(now), Upstream()
+    upstream.error = ValueError("bad payload")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await _get(cache, upstream)
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_bypasses_the_cache():
+    now, _ = _clock()
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache, upstream = _cache(now), Upstream()
+    cache.attach(fakeredis.FakeAsyncRedis(server=server))
+
+    for _ in range(2):
+        assert (await _get(cache, upstream)).safe == upstream.calls
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_without_client_every_call_reaches_the_provider():
+    cache, upstream = ProviderCache(), Upstream()
+
+    await _get(cache, upstream)
+    await _get(cache, upstream)
+
+    assert upstream.calls == 2
+    assert cache.results == {}
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_results_and_ttls():
+    now, _ = _clock()
+    cache, upstream = _cache(now), Upstream()
+    await _get(cache, upstream)
+    await _get(cache, upstream)
+
+    text = cache.render_metrics()
+
+    assert 'provider_cache_requests_total{provider="etherscan",result="hit"} 1' in text
+    assert 'provider_cache_requests_total{provider="etherscan",result="miss"} 1' in text
+    assert 'provider_cache_ttl_seconds{route="gas"} 10' in text
+
+
+@pytest.mark.asyncio
+async def test_provider_client_reads_through_global_cache():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"safe": 1, "propose": 2, "fast": 3, "asof": 1.0})
+
+    client = EtherscanClient(
+        base_url="https://cache.local", transport=httpx.MockTransport(handler)
+    )
+    provider_cache.attach(fakeredis.FakeAsyncRedis())
+    try:
+        first = await client.get_gas_prices()
+        second = await client.get_gas_prices()
+    finally:
+        await provider_cache.aclose()
+
+    assert calls == ["/gas"]
+    assert second == first
+    assert second.source == "etherscan"
+    assert provider_cache.client is None
+
+
+class BatchUpstream:
+    """Counting fake batch provider pricing every known name."""
+
+    def __init__(self, known=("a", "b", "c")) -> None:
+        self.calls: list[list[str]] = []
+        self.known = set(known)
+
+    async def __call__(self, names):
+        self.calls.append(sorted(names))
+        return {
+            name: GasPrices(safe=len(self.calls), propose=2, fast=3, asof=0, source="test")
+            for name in names
+            if name in self.known
+        }
+
+
+async def _get_many(cache: ProviderCache, upstream, names) -> dict:
+    params = {name: {"id": name} for name in names}
+    return await cache.get_many("coingecko", "gas", params, upstream, GAS_CODEC)
+
+
+@pytest.mark.asyncio
+async def test_get_many_fetches_only_missing_items_in_one_call():
+    now, _ = _clock()
+    cache, upstream = _cache(now), BatchUpstream()
+
+    first = await _get_many(cache, upstream, ["a", "b"])
+    second = await _get_many(cache, upstream, ["a", "b", "c", "zzz"])
+
+    assert upstream.calls == [["a", "b"], ["c", "zzz"]]
+    assert sorted(second) == ["a", "b", "c"]  # unknown items are left out
+    assert second["a"] == first["a"]
+    assert cache.results["coingecko", "hit"] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_get_many_share_missing_items():
+    now, _ = _clock()
+    cache, upstream = _cache(now), BatchUpstream()
+    release = asyncio.Event()
+
+    async def gated(names):
+        await release.wait()
+        return await upstream(names)
+
+    callers = [
+        asyncio.ensure_future(_get_many(cache, gated, names))
+        for names in (["a", "b"], ["a", "b"], ["b", "c"])
+    ]
+    for _ in range(5):
+        await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*callers)
+
+    assert upstream.calls == [["a", "b"], ["c"]]
+    assert results[0] == results[1]
+    assert results[2]["b"] == results[0]["b"]
+    assert cache._flight.coalesced["coingecko"] == 3
+
+
+@pytest.mark.asyncio
+async def test_get_many_refreshes_stale_items_together():
+    now, advance = _clock()
+    cache, upstream = _cache(now), BatchUpstream()
+    await _get_many(cache, upstream, ["a", "b"])
+
+    advance(11)
+    stale = await _get_many(cache, upstream, ["a", "b"])
+    await asyncio.gather(*cache._tasks)
+    fresh = await _get_many(cache, upstream, ["a", "b"])
+
+    assert {quote.safe for quote in stale.values()} == {1}
+    assert {quote.safe for quote in fresh.values()} == {2}
+    assert upstream.calls == [["a", "b"], ["a", "b"]]
+    assert cache.refreshes == {("coingecko", "ok"): 1}
+
+
+@pytest.mark.asyncio
+async def test_get_many_without_client_calls_the_provider():
+    upstream = BatchUpstream()
+
+    result = await _get_many(ProviderCache(), upstream, ["a", "x"])
+
+    assert list(result) == ["a"]
+    assert upstream.calls == [["a", "x"]]
+
+
+@pytest.mark.asyncio
+async def test_get_many_negatively_caches_failed_fetches():
+    now, advance = _clock()
+    cache, upstream = _cache(now), BatchUpstream()
+
+    async def failing(names):
+        upstream.calls.append(names)
+        raise httpx.ConnectError("down")
+
+    with pytest.raises(httpx.ConnectError):
+        await _get_many(cache, failing, ["a", "b"])
+    with pytest.raises(CachedUpstreamError, match="ConnectError: down"):
+        await _get_many(cache, upstream, ["b"])
+    advance(6)
+    assert list(await _get_many(cache, upstream, ["b"])) == ["b"]
+    assert upstream.calls == [["a", "b"], ["b"]]
+    assert cache.results["coingecko", "negative"] == 1
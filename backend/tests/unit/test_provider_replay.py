@@ -0,0 +1,233 @@
+import random
+import statistics
+
+import httpx
+import pytest
+from app.provider_replay import (
+    REDACTED,
+    Cassette,
+    ChaosProfile,
+    RecordingTransport,
+    ReplayTransport,
+    fixed,
+    lognormal,
+)
+from app.providers import EtherscanClient
+from app.providers.fx import FXClient
+from app.rate_limiting import CircuitBreaker, CircuitBreakerOpen
+from app.rate_limiting.provider_budgets import ProviderBudget
+
+pytestmark = pytest.mark.unit
+
+
+class VirtualClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.slept: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def _cassette(route: str = "GET /latest?base=USD&symbols=EUR", **payload) -> Cassette:
+    cassette = Cassette()
+    cassette.add(route, httpx.Response(200, json=payload or {"rates": {"EUR": 0.9}}))
+    return cassette
+
+
+async def _statuses(transport: ReplayTransport, count: int) -> list[int]:
+    async with httpx.AsyncClient(transport=transport, base_url="https://replay.local") as client:
+        return [
+            (await client.get("/latest?base=USD&symbols=EUR")).status_code
+            for _ in range(count)
+        ]
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay_under_another_host(load_provider_fixture, tmp_path):
+    payload = load_provider_fixture("etherscan_gas.json")
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=payload, headers={"ETag": '"v1"', "Server": "x"})
+
+    cassette = Cassette()
+    live = RecordingTransport(httpx.MockTransport(upstream), cassette)
+    recorded = await EtherscanClient(
+        base_url="https://live.local/api", transport=live
+    ).get_gas_prices()
+    cassette.save(tmp_path / "etherscan.jsonl")
+
+    loaded = Cassette.load(tmp_path / "etherscan.jsonl")
+    replay = ReplayTransport(loaded, provider="etherscan")
+    replayed = await EtherscanClient(
+        base_url="https://replay.local/api", transport=replay
+    ).get_gas_prices()
+
+    assert loaded.exchanges[0].route == "GET /api/gas"
+    assert dict(loaded.exchanges[0].headers) == {
+        "content-type": "application/json",
+        "etag": '"v1"',
+    }
+    assert replayed == recorded
+    assert replay.outcomes == {"ok": 1}
+
+
+@pytest.mark.asyncio
+async def test_api_keys_are_redacted_from_recordings(tmp_path):
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"rates": {"EUR": 0.9}})
+
+    cassette = Cassette()
+    live = RecordingTransport(httpx.MockTransport(upstream), cassette)
+    async with httpx.AsyncClient(transport=live, base_url="https://live.local") as client:
+        await client.get("/latest", params={"base": "USD", "apikey": "live-secret"})
+        await client.get("/price", params={"ids": "btc", "x_cg_pro_api_key": "cg-secret"})
+    cassette.save(tmp_path / "keys.jsonl")
+
+    assert "secret" not in (tmp_path / "keys.jsonl").read_text()
+    assert [exchange.route for exchange in cassette.exchanges] == [
+        f"GET /latest?base=USD&apikey={REDACTED}",
+        f"GET /price?ids=btc&x_cg_pro_api_key={REDACTED}",
+    ]
+
+    replay = ReplayTransport(
+        Cassette.load(tmp_path / "keys.jsonl"), provider="fx", budget=ProviderBudget()
+    )
+    async with httpx.AsyncClient(transport=replay, base_url="https://replay.local") as client:
+        response = await client.get("/latest", params={"base": "USD", "apikey": "other-key"})
+
+    assert response.json() == {"rates": {"EUR": 0.9}}
+
+
+@pytest.mark.asyncio
+async def test_recordings_are_cycled_and_unknown_routes_404():
+    cassette = _cassette()
+    cassette.add(
+        "GET /latest?base=USD&symbols=EUR", httpx.Response(200, json={"rates": {"EUR": 1.1}})
+    )
+    replay = ReplayTransport(cassette, provider="fx", budget=ProviderBudget())
+
+    async with httpx.AsyncClient(transport=replay, base_url="https://replay.local") as client:
+        rates = [
+            (await client.get("/latest?base=USD&symbols=EUR")).json()["rates"]["EUR"]
+            for _ in range(3)
+        ]
+        missing = await client.get("/latest?base=USD&symbols=GBP")
+
+    assert rates == [0.9, 1.1, 0.9]
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_default_budget_ceilings_are_enforced():
+    clock = VirtualClock()
+    replay = ReplayTransport(
+        _cassette("GET /mempool"), provider="mempool_space", time_func=clock, sleep=clock.sleep
+    )
+
+    async with httpx.AsyncClient(transport=replay, base_url="https://replay.local") as client:
+        assert (await client.get("/mempool")).status_code == 200
+        throttled = await client.get("/mempool")
+        clock.now += 1.0
+        assert (await client.get("/mempool")).status_code == 200
+
+    assert throttled.status_code == 429
+    assert throttled.headers["Retry-After"] == "1"
+    assert replay.outcomes == {"ok": 2, "over_budget": 1}
+
+
+@pytest.mark.asyncio
+async def test_per_minute_window_reports_time_until_oldest_call_expires():
+    clock = VirtualClock()
+    replay = ReplayTransport(_cassette(), provider="fx", time_func=clock, sleep=clock.sleep)
+
+    for _ in range(10):
+        assert await _statuses(replay, 1) == [200]
+        clock.now += 2.0
+    async with httpx.AsyncClient(transport=replay, base_url="https://replay.local") as client:
+        response = await client.get("/latest?base=USD&symbols=EUR")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "40"
+
+
+@pytest.mark.asyncio
+async def test_chaos_is_reproducible_from_the_seed():
+    chaos = ChaosProfile(throttle_rate=0.2, burst_rate=0.1, burst_length=3)
+
+    def replay(seed: int) -> ReplayTransport:
+        clock = VirtualClock()
+        return ReplayTransport(
+            _cassette(), provider="fx", budget=ProviderBudget(), chaos=chaos,
+            seed=seed, time_func=clock, sleep=clock.sleep,
+        )
+
+    first = await _statuses(replay(7), 50)
+    assert first == await _statuses(replay(7), 50)
+    assert first != await _statuses(replay(8), 50)
+    assert {200, 429, 503} <= set(first)
+
+
+@pytest.mark.asyncio
+async def test_bursts_fail_consecutive_requests():
+    replay = ReplayTransport(
+        _cassette(), provider="fx", budget=ProviderBudget(),
+        chaos=ChaosProfile(burst_rate=1.0, burst_length=3, burst_status=502),
+    )
+
+    assert await _statuses(replay, 3) == [502] * 3
+    assert replay.outcomes == {"burst": 3}
+
+
+@pytest.mark.asyncio
+async def test_timeouts_and_latency_use_the_injected_sleep():
+    clock = VirtualClock()
+    replay = ReplayTransport(
+        _cassette(), provider="fx", budget=ProviderBudget(),
+        chaos=ChaosProfile(latency=fixed(0.25), timeout_rate=1.0, timeout=4.0),
+        time_func=clock, sleep=clock.sleep,
+    )
+
+    with pytest.raises(httpx.ReadTimeout):
+        await _statuses(replay, 1)
+    replay.chaos.timeout_rate = 0.0
+    assert await _statuses(replay, 1) == [200]
+
+    assert clock.slept == [4.0, 0.25]
+
+
+def test_lognormal_latency_matches_median_and_p95():
+    rng = random.Random(1)
+    samples = sorted(lognormal(0.1, 0.4)(rng) for _ in range(5000))
+
+    assert statistics.median(samples) == pytest.approx(0.1, rel=0.1)
+    assert samples[int(len(samples) * 0.95)] == pytest.approx(0.4, rel=0.15)
+
+
+@pytest.mark.asyncio
+async def test_breaker_recovers_after_a_replayed_outage():
+    clock = VirtualClock()
+    replay = ReplayTransport(
+        _cassette(), provider="fx", budget=ProviderBudget(),
+        chaos=ChaosProfile(burst_rate=1.0, burst_length=2),
+        time_func=clock, sleep=clock.sleep,
+    )
+    breaker = CircuitBreaker(2, probe_interval=30, time_func=clock)
+    client = FXClient(
+        base_url="https://replay.local", retries=1, transport=replay, breaker=breaker
+    )
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.get_rate("USD", "EUR")
+    with pytest.raises(CircuitBreakerOpen):
+        await client.get_rate("USD", "EUR")
+
+    replay.chaos.burst_rate = 0.0
+    clock.now += 30
+    assert await client.get_rate("USD", "EUR") == pytest.approx(0.9)
+    assert breaker.last_recovery == 30
@@ -1,7 +1,31 @@
 
+import asyncio
+import time
+
+import fakeredis
+import pytest
 from redis.exceptions import RedisError
 
-from app.rate_limiting import AdaptiveClamp, acquire, adjust_clamp, init
+from app import rate_limiting
+from app.rate_limiting import (
+    AdaptiveClamp,
+    TokenBucket,
+    acquire,
+    acquire_all,
+    acquire_async,
+    adjust_clamp,
+    init,
+    observe_response,
+    observe_response_async,
+    release_leases,
+    release_leases_async,
+    start_freeze_listener,
+    stop_freeze_listener,
+    unfreeze,
+    update_budget,
+)
+from app.rate_limiting.adaptive_clamps import FORBIDDEN_FREEZE
+from app.rate_limiting.leases import TokenLease
 from app.rate_limiting.provider_budgets import ProviderBudget
 
 
@@ -29,12 +53,309 @@ def test_token_bucket_acquire(fake_redis):
     assert allowed
 
 
+def test_token_bucket_state_is_shared_hash(fake_redis):
+    now, advance = _time_controller(100.0)
+    worker_a = TokenBucket(fake_redis, capacity=2, refill_rate=1, time_func=now)
+    worker_b = TokenBucket(fake_redis, capacity=2, refill_rate=1, time_func=now)
+
+    assert worker_a.acquire("cg:per_sec") == (True, 0.0)
+    assert worker_b.acquire("cg:per_sec") == (True, 0.0)
+    allowed, retry_after = worker_a.acquire("cg:per_sec", 1.5)
+    assert not allowed
+    assert retry_after == 1.5
+
+    state = fake_redis.hgetall("cg:per_sec")
+    assert float(state[b"tokens"]) == 0.0
+    assert float(state[b"ts"]) == 100.0
+    assert fake_redis.pttl("cg:per_sec") > 0
+
+    advance(0.5)
+    assert worker_b.acquire("cg:per_sec", 0.5) == (True, 0.0)
+
+
+def test_token_bucket_single_round_trip(fake_redis):
+    calls = []
+    original = fake_redis.evalsha
+
+    def counting_evalsha(*args):
+        calls.append(args[0])
+        return original(*args)
+
+    fake_redis.evalsha = counting_evalsha
+    bucket = TokenBucket(fake_redis, capacity=5, refill_rate=5)
+    for _ in range(3):
+        bucket.acquire("cg:per_sec")
+    assert len(calls) == 3
+    assert fake_redis.type("cg:per_sec") == b"hash"
+
+
+def test_multi_window_acquire_is_all_or_nothing(fake_redis):
+    now, advance = _time_controller()
+    init(
+        fake_redis,
+        budgets={"etherscan": ProviderBudget(per_sec=5, per_day=2)},
+        time_func=now,
+    )
+    calls = []
+    original = fake_redis.evalsha
+
+    def counting_evalsha(*args):
+        calls.append(args[0])
+        return original(*args)
+
+    fake_redis.evalsha = counting_evalsha
+    assert acquire("etherscan", "/gas")[0]
+    assert acquire("etherscan", "/gas")[0]
+    assert len(calls) == 2  # one round trip per acquire, not per window
+
+    allowed, retry_after = acquire("etherscan", "/gas")
+    assert not allowed
+    assert retry_after > 1
+    # per_sec bucket was not debited by the denied request
+    assert float(fake_redis.hget("etherscan:per_sec", "tokens")) == 3.0
+    assert float(fake_redis.hget("etherscan:per_day", "tokens")) == 0.0
+
+
+def test_multi_window_local_fallback_is_all_or_nothing():
+    class FailingRedis:
+        def evalsha(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+    now, _ = _time_controller()
+    per_sec = TokenBucket(FailingRedis(), capacity=5, refill_rate=5, time_func=now)
+    per_day = TokenBucket(FailingRedis(), capacity=1, refill_rate=0, time_func=now)
+    windows = [(per_sec, "p:per_sec"), (per_day, "p:per_day")]
+
+    assert acquire_all(windows) == (True, 0.0)
+    assert acquire_all(windows) == (False, float("inf"))
+    assert per_sec.local_buckets["p:per_sec"] == (4.0, 0.0)
+
+
+def test_fallback_store_is_bounded_and_default_deny():
+    class FailingRedis:
+        def evalsha(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+    now, advance = _time_controller()
+    bucket = TokenBucket(
+        FailingRedis(), capacity=1, refill_rate=1, time_func=now, max_local_buckets=2
+    )
+    assert bucket.acquire("route:a")[0]
+    assert bucket.acquire("route:b")[0]
+    allowed, retry_after = bucket.acquire("route:c")
+    assert not allowed  # store full of partially drained buckets
+    assert retry_after == 1.0
+    assert len(bucket.local_buckets) == 2
+
+    advance(1)  # a and b refill to capacity and become evictable
+    assert bucket.acquire("route:c")[0]
+    assert list(bucket.local_buckets) == ["route:c"]
+
+
+def test_fallback_bucket_count():
+    class FailingRedis:
+        def evalsha(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+    init(FailingRedis(), budgets={"coingecko": ProviderBudget(per_sec=5, per_min=30)})
+    assert rate_limiting.fallback_bucket_count() == 0
+    acquire("coingecko", "/foo")
+    assert rate_limiting.fallback_bucket_count() == 2
+
+
+def test_update_budget_rebuilds_only_that_provider(fake_redis):
+    now, _ = _time_controller()
+    init(
+        fake_redis,
+        budgets={
+            "coingecko": ProviderBudget(per_sec=1),
+            "fx": ProviderBudget(per_min=10),
+        },
+        time_func=now,
+    )
+    fx_windows = rate_limiting._windows["fx"]
+    assert acquire("coingecko", "/foo")[0]
+    assert not acquire("coingecko", "/foo")[0]
+
+    update_budget("coingecko", ProviderBudget(per_sec=1, per_day=100))
+    assert rate_limiting._windows["fx"] is fx_windows
+    assert [key for _, key in rate_limiting._windows["coingecko"]] == [
+        "coingecko:per_sec",
+        "coingecko:per_day",
+    ]
+    assert not acquire("coingecko", "/foo")[0]  # Redis state survives reload
+
+    update_budget("coingecko", None)
+    assert acquire("coingecko", "/foo") == (True, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_async_acquire_shares_state_with_sync_path():
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    async_client = fakeredis.FakeAsyncRedis(server=server)
+    now, advance = _time_controller()
+    init(
+        sync_client,
+        budgets={"coingecko": ProviderBudget(per_sec=2)},
+        time_func=now,
+        async_client=async_client,
+    )
+    try:
+        assert await acquire_async("coingecko", "/foo") == (True, 0.0)
+        assert acquire("coingecko", "/foo") == (True, 0.0)
+        allowed, retry_after = await acquire_async("coingecko", "/foo")
+        assert not allowed
+        assert retry_after == 0.5
+        advance(0.5)
+        assert (await acquire_async("coingecko", "/foo"))[0]
+        assert (await acquire_async("unknown", "/foo")) == (True, 0.0)
+    finally:
+        await async_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_async_acquire_without_async_client(fake_redis):
+    now, _ = _time_controller()
+    init(fake_redis, budgets={"coingecko": ProviderBudget(per_sec=1)}, time_func=now)
+    assert (await acquire_async("coingecko", "/foo"))[0]
+    assert not (await acquire_async("coingecko", "/foo"))[0]
+
+
+def _counting_evalsha(client, calls):
+    original = client.evalsha
+
+    def counting_evalsha(*args):
+        calls.append(args[0])
+        return original(*args)
+
+    client.evalsha = counting_evalsha
+
+
+def test_lease_spends_locally_and_holds_global_ceiling(fake_redis):
+    now, advance = _time_controller()
+    init(
+        fake_redis,
+        budgets={"etherscan": ProviderBudget(per_sec=100, per_day=1000)},
+        time_func=now,
+        leases={"etherscan": 1.0},
+    )
+    lease = rate_limiting._leases["etherscan"]
+    calls = []
+    _counting_evalsha(fake_redis, calls)
+
+    allowed = 0
+    for _ in range(20):  # 1s of demand at 200 req/s, double the ceiling
+        for _ in range(10):
+            allowed += acquire("etherscan", "/gas")[0]
+        advance(0.05)
+    assert allowed <= 100 + 100  # capacity plus one second of refill
+    assert len(calls) * 5 <= allowed  # far fewer round trips than requests
+    assert lease.max_size == 50.0
+
+    leased = lease.remaining
+    before = float(fake_redis.hget("etherscan:per_day", "tokens"))
+    release_leases()
+    assert lease.remaining == 0.0
+    assert float(fake_redis.hget("etherscan:per_day", "tokens")) == before + leased
+
+
+def test_lease_size_follows_demand_and_clamp(fake_redis):
+    now, advance = _time_controller()
+    bucket = TokenBucket(fake_redis, capacity=100, refill_rate=100, time_func=now)
+    lease = TokenLease([(bucket, "hot:per_sec")], ttl=1.0)
+
+    assert lease.acquire() == (True, 0.0)
+    assert lease.remaining == 0.0  # no demand observed yet: minimal lease
+    advance(0.01)
+    assert lease.acquire() == (True, 0.0)
+    assert lease.remaining == 49.0  # high demand, capped at max_size
+
+    for _ in range(49):
+        lease.acquire()
+    advance(0.01)
+    assert lease.acquire(clamp=0.5) == (True, 0.0)
+    assert lease.remaining == 24.0  # cap shrinks with the clamp
+
+
+def test_concurrent_leases_never_exceed_capacity(fake_redis):
+    now, _ = _time_controller()
+    windows = [(TokenBucket(fake_redis, capacity=10, refill_rate=0, time_func=now), "k")]
+    leases = [TokenLease(windows, max_fraction=1.0) for _ in range(3)]
+    granted = sum(lease.acquire()[0] for _ in range(10) for lease in leases)
+    assert granted == 10
+    allowed, retry_after = leases[0].acquire()
+    assert not allowed
+    assert retry_after == float("inf")
+
+
+@pytest.mark.asyncio
+async def test_async_lease_renews_through_async_client():
+    server = fakeredis.FakeServer()
+    async_client = fakeredis.FakeAsyncRedis(server=server)
+    now, _ = _time_controller()
+    init(
+        fakeredis.FakeRedis(server=server),
+        budgets={"etherscan": ProviderBudget(per_sec=4)},
+        time_func=now,
+        async_client=async_client,
+        leases={"etherscan": 1.0},
+    )
+    try:
+        results = [(await acquire_async("etherscan", "/gas"))[0] for _ in range(6)]
+        assert results == [True] * 4 + [False] * 2
+        await release_leases_async()
+    finally:
+        await async_client.aclose()
+
+
+def test_unrenewed_lease_returns_leftovers_on_expiry(fake_redis):
+    now, _ = _time_controller()
+    bucket = TokenBucket(fake_redis, capacity=10, refill_rate=0, time_func=now)
+    lease = TokenLease([(bucket, "k")], ttl=0.05, min_size=5)
+
+    assert lease.acquire() == (True, 0.0)
+    assert float(fake_redis.hget("k", "tokens")) == 5.0
+    deadline = time.monotonic() + 2
+    while lease.remaining and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert lease.remaining == 0.0
+    assert float(fake_redis.hget("k", "tokens")) == 9.0
+
+
+@pytest.mark.asyncio
+async def test_async_lease_renews_once_for_concurrent_callers_and_expires():
+    server = fakeredis.FakeServer()
+    async_client = fakeredis.FakeAsyncRedis(server=server)
+    now, _ = _time_controller()
+    bucket = TokenBucket(
+        fakeredis.FakeRedis(server=server), capacity=100, refill_rate=0, time_func=now
+    )
+    lease = TokenLease([(bucket, "k")], ttl=0.05, min_size=10)
+    try:
+        results = await asyncio.gather(*(lease.acquire_async(async_client) for _ in range(10)))
+
+        assert results == [(True, 0.0)] * 10
+        assert lease.renewals == 1
+        assert float(await async_client.hget("k", "tokens")) == 90.0
+
+        await asyncio.sleep(0.2)
+        assert float(await async_client.hget("k", "tokens")) == 90.0  # batch fully spent
+        assert await lease.acquire_async(async_client, 2) == (True, 0.0)
+        await asyncio.sleep(0.2)
+        assert lease.remaining == 0.0
+        assert float(await async_client.hget("k", "tokens")) == 88.0
+    finally:
+        await async_client.aclose()
+
+
 def test_redis_failure_fallback():
     class FailingRedis:
-        def get(self, key):  # pragma: no cover - trivial
+        def evalsha(self, *args, **kwargs):  # pragma: no cover - trivial
             raise RedisError("boom")
 
-        def set(self, *args, **kwargs):  # pragma: no cover - trivial
+        def eval(self, *args, **kwargs):  # pragma: no cover - trivial
             raise RedisError("boom")
 
     now, advance = _time_controller()
@@ -61,3 +382,170 @@ def test_clamp_hysteresis(monkeypatch):
     assert adjust_clamp("cg", success=True) == 0.9
     advance(60)
     assert adjust_clamp("cg", success=True) == 1.0
+
+
+def test_clamp_is_shared_through_redis(fake_redis):
+    now, advance = _time_controller()
+    worker_a = AdaptiveClamp(time_func=now, redis_client=fake_redis)
+    worker_b = AdaptiveClamp(time_func=now, redis_client=fake_redis)
+
+    assert worker_a.adjust("cg", success=False) == 0.9
+    assert worker_b.get("cg") == 1.0  # local view not refreshed yet
+    assert worker_b.adjust("cg", success=True) == 0.9  # cooldown is shared
+    advance(60)
+    assert worker_b.adjust("cg", success=True) == 1.0
+
+
+def test_bucket_calls_refresh_clamp_view(fake_redis):
+    now, _ = _time_controller()
+    init(fake_redis, budgets={"coingecko": ProviderBudget(per_sec=10)}, time_func=now)
+    AdaptiveClamp(time_func=now, redis_client=fake_redis).adjust("coingecko", False)
+
+    assert rate_limiting._clamp.get("coingecko") == 1.0
+    assert acquire("coingecko", "/foo") == (True, 0.0)
+    assert rate_limiting._clamp.get("coingecko") == 0.9
+
+
+def test_retry_after_freezes_provider_in_every_process(fake_redis):
+    now, _ = _time_controller()
+    init(fake_redis, budgets={"coingecko": ProviderBudget(per_sec=10)}, time_func=now)
+    other_process = AdaptiveClamp(time_func=now, redis_client=fake_redis)
+    other_process.observe("coingecko", 429, retry_after=30)
+
+    allowed, retry_after = acquire("coingecko", "/foo")
+    assert not allowed
+    assert 29 < retry_after <= 30
+    assert float(fake_redis.hget("coingecko:per_sec", "tokens") or 10) == 10
+
+    other_process.freeze("coingecko", 5)  # never shortens a longer freeze
+    assert fake_redis.pttl("coingecko:freeze") > 5000
+
+    unfreeze("coingecko")
+    assert acquire("coingecko", "/foo") == (True, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_remote_freeze_drains_leases_without_waiting_for_renewal():
+    server = fakeredis.FakeServer()
+    async_client = fakeredis.FakeAsyncRedis(server=server)
+    now, _ = _time_controller()
+    init(
+        fakeredis.FakeRedis(server=server),
+        budgets={"etherscan": ProviderBudget(per_min=100)},
+        time_func=now,
+        async_client=async_client,
+        leases={"etherscan": 60.0},  # renewal alone would miss the freeze for a minute
+    )
+    lease = rate_limiting._leases["etherscan"]
+    start_freeze_listener(poll_interval=0.01)
+    try:
+        assert (await acquire_async("etherscan", "/gas"))[0]
+        assert (await acquire_async("etherscan", "/gas"))[0]
+        assert lease.remaining == 49.0
+
+        other_process = AdaptiveClamp(
+            time_func=now, redis_client=fakeredis.FakeRedis(server=server)
+        )
+        other_process.observe("etherscan", 429, retry_after=30)
+        deadline = time.monotonic() + 2
+        while lease.remaining and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)  # let the release reach Redis
+
+        assert lease.remaining == 0.0
+        assert float(await async_client.hget("etherscan:per_min", "tokens")) == 98.0
+        allowed, retry_after = await acquire_async("etherscan", "/gas")
+        assert not allowed and retry_after == 30
+    finally:
+        stop_freeze_listener()
+        await async_client.aclose()
+
+
+def test_remote_freeze_drains_sync_leases_from_the_listener_thread():
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeRedis(server=server)
+    now, _ = _time_controller()
+    init(
+        redis,
+        budgets={"etherscan": ProviderBudget(per_min=100)},
+        time_func=now,
+        leases={"etherscan": 60.0},
+    )
+    lease = rate_limiting._leases["etherscan"]
+    start_freeze_listener(poll_interval=0.01)
+    try:
+        assert acquire("etherscan", "/gas")[0] and acquire("etherscan", "/gas")[0]
+        AdaptiveClamp(time_func=now, redis_client=redis).freeze("etherscan", 5)
+        deadline = time.monotonic() + 2
+        while lease.remaining and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop_freeze_listener()
+
+    assert lease.remaining == 0.0
+    assert float(redis.hget("etherscan:per_min", "tokens")) == 98.0
+    assert acquire("etherscan", "/gas") == (False, 5.0)
+
+
+def test_forbidden_response_freezes_provider(fake_redis):
+    now, advance = _time_controller()
+    init(fake_redis, budgets={"etherscan": ProviderBudget(per_sec=10)}, time_func=now)
+    observe_response("etherscan", 403)
+
+    assert acquire("etherscan", "/gas") == (False, FORBIDDEN_FREEZE)
+    assert fake_redis.pttl("etherscan:freeze") > (FORBIDDEN_FREEZE - 1) * 1000
+    advance(FORBIDDEN_FREEZE)
+    fake_redis.delete("etherscan:freeze")
+    assert acquire("etherscan", "/gas")[0]
+
+
+def test_freeze_without_redis_is_process_local():
+    class FailingRedis:
+        def evalsha(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+        def eval(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+        def delete(self, *args, **kwargs):  # pragma: no cover - trivial
+            raise RedisError("boom")
+
+    now, advance = _time_controller()
+    init(FailingRedis(), budgets={"fx": ProviderBudget(per_min=10)}, time_func=now)
+    observe_response("fx", 429, {"Retry-After": "2"})
+    assert acquire("fx", "/fx") == (False, 2.0)
+    advance(2)
+    assert acquire("fx", "/fx")[0]
+    observe_response("fx", 403)
+    unfreeze("fx")
+    assert acquire("fx", "/fx")[0]
+
+
+def test_parse_retry_after():
+    assert rate_limiting.parse_retry_after(None) is None
+    assert rate_limiting.parse_retry_after("120") == 120.0
+    assert rate_limiting.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert rate_limiting.parse_retry_after("soon") is None
+
+
+@pytest.mark.asyncio
+async def test_async_observe_shares_freeze():
+    server = fakeredis.FakeServer()
+    async_client = fakeredis.FakeAsyncRedis(server=server)
+    now, _ = _time_controller()
+    init(
+        fakeredis.FakeRedis(server=server),
+        budgets={"mempool_space": ProviderBudget(per_sec=5)},
+        time_func=now,
+        async_client=async_client,
+    )
+    try:
+        await observe_response_async("mempool_space", 200)
+        await observe_response_async("mempool_space", 429, {"Retry-After": "10"})
+        other_process = fakeredis.FakeRedis(server=server)
+        assert 9000 < other_process.pttl("mempool_space:freeze") <= 10000
+        allowed, retry_after = await acquire_async("mempool_space", "/mempool")
+        assert not allowed
+        assert retry_after == 10.0
+    finally:
+        await async_client.aclose()
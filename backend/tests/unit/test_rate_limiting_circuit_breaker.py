@@ -1,8 +1,11 @@
+import asyncio
+
 import pytest
 from app.rate_limiting.circuit_breaker import (
     CircuitBreaker,
     CircuitBreakerOpen,
     CircuitState,
+    FailureRateBreaker,
 )
 
 pytestmark = pytest.mark.unit
@@ -79,3 +82,134 @@ async def test_manual_open_close():
     result = await breaker.call(success)
     assert result == 1
     assert breaker.state is CircuitState.CLOSED
+
+
+def _clock(start: float = 0.0):
+    current = {"value": start}
+
+    def now() -> float:
+        return current["value"]
+
+    def advance(seconds: float) -> None:
+        current["value"] += seconds
+
+    return now, advance
+
+
+async def _fail():
+    raise RuntimeError("boom")
+
+
+async def _ok():
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_failure_rate_breaker_needs_minimum_volume_and_rate():
+    now, advance = _clock()
+    breaker = FailureRateBreaker(
+        0.5, probe_interval=10, minimum_calls=4, window_seconds=60, time_func=now
+    )
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+    assert breaker.state is CircuitState.CLOSED  # below minimum volume
+
+    advance(61)  # old failures age out of the window
+    for func in (_ok, _ok, _ok):
+        await breaker.call(func)
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    assert breaker.failure_rate == 0.25
+    assert breaker.state is CircuitState.CLOSED
+
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    assert breaker.failure_rate == 0.4
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    assert breaker.state is CircuitState.OPEN
+    with pytest.raises(CircuitBreakerOpen):
+        await breaker.call(_ok)
+
+
+@pytest.mark.asyncio
+async def test_failure_rate_window_is_bounded_by_count():
+    now, _ = _clock()
+    breaker = FailureRateBreaker(
+        0.5, minimum_calls=2, window_size=4, time_func=now
+    )
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    for _ in range(4):
+        await breaker.call(_ok)
+    assert breaker.failure_rate == 0.0
+
+
+@pytest.mark.asyncio
+async def test_half_open_admits_single_probe():
+    now, advance = _clock()
+    breaker = FailureRateBreaker(
+        1.0, probe_interval=5, minimum_calls=1, time_func=now
+    )
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    advance(5)
+
+    release = asyncio.Event()
+
+    async def slow_probe():
+        await release.wait()
+        return "probe"
+
+    probe = asyncio.create_task(breaker.call(slow_probe))
+    await asyncio.sleep(0)
+    assert breaker.state is CircuitState.HALF_OPEN
+    herd = await asyncio.gather(
+        *(breaker.call(_ok) for _ in range(50)), return_exceptions=True
+    )
+    assert all(isinstance(result, CircuitBreakerOpen) for result in herd)
+
+    release.set()
+    assert await probe == "probe"
+    assert breaker.state is CircuitState.CLOSED
+    assert await breaker.call(_ok) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_frees_slot():
+    now, advance = _clock()
+    breaker = CircuitBreaker(1, probe_interval=5, time_func=now)
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    advance(5)
+
+    probe = asyncio.create_task(breaker.call(asyncio.Event().wait))
+    await asyncio.sleep(0)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert await breaker.call(_ok) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_state_durations_and_recovery_time():
+    now, advance = _clock()
+    breaker = CircuitBreaker(1, probe_interval=30, time_func=now)
+    advance(10)
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    advance(30)
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)  # failed probe reopens
+    advance(30)
+    await breaker.call(_ok)
+    advance(5)
+
+    durations = breaker.state_durations()
+    assert durations[CircuitState.CLOSED] == 15
+    assert durations[CircuitState.OPEN] == 60
+    assert durations[CircuitState.HALF_OPEN] == 0
+    assert breaker.open_count == 2
+    assert breaker.last_recovery == 60
@@ -0,0 +1,284 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import fakeredis
+import httpx
+import pytest
+from app import main
+from app.main import GasPrices, _onchain_refreshers, app, rate_limiter
+from app.provider_cache import provider_cache
+from app.providers import EtherscanClient
+from app.rate_limiting import CircuitBreaker, RedisBreakerStore
+from app.rate_limiting.provider_budgets import DEFAULT_BUDGETS, ProviderBudget
+from app.refreshers import DiskGuard, SnapshotRefresher, budget_interval
+from fastapi.testclient import TestClient
+
+pytestmark = pytest.mark.unit
+
+
+class Upstream:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self) -> GasPrices:
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("boom")
+        return GasPrices(safe=self.calls, propose=2, fast=3, asof=0, source="test")
+
+
+def _refresher(upstream, *, allowed=True, retry_after=0.0, **kwargs) -> SnapshotRefresher:
+    async def acquire(provider: str, route: str):
+        return allowed, retry_after
+
+    return SnapshotRefresher(
+        "etherscan", "gas", upstream, interval=2.0, max_backoff=10.0, acquire=acquire, **kwargs
+    )
+
+
+def test_budget_interval_uses_tightest_window():
+    assert budget_interval(DEFAULT_BUDGETS["mempool_space"]) == 2.0
+    assert budget_interval(ProviderBudget(per_sec=5, per_min=30), share=1.0) == 2.0
+    assert budget_interval(ProviderBudget()) == 2.0
+
+
+@pytest.mark.asyncio
+async def test_successful_poll_stores_snapshot():
+    upstream = Upstream()
+    refresher = _refresher(upstream)
+
+    assert await refresher.refresh_once() == 2.0
+    assert refresher.value.safe == 1
+    assert refresher.updated_at is not None
+    assert refresher.polls == {"ok": 1}
+
+
+@pytest.mark.asyncio
+async def test_failures_back_off_until_breaker_opens_then_recover():
+    upstream = Upstream()
+    now = {"value": 0.0}
+    breaker = CircuitBreaker(2, probe_interval=30, time_func=lambda: now["value"])
+    refresher = _refresher(upstream, breaker=breaker)
+    await refresher.refresh_once()
+    upstream.fail = True
+
+    delays = [await refresher.refresh_once() for _ in range(4)]
+
+    assert delays == [4.0, 8.0, 10.0, 10.0]
+    assert upstream.calls == 3  # the open breaker stops further calls
+    assert refresher.polls["failed"] == 2
+    assert refresher.polls["breaker_open"] == 2
+    assert refresher.value.safe == 1  # last good snapshot is kept
+
+    upstream.fail = False
+    now["value"] = 30.0
+    assert await refresher.refresh_once() == 2.0
+    assert refresher.value.safe == 4
+
+
+@pytest.mark.asyncio
+async def test_disk_guard_backs_off_without_polling():
+    upstream = Upstream()
+    guard = DiskGuard("/data", min_free=100, disk_usage=lambda path: (1000, 950, 50))
+    refresher = _refresher(upstream, disk_guard=guard)
+
+    assert await refresher.refresh_once() == 4.0
+    assert upstream.calls == 0
+    assert refresher.polls == {"disk_guard": 1}
+
+    guard.min_free = 10
+    assert await refresher.refresh_once() == 2.0
+
+
+def test_disk_guard_ignores_missing_directory():
+    def missing(path: str):
+        raise FileNotFoundError(path)
+
+    assert DiskGuard("/nope", disk_usage=missing).engaged() is False
+
+
+@pytest.mark.asyncio
+async def test_empty_bucket_delays_next_poll():
+    upstream = Upstream()
+    refresher = _refresher(upstream, allowed=False, retry_after=5.0)
+
+    assert await refresher.refresh_once() == 5.0
+    assert upstream.calls == 0
+    assert refresher.polls == {"throttled": 1}
+
+
+async def _allow(provider: str, route: str):
+    return True, 0.0
+
+
+@pytest.mark.asyncio
+async def test_start_and_stop_polling_task():
+    upstream = Upstream()
+    refresher = SnapshotRefresher(
+        "etherscan", "gas", upstream, interval=0.001, acquire=_allow
+    )
+
+    refresher.start()
+    while upstream.calls < 3:
+        await asyncio.sleep(0.001)
+    await refresher.stop()
+    calls = upstream.calls
+    await asyncio.sleep(0.01)
+
+    assert upstream.calls == calls
+    assert 'refresher_polls_total{provider="etherscan",outcome="ok"}' in refresher.render_metrics()
+
+
+def test_gas_endpoint_serves_snapshot_without_io():
+    upstream = Upstream()
+    refresher = _refresher(upstream)
+    app.state.refreshers = {"gas": refresher}
+    app.dependency_overrides[rate_limiter] = lambda: None
+    client = TestClient(app)
+    try:
+        assert client.get("/onchain/eth/gas").status_code == 503
+        asyncio.run(refresher.refresh_once())
+        bodies = [client.get("/onchain/eth/gas").json() for _ in range(3)]
+    finally:
+        app.dependency_overrides.clear()
+        app.state.refreshers = {}
+
+    assert upstream.calls == 1
+    assert {body["safe"] for body in bodies} == {1.0}
+
+
+def test_refreshers_only_for_configured_providers(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ETHERSCAN_API_KEY", "x")
+    monkeypatch.delenv("MEMPOOL_SPACE_API_KEY", raising=False)
+
+    refreshers = _onchain_refreshers(RedisBreakerStore(fakeredis.FakeRedis()))
+
+    assert list(refreshers) == ["gas"]
+    assert refreshers["gas"].interval == 7.5  # half the gas cache TTL beats the budget cadence
+    assert refreshers["gas"].breaker.name == "etherscan"
+
+
+@pytest.mark.asyncio
+async def test_poll_writes_through_to_the_provider_cache(monkeypatch: pytest.MonkeyPatch):
+    served = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        served.append(len(served) + 1)
+        return httpx.Response(200, json={"safe": len(served), "propose": 2, "fast": 3, "asof": 1})
+
+    acquired = []
+
+    async def acquire(provider: str, route: str):
+        acquired.append(route)
+        return True, 0.0
+
+    monkeypatch.setattr(provider_cache, "acquire", acquire)
+    provider_cache.attach(fakeredis.FakeAsyncRedis())
+    client = EtherscanClient(base_url="https://poll.local", transport=httpx.MockTransport(handler))
+    refresher = SnapshotRefresher(
+        "etherscan", "gas", client.refresh_gas_prices, interval=7.5, acquire=acquire
+    )
+    try:
+        for _ in range(2):
+            await refresher.refresh_once()
+            cached = await client.get_gas_prices()
+            assert refresher.value.safe == cached.safe == len(served)
+    finally:
+        await provider_cache.aclose()
+
+    assert served == [1, 2]  # readers never reached upstream
+    assert acquired == ["gas", "gas"]  # one token per poll
+
+
+class Feed:
+    """Upstream whose next value is set by the test."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.safe = 1.0
+
+    async def __call__(self) -> GasPrices:
+        self.calls += 1
+        return GasPrices(safe=self.safe, propose=2, fast=3, asof=self.calls, source="test")
+
+
+@pytest.mark.asyncio
+async def test_one_poll_fans_out_to_every_subscriber():
+    feed = Feed()
+    refresher = _refresher(feed)
+    await refresher.refresh_once()
+    first_id = refresher.event_id
+    streams = [refresher.events(heartbeat=5) for _ in range(3)]
+
+    first = [await anext(stream) for stream in streams]
+    pending = [asyncio.ensure_future(anext(stream)) for stream in streams]
+    await asyncio.sleep(0)
+    assert refresher.subscribers == 3
+
+    await refresher.refresh_once()  # same value, new asof: no event
+    await asyncio.sleep(0)
+    assert not any(task.done() for task in pending)
+
+    feed.safe = 9.0
+    await refresher.refresh_once()
+    second = await asyncio.gather(*pending)
+
+    assert feed.calls == 3
+    assert {event_id for event_id, _ in first} == {first_id}
+    assert {event_id for event_id, _ in second} == {refresher.event_id} != {first_id}
+    assert [snapshot.safe for _, snapshot in second] == [9.0] * 3
+    for stream in streams:
+        await stream.aclose()
+    assert refresher.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_known_snapshot_and_sends_heartbeats():
+    refresher = _refresher(Feed())
+    await refresher.refresh_once()
+
+    stream = refresher.events(last_event_id=refresher.event_id, heartbeat=0.001)
+    assert await anext(stream) is None
+    await stream.aclose()
+
+    stale = refresher.events(last_event_id="0.0", heartbeat=0.001)
+    event_id, snapshot = await anext(stale)
+    await stale.aclose()
+    assert event_id == refresher.event_id
+    assert snapshot.safe == 1.0
+
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_formats_sse_frames(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(main, "SSE_HEARTBEAT", 0.001)
+    refresher = _refresher(Feed())
+    await refresher.refresh_once()
+    state = SimpleNamespace(refreshers={"gas": refresher})
+    request = SimpleNamespace(app=SimpleNamespace(state=state))
+
+    response = main._stream(request, "gas", None)
+    frames = response.body_iterator
+    event = await anext(frames)
+    heartbeat = await anext(frames)
+    await frames.aclose()
+
+    assert response.media_type == "text/event-stream"
+    assert response.headers["cache-control"] == "no-cache"
+    lines = event.splitlines()
+    assert lines[0] == f"id: {refresher.event_id}"
+    assert lines[1] == "event: gas"
+    assert json.loads(lines[2].removeprefix("data: "))["safe"] == 1.0
+    assert heartbeat == ": heartbeat\n\n"
+
+
+def test_stream_without_refresher_is_unavailable():
+    app.dependency_overrides[rate_limiter] = lambda: None
+    try:
+        response = TestClient(app).get("/onchain/btc/mempool/stream")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 503
+    assert response.json()["detail"]["code"] == "provider_outage"
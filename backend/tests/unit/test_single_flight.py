@@ -0,0 +1,162 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.providers import CoinGeckoClient, EtherscanClient
+from app.providers.fx import FXClient
+from app.single_flight import SingleFlight, single_flight
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_result():
+    group = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"value": 1}
+
+    waiters = [asyncio.ensure_future(group.do(("cg", "btc"), fetch)) for _ in range(20)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert group.calls["cg"] == 1
+    assert group.coalesced["cg"] == 19
+    assert len(group) == 0
+    assert await group.do(("cg", "btc"), fetch) == {"value": 1}
+    assert calls == 2  # finished calls are not cached
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_by_every_waiter():
+    group = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        *(group.do(("fx", "USD", "EUR"), fail) for _ in range(5)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert group.calls["fx"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    group = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "ok"
+
+    first = asyncio.ensure_future(group.do(("mempool_space",), fetch))
+    second = asyncio.ensure_future(group.do(("mempool_space",), fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second == "ok"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.asyncio
+async def test_batches_share_overlapping_items():
+    group = SingleFlight()
+    batches = []
+    release = asyncio.Event()
+
+    async def fetch(keys):
+        batches.append(sorted(key[1] for key in keys))
+        await release.wait()
+        return {key: key[1].upper() for key in keys if key[1] != "x"}
+
+    first = asyncio.ensure_future(group.do_many([("cg", "a"), ("cg", "b")], fetch))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(group.do_many([("cg", "b"), ("cg", "c"), ("cg", "x")], fetch))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first == {("cg", "a"): "A", ("cg", "b"): "B"}
+    assert await second == {("cg", "b"): "B", ("cg", "c"): "C"}  # "x" was not returned
+    assert batches == [["a", "b"], ["c", "x"]]
+    assert group.calls["cg"] == 2
+    assert group.coalesced["cg"] == 1
+    assert len(group) == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_reaches_every_item_waiter():
+    group = SingleFlight()
+
+    async def fail(keys):
+        await asyncio.sleep(0)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        group.do_many([("cg", "a"), ("cg", "b")], fail),
+        group.do_many([("cg", "b")], fail),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert group.calls["cg"] == 1
+    assert len(group) == 0
+
+
+@pytest.mark.asyncio
+async def test_distinct_keys_are_not_coalesced():
+    group = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0)
+        return object()
+
+    a, b = await asyncio.gather(group.do(("cg", "btc"), fetch), group.do(("cg", "eth"), fetch))
+    assert a is not b
+    assert 'provider_singleflight_calls_total{provider="cg"} 2' in group.render_metrics()
+
+
+@pytest.mark.asyncio
+async def test_provider_clients_coalesce_upstream_calls(load_provider_fixture):
+    fixture = load_provider_fixture("coingecko_candles.json")
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        if request.url.path.endswith("/gas"):
+            return httpx.Response(200, json={"safe": 10, "propose": 20, "fast": 30, "asof": 1.0})
+        if request.url.path.endswith("/latest"):
+            return httpx.Response(200, json={"rates": {"EUR": 0.9}})
+        return httpx.Response(200, json=fixture)
+
+    transport = httpx.MockTransport(handler)
+    coingecko = CoinGeckoClient(base_url="https://sf.local", transport=transport)
+    etherscan = EtherscanClient(base_url="https://sf.local", transport=transport)
+    fx = FXClient(base_url="https://sf.local", transport=transport)
+    coalesced = sum(single_flight.coalesced.values())
+
+    results = await asyncio.gather(
+        *(coingecko.get_candles("btc") for _ in range(10)),
+        *(etherscan.get_gas_prices() for _ in range(10)),
+        *(fx.get_rate("USD", "EUR") for _ in range(10)),
+    )
+
+    assert sorted(calls) == ["/candles/btc", "/gas", "/latest"]
+    assert results[0] == results[9]
+    assert results[10] is results[19]
+    assert results[-1] == pytest.approx(0.9)
+    # FX callers are merged into one batch before reaching the single-flight.
+    assert sum(single_flight.coalesced.values()) - coalesced == 18
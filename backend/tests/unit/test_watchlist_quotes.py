@@ -0,0 +1,120 @@
+import httpx
+import pytest
+from app.main import Quote, app, get_quote_client, get_registry, rate_limiter
+from app.providers import CoinGeckoClient, coingecko
+from app.registry import AssetRegistry
+from fastapi.testclient import TestClient
+
+pytestmark = pytest.mark.unit
+
+REGISTRY = AssetRegistry.from_dict(
+    {
+        "assets": [
+            {"asset_id": "btc", "aliases": ["XBT"], "provider_ids": {"coingecko": "bitcoin"}},
+            {"asset_id": "eth", "provider_ids": {"coingecko": "ethereum"}},
+            {"asset_id": "weth", "provider_ids": {"coingecko": "ethereum"}},
+            {"asset_id": "gone", "provider_ids": {"coingecko": "delisted"}},
+            {"asset_id": "local", "provider_ids": {}},
+        ]
+    }
+)
+
+
+class SimplePrice:
+    """Fake ``/simple/price`` recording the ids of every call."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.calls: list[list[str]] = []
+        self.fail = fail
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if self.fail:
+            return httpx.Response(502)
+        ids = request.url.params["ids"].split(",")
+        self.calls.append(ids)
+        prices = {"bitcoin": 60000.0, "ethereum": 3000.0, "solana": 150.0}
+        return httpx.Response(
+            200,
+            json={
+                provider_id: {
+                    "usd": prices[provider_id],
+                    "usd_24h_change": 1.5,
+                    "usd_24h_vol": 1e9,
+                    "last_updated_at": 1700000000,
+                }
+                for provider_id in ids
+                if provider_id in prices
+            },
+        )
+
+
+def _client(upstream: SimplePrice) -> CoinGeckoClient:
+    return CoinGeckoClient(base_url="https://quotes.local", transport=httpx.MockTransport(upstream))
+
+
+def test_registry_resolves_aliases_case_insensitively(tmp_path):
+    assert REGISTRY.provider_id("xbt", "coingecko") == "bitcoin"
+    assert REGISTRY.provider_id("BTC", "coingecko") == "bitcoin"
+    assert REGISTRY.provider_id("local", "coingecko") is None
+    assert REGISTRY.resolve("doge") is None
+    assert AssetRegistry.load(tmp_path / "missing.json").resolve("btc") is None
+
+
+@pytest.mark.asyncio
+async def test_client_batches_ids_into_simple_price_calls(monkeypatch: pytest.MonkeyPatch):
+    upstream = SimplePrice()
+    monkeypatch.setattr(coingecko, "QUOTE_BATCH_SIZE", 2)
+
+    quotes = await _client(upstream).get_quotes(["bitcoin", "ethereum", "solana", "nope"])
+
+    assert sorted(map(len, upstream.calls)) == [2, 2]
+    assert sorted(quotes) == ["bitcoin", "ethereum", "solana"]
+    assert quotes["bitcoin"] == Quote(
+        price=60000.0, change_24h=1.5, volume_24h=1e9, asof=1700000000
+    )
+
+
+def _get(upstream: SimplePrice, **params) -> httpx.Response:
+    app.dependency_overrides[get_registry] = lambda: REGISTRY
+    app.dependency_overrides[get_quote_client] = lambda: _client(upstream)
+    app.dependency_overrides[rate_limiter] = lambda: None
+    try:
+        return TestClient(app).get("/assets/quotes", params=params)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_endpoint_quotes_many_assets_with_one_upstream_call():
+    upstream = SimplePrice()
+
+    response = _get(upstream, ids="btc,eth,weth,XBT,gone,local,doge,btc")
+
+    body = response.json()
+    assert response.status_code == 200
+    assert upstream.calls == [["bitcoin", "delisted", "ethereum"]]
+    assert list(body["quotes"]) == ["btc", "eth", "weth", "XBT"]
+    assert body["quotes"]["weth"]["price"] == 3000.0
+    assert body["unknown"] == ["local", "doge"]
+    assert body["unavailable"] == ["gone"]
+    assert body["source"] == "coingecko"
+    assert body["vs_currency"] == "usd"
+
+
+@pytest.mark.parametrize(
+    "ids",
+    [",", "btc,../etc", ",".join(f"a{i}" for i in range(101))],
+)
+def test_endpoint_rejects_invalid_id_lists(ids):
+    upstream = SimplePrice()
+
+    response = _get(upstream, ids=ids)
+
+    assert response.status_code == 400
+    assert upstream.calls == []
+
+
+def test_endpoint_reports_provider_outage():
+    response = _get(SimplePrice(fail=True), ids="btc")
+
+    assert response.status_code == 503
+    assert response.json()["detail"]["code"] == "provider_outage"